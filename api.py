@@ -0,0 +1,157 @@
+"""
+ダッシュボードのKPIを返す読み取り専用のHTTP API（ローカル用）
+シートのリビジョンから作ったETagを返し、変更がなければ304で応答する
+（リビジョンは短時間キャッシュするため、ポーリングではSheets APIを呼ばず再計算もしない）
+
+使い方:
+    python api.py --port 8502
+    curl http://127.0.0.1:8502/api/kpi
+    curl http://127.0.0.1:8502/api/collection?tenant=soccer
+
+エンドポイント:
+    /api/kpi         財布・銀行口座・総資産の残高、全期間の収入・支出
+    /api/collection  未回収総額・未払者数・回収完了率・イベントごとの未回収額
+    /api/summary     上の2つをまとめたもの
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from utils.runtime import load_secrets_file, use_secrets
+from utils.sheets import REVISION_TTL, get_cached_revisions
+from utils.tenants import load_tenants, tenant_cached, tenant_scope
+
+DEFAULT_SECRETS = os.path.join('.streamlit', 'secrets.toml')
+
+logger = logging.getLogger('club_accounting.api')
+
+
+def _kpi() -> dict:
+    from utils.sheets import load_database_with_revision
+    from utils.summary import kpi_summary
+    return kpi_summary(load_database_with_revision()[0])
+
+
+def _collection() -> dict:
+    from utils.sheets import load_collection
+    from utils.summary import collection_summary
+    return collection_summary(load_collection())
+
+
+# {項目: (依存するシート, 作成関数)}（項目ごとにシートのリビジョン単位でキャッシュ）
+PARTS = {
+    'kpi': ('database', _kpi),
+    'collection': ('collection_status', _collection),
+}
+
+# {パス: 返す項目}
+ENDPOINTS = {
+    '/api/kpi': ('kpi',),
+    '/api/collection': ('collection',),
+    '/api/summary': ('kpi', 'collection'),
+}
+
+
+def make_etag(tenant: str, parts: tuple, revisions: dict) -> str:
+    """テナントと項目ごとのシートのリビジョンから作るETag"""
+    versions = '-'.join(f'{part}{revisions.get(PARTS[part][0], 0)}' for part in parts)
+    return f'"{tenant}-{versions}"'
+
+
+def build_part(part: str, revisions: dict):
+    """項目の内容（シートのリビジョンが変わるまで再計算しない）"""
+    sheet, build = PARTS[part]
+    return tenant_cached(('api', part, revisions.get(sheet, 0)), build)
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = 'ClubAccountingAPI/1.0'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/health':
+            return self._send_json(200, {'status': 'ok'})
+        if url.path not in ENDPOINTS:
+            return self._send_json(404, {'error': 'not found'})
+
+        tenants = self.server.tenants
+        tenant = parse_qs(url.query).get('tenant', [next(iter(tenants))])[0]
+        if tenant not in tenants:
+            return self._send_json(404, {'error': f'unknown tenant: {tenant}'})
+
+        parts = ENDPOINTS[url.path]
+        try:
+            with tenant_scope(tenant):
+                # リビジョンは REVISION_TTL 秒だけ使い回す（この間のリクエストはSheets APIを呼ばない）
+                revisions = get_cached_revisions(REVISION_TTL)
+                etag = make_etag(tenant, parts, revisions)
+                if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+                    return self._send_not_modified(etag)
+                payload = {'tenant': tenant}
+                payload.update((part, build_part(part, revisions)) for part in parts)
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        except Exception as e:
+            logger.exception("API error")
+            return self._send_json(500, {'error': str(e)})
+        self._send(200, body, etag)
+
+    def _send(self, status: int, body: bytes, etag: str = None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        # 毎回ETagで確認させる（変更がなければ304）
+        self.send_header('Cache-Control', 'no-cache')
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: dict):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+
+    def _send_not_modified(self, etag: str):
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+def build_server(host: str, port: int, tenants: dict) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.tenants = tenants
+    return server
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="部活動 会計管理の読み取り専用API")
+    parser.add_argument('--secrets', default=DEFAULT_SECRETS, help="secrets.toml のパス")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--verbose', action='store_true', help="リクエストのログを表示")
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s %(levelname)s %(message)s'
+    )
+
+    use_secrets(load_secrets_file(args.secrets))
+    server = build_server(args.host, args.port, load_tenants())
+    print(f"🌐 http://{args.host}:{args.port}/api/kpi で待ち受けています", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
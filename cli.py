@@ -0,0 +1,303 @@
+"""
+会計データのコマンドライン操作（Streamlitを起動せずに実行）
+インポート・エクスポート・年度末の繰越・整合性チェック（改ざん検知を含む）・ジャーナルの圧縮・通帳との照合・バックアップと復元
+
+使い方:
+    python cli.py import 通帳.csv --method 銀行口座
+    python cli.py export 会計データ.xlsx
+    python cli.py export 収支報告書.xlsx --fiscal-year 2024
+    python cli.py close 2024
+    python cli.py check
+    python cli.py check --anchor 控え.txt
+    python cli.py seal
+    python cli.py compact
+    python cli.py reconcile 通帳.csv --output 照合結果.xlsx
+    python cli.py backup
+    python cli.py backups database
+    python cli.py restore database --at "2024-05-01 12:00"
+
+secretsは --secrets（既定: .streamlit/secrets.toml）から読み込む。
+複数クラブで運用している場合は --tenant でクラブを指定する。
+"""
+import argparse
+import logging
+import os
+import sys
+
+import pandas as pd
+
+from utils.reconcile import DEFAULT_TOLERANCE_DAYS
+from utils.runtime import load_secrets_file, use_secrets
+from utils.tenants import load_tenants, set_fallback_tenant
+
+PAYMENT_METHODS = ["現金 (財布)", "銀行口座"]
+
+DEFAULT_SECRETS = os.path.join('.streamlit', 'secrets.toml')
+
+
+def load_ledger():
+    """取引履歴（型付き）とリビジョン"""
+    from utils.ledger import typed_frame
+    from utils.sheets import load_database_with_revision
+
+    df, revision = load_database_with_revision()
+    return typed_frame(df), revision
+
+
+def cmd_import(args) -> int:
+    from utils.sheets import import_database_file
+
+    with open(args.file, 'rb') as f:
+        result = import_database_file(
+            f, os.path.basename(args.file),
+            rules={'default_method': args.method},
+            progress=lambda n: print(f"⏳ {n:,}行を処理中...", file=sys.stderr),
+            user=args.user
+        )
+    print(f"📥 {result.imported:,}件を取り込みました"
+          f"（読込 {result.read:,}件 / 重複 {result.duplicates:,}件 / 無効 {result.invalid:,}件）")
+    return 0
+
+
+def cmd_export(args) -> int:
+    from utils.export import annual_report_xlsx, ledger_export_xlsx, to_csv_bytes, select_columns, LEDGER_COLUMNS
+    from utils.sheets import load_transport_balance
+
+    ledger, _ = load_ledger()
+    if args.fiscal_year is not None:
+        data = annual_report_xlsx(ledger, args.fiscal_year, PAYMENT_METHODS)
+    elif args.output.lower().endswith('.csv'):
+        data = to_csv_bytes(select_columns(ledger, LEDGER_COLUMNS))
+    else:
+        data = ledger_export_xlsx(ledger, load_transport_balance())
+    with open(args.output, 'wb') as f:
+        f.write(data)
+    print(f"📤 {args.output} に書き出しました（{len(ledger):,}件）")
+    return 0
+
+
+def cmd_close(args) -> int:
+    from utils.export import closing_entries, is_closed
+    from utils.journal import next_label
+    from utils.sheets import save_database_changes
+
+    ledger, revision = load_ledger()
+    if is_closed(ledger, args.fiscal_year) and not args.force:
+        print(f"⚠️ {args.fiscal_year}年度は繰越が計上済みです（--force で再計上）", file=sys.stderr)
+        return 1
+
+    entries = closing_entries(ledger, args.fiscal_year, PAYMENT_METHODS)
+    print(entries.to_string(index=False) if len(entries) > 0 else "繰越する残高はありません")
+    if args.dry_run or len(entries) == 0:
+        return 0
+
+    start = next_label(ledger)
+    added = entries.set_axis(pd.RangeIndex(start, start + len(entries)))
+    new_df = pd.concat([ledger, added])
+    result = save_database_changes(new_df, ledger.iloc[0:0], added, revision, args.user)
+    if not result.ok:
+        print("⚠️ 保存に失敗しました", file=sys.stderr)
+        return 1
+    print(f"✅ {args.fiscal_year}年度の繰越を計上しました")
+    return 0
+
+
+def cmd_check(args) -> int:
+    from utils.checks import check_integrity, check_ledger, check_seal_log, check_transport_balance
+    from utils.integrity import SHEET_SEALS, has_key, load_seals, read_anchor, verify_sheet, write_anchor
+    from utils.sheets import SHEET_DATABASE, SHEET_TRANSPORT_BALANCE, load_transport_balance
+
+    ledger, _ = load_ledger()
+    transport = load_transport_balance()
+    log = load_seals()
+    results = [
+        verify_sheet(SHEET_DATABASE, ledger, log.seals[SHEET_DATABASE]),
+        verify_sheet(SHEET_TRANSPORT_BALANCE, transport, log.seals[SHEET_TRANSPORT_BALANCE]),
+    ]
+    for result in results:
+        print(f"🔏 {result.sheet}: {result.rows:,}行 ルート {result.root}")
+    print(f"🔗 {SHEET_SEALS}: {log.rows:,}件 連鎖 {log.head.hex()}")
+    if not has_key():
+        print("⚠️ secrets.toml に integrity_key がないため、記録の偽造は検知できません", file=sys.stderr)
+    anchor = read_anchor(args.anchor) if args.anchor else None
+    issues = pd.concat([
+        check_ledger(ledger, PAYMENT_METHODS),
+        check_transport_balance(transport),
+        check_integrity(results),
+        check_seal_log(log, anchor),
+    ], ignore_index=True)
+    if len(issues) == 0:
+        if args.anchor:
+            write_anchor(args.anchor, log)
+            print(f"📌 連鎖を {args.anchor} に控えました")
+        print(f"✅ 問題は見つかりませんでした（{len(ledger):,}件）")
+        return 0
+    print(issues.to_string(index=False))
+    print(f"⚠️ {len(issues):,}件の問題が見つかりました", file=sys.stderr)
+    return 1
+
+
+def cmd_seal(args) -> int:
+    from utils.integrity import seal_frame
+    from utils.sheets import SHEET_DATABASE, SHEET_TRANSPORT_BALANCE, load_transport_balance
+
+    ledger, _ = load_ledger()
+    for sheet, df in [(SHEET_DATABASE, ledger), (SHEET_TRANSPORT_BALANCE, load_transport_balance())]:
+        print(f"🔏 {sheet}: 記録を{seal_frame(sheet, df).records:,}行のハッシュで書き直しました（{len(df):,}行）")
+    return 0
+
+
+def cmd_compact(args) -> int:
+    from utils.sheets import compact_database_journal
+
+    revision = compact_database_journal()
+    print(f"🗜️ ジャーナルを圧縮しました（リビジョン {revision}）")
+    return 0
+
+
+def cmd_reconcile(args) -> int:
+    from utils.export import to_xlsx_bytes
+    from utils.reconcile import read_statement, reconcile
+
+    ledger, _ = load_ledger()
+    with open(args.statement, 'rb') as f:
+        statement = read_statement(f, os.path.basename(args.statement))
+    result = reconcile(ledger, statement, tolerance_days=args.tolerance)
+    final_diff = result.balance['差額'].iloc[-1] if len(result.balance) > 0 else 0
+
+    print(f"✅ 照合済み {result.matched['照合ID'].nunique():,}件 / "
+          f"通帳のみ {len(result.statement_only):,}件 / 台帳のみ {len(result.ledger_only):,}件")
+    print(f"⚖️ 残高の差額 ¥{final_diff:,.0f}")
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(to_xlsx_bytes({
+                '通帳のみ': result.statement_only,
+                '台帳のみ': result.ledger_only,
+                '残高': result.balance,
+                '照合済み': result.matched,
+            }))
+        print(f"📤 {args.output} に書き出しました")
+    unmatched = len(result.statement_only) + len(result.ledger_only)
+    return 0 if unmatched == 0 and final_diff == 0 else 1
+
+
+def cmd_backup(args) -> int:
+    from utils.backup import backup_all
+
+    created = backup_all(args.dir)
+    for entry in created:
+        print(f"💾 {entry.sheet}: {'完全' if entry.kind == 'full' else '差分'} → {entry.path}")
+    if not created:
+        print("✅ 前回のバックアップから変更はありません")
+    return 0
+
+
+def cmd_backups(args) -> int:
+    from utils.backup import BACKUP_SHEETS, list_backups
+
+    for sheet in [args.sheet] if args.sheet else BACKUP_SHEETS:
+        for entry in list_backups(sheet, args.dir):
+            size = os.path.getsize(entry.path)
+            print(f"{sheet}\t{entry.time:%Y-%m-%d %H:%M:%S}\tr{entry.revision}\t{entry.kind}\t{size:,} bytes")
+    return 0
+
+
+def cmd_restore(args) -> int:
+    from utils.backup import backup_state, restore_sheet
+
+    at = pd.Timestamp(args.at).to_pydatetime() if args.at else None
+    try:
+        if args.dry_run:
+            entry, df = backup_state(args.sheet, at, args.dir)
+            print(df.to_string(index=False, max_rows=20))
+            print(f"🔎 {entry.time:%Y-%m-%d %H:%M:%S} 時点（r{entry.revision}）: {len(df):,}行")
+            return 0
+        ok, entry, df = restore_sheet(args.sheet, at, args.dir)
+    except ValueError as e:
+        print(f"⚠️ {e}", file=sys.stderr)
+        return 1
+    if not ok:
+        print(f"⚠️ シート '{args.sheet}' への書き込みに失敗しました", file=sys.stderr)
+        return 1
+    print(f"♻️ {args.sheet} を {entry.time:%Y-%m-%d %H:%M:%S} 時点（r{entry.revision}）の内容に戻しました（{len(df):,}行）")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="部活動 会計管理のコマンドライン操作")
+    parser.add_argument('--secrets', default=DEFAULT_SECRETS, help="secrets.toml のパス")
+    parser.add_argument('--tenant', help="クラブ（secrets.tomlの [tenants.<キー>]）")
+    parser.add_argument('--verbose', action='store_true', help="詳細なログを表示")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('import', help="CSV / xlsx の取引データを取り込む")
+    p.add_argument('file')
+    p.add_argument('--method', default='銀行口座', choices=PAYMENT_METHODS, help="ファイルにない場合の決済方法")
+    p.add_argument('--user', default='cli', help="変更履歴に記録する担当者名")
+    p.set_defaults(func=cmd_import)
+
+    p = commands.add_parser('export', help="取引履歴・交通費会計・収支報告書を書き出す")
+    p.add_argument('output', help="出力ファイル（.xlsx / .csv）")
+    p.add_argument('--fiscal-year', type=int, help="指定すると収支報告書（xlsx）を書き出す")
+    p.set_defaults(func=cmd_export)
+
+    p = commands.add_parser('close', help="年度末の繰越を計上する")
+    p.add_argument('fiscal_year', type=int)
+    p.add_argument('--dry-run', action='store_true', help="計上せずに内容だけ表示")
+    p.add_argument('--force', action='store_true', help="計上済みでも再計上する")
+    p.add_argument('--user', default='cli', help="変更履歴に記録する担当者名")
+    p.set_defaults(func=cmd_close)
+
+    p = commands.add_parser('check', help="整合性チェック（問題があれば終了コード1）")
+    p.add_argument('--anchor', help="記録の連鎖の控えのファイル（前回の控えと照合し、問題がなければ追記）")
+    p.set_defaults(func=cmd_check)
+
+    p = commands.add_parser('seal', help="取引履歴・交通費会計の現在の内容を正しいものとして行のハッシュを記録する")
+    p.set_defaults(func=cmd_seal)
+
+    p = commands.add_parser('compact', help="ジャーナルをスナップショットへ圧縮する")
+    p.set_defaults(func=cmd_compact)
+
+    p = commands.add_parser('reconcile', help="通帳の明細と銀行口座の取引を照合する（差異があれば終了コード1）")
+    p.add_argument('statement', help="通帳・明細ファイル（.csv / .xlsx）")
+    p.add_argument('--tolerance', type=int, default=DEFAULT_TOLERANCE_DAYS, help="日付のずれの許容日数")
+    p.add_argument('--output', help="照合結果を書き出すxlsx")
+    p.set_defaults(func=cmd_reconcile)
+
+    p = commands.add_parser('backup', help="変更のあったシートをバックアップし、保持期間を過ぎたものを削除する")
+    p.add_argument('--dir', default='backups', help="バックアップの保存先")
+    p.set_defaults(func=cmd_backup)
+
+    p = commands.add_parser('backups', help="バックアップの一覧を表示する")
+    p.add_argument('sheet', nargs='?', help="シート名（省略するとすべて）")
+    p.add_argument('--dir', default='backups', help="バックアップの保存先")
+    p.set_defaults(func=cmd_backups)
+
+    p = commands.add_parser('restore', help="シートをバックアップの内容に戻す")
+    p.add_argument('sheet', help="シート名（database / members / drivers / collection_status / transportation_balance / budget）")
+    p.add_argument('--at', help="この日時以前の最新のバックアップに戻す（省略すると最新）")
+    p.add_argument('--dry-run', action='store_true', help="書き込まずに内容だけ表示")
+    p.add_argument('--dir', default='backups', help="バックアップの保存先")
+    p.set_defaults(func=cmd_restore)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(levelname)s %(message)s'
+    )
+
+    use_secrets(load_secrets_file(args.secrets))
+    tenants = load_tenants()
+    tenant = args.tenant or next(iter(tenants))
+    if tenant not in tenants:
+        print(f"⚠️ クラブ '{tenant}' が見つかりません（{', '.join(tenants)}）", file=sys.stderr)
+        return 2
+    set_fallback_tenant(tenant)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,497 @@
+"""
+同時セッションの負荷試験（Streamlitサーバーを起動せず、AppTestで画面のスクリプトを実行）
+会計.py と pages/交通費計算.py を多数のセッションで同時に操作し、1回の操作（再実行）にかかる時間の
+p50/p95/p99、操作ごとのSheets API呼び出し回数、プロセスのピークメモリを表示する
+
+Google Sheetsの代わりにメモリ上のスプレッドシートを使い、API呼び出しごとに --latency 秒待つ
+（実際のシートには接続しないため、secrets.tomlは不要）
+
+使い方:
+    python loadtest.py --sessions 30
+    python loadtest.py --sessions 100 --admins 10 --transport 5 --actions 20 --latency 0.2
+    python loadtest.py --sessions 30 --output 負荷試験.csv
+
+セッションの種類と操作:
+    閲覧者   ログイン → 表示・すべての取引を表示・検索 をくり返す
+    管理者   ログイン → 表示・検索・取引の登録 をくり返す
+    交通費   管理者としてログイン → 交通費精算ページ → 表示・徴収状況の保存 をくり返す
+"""
+import argparse
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils.runtime import use_secrets
+from utils.sheets import (
+    SHEET_BUDGET, SHEET_COLLECTION, SHEET_DATABASE, SHEET_DRIVERS, SHEET_MEMBERS, SHEET_TRANSPORT_BALANCE
+)
+from utils.tenants import DEFAULT_TENANT, registry
+
+MAIN_SCRIPT = '会計.py'
+TRANSPORT_PAGE = 'pages/交通費計算.py'
+
+ADMIN_PASSWORD = 'loadtest-admin'
+GUEST_PASSWORD = 'loadtest-guest'
+
+# Sheets API 1回あたりの待ち時間（秒）の既定値
+DEFAULT_LATENCY = 0.1
+
+# セッションごとのAPI呼び出しを数えるsession_stateのキー
+CALLS_KEY = '_loadtest_calls'
+
+# 書き込みとして数えるAPI呼び出し（それ以外は読み込み）
+WRITE_METHODS = {'update', 'clear', 'append_row', 'append_rows', 'add_worksheet'}
+
+# セッションの種類ごとの操作と選ぶ重み
+FLOWS = {
+    '閲覧者': {'表示': 5, '全件表示': 2, '検索': 3},
+    '管理者': {'表示': 4, '検索': 2, '取引登録': 4},
+    '交通費': {'表示': 5, '徴収状況の保存': 5},
+}
+
+SEARCH_WORDS = ['大会', '遠征', '合宿', '部費', 'ボール', 'グラウンド']
+
+
+# ======================
+# メモリ上のスプレッドシート
+# ======================
+
+def _session_calls():
+    """API呼び出しを実行しているセッションの呼び出し回数（セッションの外ならNone）"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return None
+    try:
+        return ctx.session_state[CALLS_KEY]
+    except KeyError:
+        return None
+
+
+class FakeBackend:
+    """API呼び出しの回数を数え、1回ごとに latency 秒待つ"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def call(self, method: str):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        counter = _session_calls()
+        with self.lock:
+            self.calls[method] += 1
+            if counter is not None:
+                counter[method] += 1
+
+
+def _cell_position(label: str):
+    """'B3' → (行, 列)（0始まり）"""
+    match = re.match(r'([A-Z]+)(\d+)', label)
+    column = 0
+    for ch in match.group(1):
+        column = column * 26 + ord(ch) - ord('A') + 1
+    return int(match.group(2)) - 1, column - 1
+
+
+class FakeWorksheet:
+    """gspread.Worksheet のうちアプリが使うメソッドだけを持つワークシート"""
+
+    def __init__(self, backend: FakeBackend, title: str, values: list = None):
+        self.backend = backend
+        self.title = title
+        self.values = [list(row) for row in values or []]
+        self.lock = threading.Lock()
+
+    def _rows(self) -> list:
+        with self.lock:
+            return [list(row) for row in self.values]
+
+    def get(self, range_name=None, major_dimension=None, **kwargs) -> list:
+        self.backend.call('get')
+        rows = self._rows()
+        if str(getattr(major_dimension, 'value', major_dimension)) != 'COLUMNS':
+            return rows
+        width = max((len(row) for row in rows), default=0)
+        columns = []
+        for j in range(width):
+            column = [row[j] if j < len(row) else '' for row in rows]
+            # Sheets APIと同じく末尾の空セルは返さない
+            while column and column[-1] == '':
+                column.pop()
+            columns.append(column)
+        return columns
+
+    def get_all_values(self, **kwargs) -> list:
+        self.backend.call('get_all_values')
+        return [[str(v) for v in row] for row in self._rows()]
+
+    def row_values(self, row: int, **kwargs) -> list:
+        self.backend.call('row_values')
+        with self.lock:
+            return [str(v) for v in self.values[row - 1]] if len(self.values) >= row else []
+
+    def update(self, range_name, values=None, **kwargs):
+        self.backend.call('update')
+        if values is None:
+            range_name, values = 'A1', range_name
+        top, left = _cell_position(range_name)
+        with self.lock:
+            for i, row in enumerate(values):
+                while len(self.values) <= top + i:
+                    self.values.append([])
+                target = self.values[top + i]
+                while len(target) < left + len(row):
+                    target.append('')
+                target[left:left + len(row)] = row
+
+    def clear(self):
+        self.backend.call('clear')
+        with self.lock:
+            self.values = []
+
+    def append_row(self, values, **kwargs):
+        self.backend.call('append_row')
+        with self.lock:
+            self.values.append(list(values))
+
+    def append_rows(self, values, **kwargs):
+        self.backend.call('append_rows')
+        with self.lock:
+            self.values.extend(list(row) for row in values)
+
+
+class FakeSpreadsheet:
+    """gspread.Spreadsheet のうちアプリが使うメソッドだけを持つスプレッドシート"""
+
+    def __init__(self, backend: FakeBackend, sheets: dict):
+        self.backend = backend
+        self.title = 'loadtest'
+        self.sheets = {name: FakeWorksheet(backend, name, values) for name, values in sheets.items()}
+        self.lock = threading.Lock()
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        import gspread
+
+        # gspreadはシートの一覧（メタデータ）を毎回取得する
+        self.backend.call('worksheet')
+        with self.lock:
+            if title not in self.sheets:
+                raise gspread.exceptions.WorksheetNotFound(title)
+            return self.sheets[title]
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26, **kwargs) -> FakeWorksheet:
+        self.backend.call('add_worksheet')
+        with self.lock:
+            return self.sheets.setdefault(title, FakeWorksheet(self.backend, title))
+
+
+def build_sheets(rows: int, members: int, seed: int) -> dict:
+    """試験用のシートの内容 {シート名: [ヘッダー, 行...]}"""
+    rng = random.Random(seed)
+    today = date.today()
+    expense = ['大会費', '備品', '雑費', 'グラウンド代（練習）', 'グラウンド代（試合）', '審判登録費']
+    income = ['部費', 'OB会費', '寄付金']
+    methods = ['現金 (財布)', '銀行口座']
+
+    database = [['日付', '種別', '科目', '金額', '備考', '決済方法']]
+    for _ in range(rows):
+        kind = '収入' if rng.random() < 0.3 else '支出'
+        database.append([
+            (today - timedelta(days=rng.randrange(730))).strftime('%Y-%m-%d'),
+            kind,
+            rng.choice(income if kind == '収入' else expense),
+            rng.randrange(1, 300) * 100,
+            f"{rng.choice(SEARCH_WORDS)} {rng.randrange(1000)}",
+            rng.choice(methods),
+        ])
+
+    names = [f"部員{i:03d}" for i in range(members)]
+    locations = ['駅前', '学校', '公民館']
+    events = ['春季大会', '夏合宿', '秋季遠征']
+    return {
+        SHEET_DATABASE: database,
+        SHEET_MEMBERS: [['名前', '属性', '乗車地']] + [
+            [name, 'Manager' if i % 10 == 0 else 'Player', rng.choice(locations)] for i, name in enumerate(names)
+        ],
+        SHEET_DRIVERS: [['名前', '車種', '燃料タイプ', '燃費', '定員', '乗車地']] + [
+            [f"ドライバー{i}", 'ミニバン', 'レギュラー', 12 + i, 7, rng.choice(locations)] for i in range(8)
+        ],
+        SHEET_COLLECTION: [['名前'] + events] + [
+            [name] + [rng.choice([0, 0, 1500, 3000]) for _ in events] for name in names
+        ],
+        SHEET_TRANSPORT_BALANCE: [['日付', '項目', '収入', '支出', '残高'],
+                                  [today.strftime('%Y-%m-%d'), '繰越', 50000, 0, 50000]],
+        SHEET_BUDGET: [['年度', '科目', '予算']] + [
+            [today.year, category, 100000] for category in expense + income
+        ],
+    }
+
+
+# ======================
+# セッションの操作
+# ======================
+
+def share_apptest_runtime():
+    """AppTestを複数のスレッドで同時に実行できるようにする
+
+    AppTestは実行のたびにプロセス全体の状態を作り直すため、そのままでは同時に実行できない
+    - Runtimeの代わりを作って終了時に消す → 消えている間は最後に作られたものを使う
+    - スクリプトを毎回コンパイルする → Streamlitサーバーと同じくコンパイル結果をプロセス全体で共有する
+    - pagesディレクトリの有無をいったん消して調べ直す → 調べ直している間に他のセッションが読むと
+      ウィジェットのIDが変わってボタンの操作が失われるため、AppTestからは別のクラスの値を書き換えさせる
+    """
+    from streamlit.runtime.pages_manager import PagesManager
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test
+
+    shared = {}
+    instance = Runtime.instance.__func__
+
+    def shared_instance(cls):
+        if cls._instance is not None:
+            shared['runtime'] = cls._instance
+        return shared.get('runtime') or instance(cls)
+
+    get_bytecode = ScriptCache.get_bytecode
+    cache = ScriptCache()
+    Runtime.instance = classmethod(shared_instance)
+    ScriptCache.get_bytecode = lambda self, script_path: get_bytecode(cache, script_path)
+    # 会計.py は pages ディレクトリのマルチページ構成
+    PagesManager.uses_pages_directory = True
+    app_test.PagesManager = type('PagesManager', (PagesManager,), {})
+
+
+def _widget(elements, label: str):
+    return next(element for element in elements if element.label == label)
+
+
+# 各操作はウィジェットの値を設定してAppTestを返す（再実行は run_session で時間を測りながら行う）
+
+def _login(at, password: str, user_name: str = ''):
+    at.text_input(key='password_input').set_value(password)
+    at.text_input(key='user_name_input').set_value(user_name)
+    _widget(at.button, 'ログイン').click()
+    return at
+
+
+def _submit_entry(at, rng: random.Random):
+    _widget(at.sidebar.number_input, '💴 金額').set_value(rng.randrange(1, 500) * 100)
+    _widget(at.sidebar.text_input, '📝 備考').set_value(f"負荷試験 {rng.randrange(100000)}")
+    _widget(at.sidebar.button, '✅ 登録する').click()
+    return at
+
+
+def _search(at, rng: random.Random):
+    at.text_input(key='search_keyword').set_value(rng.choice(SEARCH_WORDS))
+    return at
+
+
+def _toggle_all(at, rng: random.Random):
+    toggle = at.toggle(key='guest_show_all')
+    toggle.set_value(not toggle.value)
+    return at
+
+
+def _save_collection(at, rng: random.Random):
+    # AppTestではデータエディタを操作できないため、エディタの元になる表を書き換えて保存ボタンを押す
+    collection = at.session_state['collection_data'].copy()
+    events = [c for c in collection.columns if c != '名前']
+    if len(collection) > 0 and events:
+        collection.loc[rng.randrange(len(collection)), rng.choice(events)] = rng.choice([0, 1500, 3000])
+        at.session_state['collection_data'] = collection
+    at.button(key='save_coll').click()
+    return at
+
+
+ACTIONS = {
+    '表示': lambda at, rng: at,
+    '全件表示': _toggle_all,
+    '検索': _search,
+    '取引登録': _submit_entry,
+    '徴収状況の保存': _save_collection,
+}
+
+
+class ActionResult:
+    """1回の操作の結果"""
+
+    def __init__(self, session: int, kind: str, action: str, seconds: float, calls: Counter, error: str):
+        self.session = session
+        self.kind = kind
+        self.action = action
+        self.seconds = seconds
+        self.calls = calls
+        self.error = error
+
+    def to_dict(self) -> dict:
+        return {
+            'セッション': self.session,
+            '種類': self.kind,
+            '操作': self.action,
+            '時間(ms)': self.seconds * 1000,
+            'API呼び出し': sum(self.calls.values()),
+            '書き込み': sum(n for method, n in self.calls.items() if method in WRITE_METHODS),
+            'エラー': self.error,
+        }
+
+
+def run_session(number: int, kind: str, args) -> list:
+    """1つのセッションを開始から最後の操作まで実行"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(args.seed * 100003 + number)
+    time.sleep(rng.uniform(0, args.ramp))
+    at = AppTest.from_file(MAIN_SCRIPT, default_timeout=args.timeout)
+    results = []
+
+    def perform(action: str, step) -> bool:
+        nonlocal at
+        calls = Counter()
+        error = ''
+        start = time.perf_counter()
+        try:
+            at = step(at)
+            at.session_state[CALLS_KEY] = calls
+            at.run()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - start
+        if not error and len(at.exception) > 0:
+            error = at.exception[0].message
+        results.append(ActionResult(number, kind, action, seconds, Counter(calls), error))
+        return not error
+
+    password = GUEST_PASSWORD if kind == '閲覧者' else ADMIN_PASSWORD
+    steps = [
+        ('ログイン画面', lambda at: at),
+        ('ログイン', lambda at: _login(at, password, '' if kind == '閲覧者' else f"負荷試験{number}")),
+    ]
+    if kind == '交通費':
+        steps.append(('ページ移動', lambda at: at.switch_page(TRANSPORT_PAGE)))
+    for action, step in steps:
+        if not perform(action, step):
+            return results
+
+    weights = FLOWS[kind]
+    for _ in range(args.actions):
+        time.sleep(rng.uniform(0, args.think))
+        action = rng.choices(list(weights), weights=list(weights.values()))[0]
+        perform(action, lambda at: ACTIONS[action](at, rng))
+    return results
+
+
+# ======================
+# 集計
+# ======================
+
+def _peak_memory_mb():
+    """プロセスのピークメモリ(MB)（取得できない環境ではNone）"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linuxはキロバイト、macOSはバイト
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(frame: pd.DataFrame) -> pd.DataFrame:
+    """操作ごとの回数・時間のパーセンタイル・API呼び出し回数（最後の行は全体）"""
+    def row(group: pd.DataFrame) -> dict:
+        times = group['時間(ms)'].to_numpy()
+        p50, p95, p99 = np.percentile(times, [50, 95, 99]) if len(times) else (np.nan,) * 3
+        return {
+            '回数': len(group),
+            'p50(ms)': round(p50, 1),
+            'p95(ms)': round(p95, 1),
+            'p99(ms)': round(p99, 1),
+            '最大(ms)': round(times.max(), 1) if len(times) else np.nan,
+            'API呼び出し/回': round(group['API呼び出し'].mean(), 2),
+            '書き込み/回': round(group['書き込み'].mean(), 2),
+            'エラー': int((group['エラー'] != '').sum()),
+        }
+
+    rows = {action: row(group) for action, group in frame.groupby('操作', sort=False)}
+    rows['全体'] = row(frame)
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="会計アプリの同時セッション負荷試験（AppTest + メモリ上のシート）")
+    parser.add_argument('--sessions', type=int, default=30, help="同時に動かすセッション数")
+    parser.add_argument('--admins', type=int, default=None, help="うち管理者のセッション数（既定: 1割）")
+    parser.add_argument('--transport', type=int, default=None, help="うち交通費精算ページのセッション数（既定: 1割）")
+    parser.add_argument('--actions', type=int, default=10, help="ログイン後に1セッションが行う操作の数")
+    parser.add_argument('--think', type=float, default=1.0, help="操作の間に待つ最大秒数")
+    parser.add_argument('--ramp', type=float, default=5.0, help="セッションの開始をばらつかせる秒数")
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help="API呼び出し1回の待ち時間（秒）")
+    parser.add_argument('--rows', type=int, default=2000, help="取引履歴の行数")
+    parser.add_argument('--members', type=int, default=40, help="部員の人数")
+    parser.add_argument('--timeout', type=float, default=120.0, help="1回の再実行の時間切れ（秒）")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="操作ごとの結果を書き出すCSVファイル")
+    args = parser.parse_args(argv)
+
+    admins = args.admins if args.admins is not None else max(1, args.sessions // 10)
+    transport = args.transport if args.transport is not None else max(1, args.sessions // 10)
+    guests = args.sessions - admins - transport
+    if guests < 0:
+        parser.error("--admins と --transport の合計が --sessions を超えています")
+
+    use_secrets({
+        'admin_password': ADMIN_PASSWORD,
+        'guest_password': GUEST_PASSWORD,
+        'spreadsheet': {'id': 'loadtest'},
+    })
+    share_apptest_runtime()
+    backend = FakeBackend(args.latency)
+    registry.handle(DEFAULT_TENANT).spreadsheet = FakeSpreadsheet(
+        backend, build_sheets(args.rows, args.members, args.seed)
+    )
+
+    kinds = ['管理者'] * admins + ['交通費'] * transport + ['閲覧者'] * guests
+    random.Random(args.seed).shuffle(kinds)
+    print(f"🚀 {args.sessions}セッション（閲覧者 {guests} / 管理者 {admins} / 交通費 {transport}）"
+          f"・各{args.actions}操作・API待ち {args.latency * 1000:g}ms", file=sys.stderr)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        sessions = executor.map(lambda item: run_session(item[0], item[1], args), enumerate(kinds, start=1))
+        results = [result for session in sessions for result in session]
+    elapsed = time.perf_counter() - started
+
+    frame = pd.DataFrame([result.to_dict() for result in results])
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.unicode.east_asian_width', True):
+        print(summarize(frame).to_string())
+    print()
+    print(f"⏱️ {elapsed:.1f}秒 / {len(frame):,}操作（{len(frame) / elapsed:.1f}操作/秒）")
+    print(f"📡 API呼び出し {sum(backend.calls.values()):,}回: "
+          + ', '.join(f"{method} {n:,}" for method, n in backend.calls.most_common()))
+    peak = _peak_memory_mb()
+    if peak is not None:
+        print(f"🧠 ピークメモリ {peak:,.0f} MB")
+
+    errors = frame[frame['エラー'] != '']
+    for message, count in errors['エラー'].value_counts().head(5).items():
+        print(f"⚠️ {count}回: {message}", file=sys.stderr)
+
+    if args.output:
+        frame.to_csv(args.output, index=False, encoding='utf-8-sig')
+        print(f"📄 {args.output} に書き出しました", file=sys.stderr)
+    return 1 if len(errors) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
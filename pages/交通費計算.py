@@ -21,6 +21,8 @@ if st.session_state.get("role") != "admin":
 # 親ディレクトリのパスを追加
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from utils.runtime import get_secrets
+
 # ページ設定
 st.set_page_config(
     page_title="交通費精算 | 部活動 会計管理",
@@ -35,7 +37,8 @@ def check_password():
     """Admin/Guest権限を確認する"""
     
     # secrets.tomlにパスワードが設定されているか確認
-    if "admin_password" not in st.secrets or "guest_password" not in st.secrets:
+    secrets = get_secrets()
+    if "admin_password" not in secrets or "guest_password" not in secrets:
         st.session_state.role = "admin"
         st.session_state.authenticated = True
         return True
@@ -60,11 +63,11 @@ def check_password():
         password = st.text_input("🔑 パスワード", type="password", key="tc_password_input")
         
         if st.button("ログイン", use_container_width=True, type="primary"):
-            if password == st.secrets["admin_password"]:
+            if password == secrets["admin_password"]:
                 st.session_state.authenticated = True
                 st.session_state.role = "admin"
                 st.rerun()
-            elif password == st.secrets["guest_password"]:
+            elif password == secrets["guest_password"]:
                 st.session_state.authenticated = True
                 st.session_state.role = "guest"
                 st.rerun()
@@ -232,8 +235,16 @@ from utils.sheets import (
     load_drivers, save_drivers,
     load_collection, save_collection,
     load_transport_balance, save_transport_balance,
-    add_transport_balance_entry
+    add_transport_balance_entry,
+    load_concurrently,
+    SHEET_MEMBERS, SHEET_DRIVERS, SHEET_COLLECTION, SHEET_TRANSPORT_BALANCE
 )
+from utils.changes import watch_changes
+from utils.carpool import DEFAULT_SEATS, plan_carpool, plan_table
+from utils.profiler import start_profile, finish_profile
+
+# ?profile=1 が付いていれば、この1回の実行のプロファイルを取る（管理者のみ）
+profiler = start_profile(__file__, IS_ADMIN)
 
 FUEL_TYPES = ["レギュラー", "ハイオク", "軽油"]
 MEMBER_TYPES = ["Player", "Manager"]
@@ -241,10 +252,7 @@ MEMBER_TYPES = ["Player", "Manager"]
 # ======================
 # データクリーニング（幽霊部員削除）
 # ======================
-def cleanup_ghost_members():
-    members = load_members()
-    collection = load_collection()
-    
+def cleanup_ghost_members(members, collection):
     if len(collection) > 0 and len(members) > 0:
         valid_names = set(members['名前'].tolist())
         original_count = len(collection)
@@ -252,22 +260,35 @@ def cleanup_ghost_members():
         
         if len(collection) < original_count:
             save_collection(collection)
-            return original_count - len(collection)
-    return 0
+            return original_count - len(collection), collection
+    return 0, collection
+
+# ======================
+# シート読み込み（独立したシートは並列で読み込み）
+# ======================
+sheet_loaders = {
+    'members': load_members,
+    'collection': load_collection,
+    'transport_balance': load_transport_balance,
+}
+if 'drivers_data' not in st.session_state:
+    sheet_loaders['drivers'] = load_drivers
+
+sheets_data = load_concurrently(sheet_loaders)
 
-cleaned = cleanup_ghost_members()
+cleaned, sheets_data['collection'] = cleanup_ghost_members(sheets_data['members'], sheets_data['collection'])
 
 # ======================
-# Session State 初期化（初回のみSheets読み込み）
+# Session State 初期化（初回のみSheets読み込み結果を保持）
 # ======================
 if 'members_data' not in st.session_state:
-    st.session_state.members_data = load_members()
+    st.session_state.members_data = sheets_data['members']
 
 if 'drivers_data' not in st.session_state:
-    st.session_state.drivers_data = load_drivers()
+    st.session_state.drivers_data = sheets_data['drivers']
 
 if 'collection_data' not in st.session_state:
-    st.session_state.collection_data = load_collection()
+    st.session_state.collection_data = sheets_data['collection']
 
 if 'dispatch_data' not in st.session_state:
     st.session_state.dispatch_data = None
@@ -278,6 +299,15 @@ if 'prev_drivers' not in st.session_state:
 if 'gas_prices' not in st.session_state:
     st.session_state.gas_prices = {'regular': 170, 'premium': 180, 'diesel': 150}
 
+# 他の人の変更を数秒ごとに確認し、変更されたシートの内容だけを読み込み直す
+# （交通費会計は毎回読み込むため再実行するだけ）
+watch_changes({
+    SHEET_MEMBERS: lambda: st.session_state.pop('members_data', None),
+    SHEET_DRIVERS: lambda: st.session_state.pop('drivers_data', None),
+    SHEET_COLLECTION: lambda: st.session_state.pop('collection_data', None),
+    SHEET_TRANSPORT_BALANCE: lambda: None,
+})
+
 # ======================
 # ヘッダー
 # ======================
@@ -323,7 +353,7 @@ with tab1:
         if st.button("➕ メンバーを登録", use_container_width=True, type="primary", disabled=not IS_ADMIN):
             if new_name and new_name.strip():
                 if new_name.strip() not in st.session_state.members_data['名前'].values:
-                    new_row = pd.DataFrame({'名前': [new_name.strip()], '属性': [new_type]})
+                    new_row = pd.DataFrame({'名前': [new_name.strip()], '属性': [new_type], '乗車地': ['']})
                     st.session_state.members_data = pd.concat([st.session_state.members_data, new_row], ignore_index=True)
                     save_members(st.session_state.members_data)
                     
@@ -386,7 +416,7 @@ with tab1:
         
         drivers = st.session_state.drivers_data.copy()
         if len(drivers) == 0:
-            drivers = pd.DataFrame({'名前': [''], '車種': [''], '燃料タイプ': ['レギュラー'], '燃費': [15.0]})
+            drivers = pd.DataFrame({'名前': [''], '車種': [''], '燃料タイプ': ['レギュラー'], '燃費': [15.0], '定員': [DEFAULT_SEATS], '乗車地': ['']})
         
         edited_drivers = st.data_editor(
             drivers,
@@ -397,7 +427,9 @@ with tab1:
                 "名前": st.column_config.TextColumn("👤 名前", width="medium"),
                 "車種": st.column_config.TextColumn("🚗 車種", width="medium"),
                 "燃料タイプ": st.column_config.SelectboxColumn("⛽ 燃料", options=FUEL_TYPES, width="small"),
-                "燃費": st.column_config.NumberColumn("📊 燃費", min_value=1.0, max_value=50.0, format="%.1f km/L", step=0.5, width="small")
+                "燃費": st.column_config.NumberColumn("📊 燃費", min_value=1.0, max_value=50.0, format="%.1f km/L", step=0.5, width="small"),
+                "定員": st.column_config.NumberColumn("💺 定員", min_value=1, max_value=10, step=1, help="ドライバーを含む乗車人数", width="small"),
+                "乗車地": st.column_config.TextColumn("📍 乗車地", width="small")
             },
             key="drivers_editor_main"
         )
@@ -477,6 +509,76 @@ with tab2:
         
         if len(valid_drivers) > 0:
             driver_names = valid_drivers['名前'].tolist()
+            
+            # 配車の自動作成（ドライバーの選択と同乗者の割り当て）
+            with st.expander("🧭 配車を自動で組む", expanded=False):
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    trip_distance = st.number_input("🛣️ 往復距離 (km)", 0.0, 2000.0, 100.0, 10.0, key="carpool_distance")
+                with col2:
+                    trip_detour = st.number_input("📍 寄り道 (km/か所)", 0.0, 100.0, 5.0, 1.0, key="carpool_detour", help="ドライバーの乗車地以外に1か所寄るごとに増える距離")
+                with col3:
+                    trip_etc = st.number_input("🛤️ ETC (円/台)", 0, 50000, 0, 100, key="carpool_etc")
+                
+                available = st.multiselect("利用できるドライバー", driver_names, driver_names, key="carpool_drivers")
+                
+                # 参加者の乗車地（保存するとメンバーのシートに記録）
+                pickup_df = valid_members[valid_members['名前'].isin(selected)][['名前', '乗車地']] \
+                    if len(valid_members) > 0 else pd.DataFrame(columns=['名前', '乗車地'])
+                edited_pickup = st.data_editor(
+                    pickup_df,
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "名前": st.column_config.TextColumn("👤 名前", disabled=True),
+                        "乗車地": st.column_config.TextColumn("📍 乗車地")
+                    },
+                    key="carpool_pickup_editor"
+                )
+                if st.button("💾 乗車地を保存", use_container_width=True, key="carpool_save_pickup", disabled=not IS_ADMIN):
+                    pickup = dict(zip(edited_pickup['名前'], edited_pickup['乗車地'].fillna('')))
+                    members_df = st.session_state.members_data.copy()
+                    members_df['乗車地'] = [pickup.get(n, p) for n, p in zip(members_df['名前'], members_df['乗車地'])]
+                    st.session_state.members_data = members_df
+                    save_members(members_df)
+                    st.success("✨ 保存しました！")
+                
+                if st.button("🧭 配車を計算", use_container_width=True, type="primary", key="carpool_run", disabled=len(selected) == 0):
+                    prices = st.session_state.gas_prices
+                    fuel_prices = {'レギュラー': prices['regular'], 'ハイオク': prices['premium'], '軽油': prices['diesel']}
+                    st.session_state.carpool_plan = plan_carpool(
+                        edited_pickup, valid_drivers[valid_drivers['名前'].isin(available)],
+                        fuel_prices, trip_distance, trip_detour, trip_etc
+                    )
+                
+                plan = st.session_state.get('carpool_plan')
+                if plan is not None:
+                    st.dataframe(
+                        plan_table(plan),
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config={"距離": st.column_config.NumberColumn("🛣️ 距離", format="%.1f km")}
+                    )
+                    st.caption(f"🚗 {len(plan.riders)}台　ガソリン代 + ETC 見込み ¥{plan.total_cost:,.0f}")
+                    if plan.unassigned:
+                        st.warning(f"⚠️ 席が足りません: {', '.join(plan.unassigned)}")
+                    
+                    def use_carpool_plan(plan=plan):
+                        # 選んだドライバーと距離を配車・走行データに反映（ドライバーの選択より前に実行）
+                        info = valid_drivers.set_index('名前')
+                        st.session_state.sel_drivers = list(plan.riders)
+                        st.session_state.dispatch_data = pd.DataFrame([{
+                            'ドライバー': name,
+                            '燃料': info.loc[name, '燃料タイプ'],
+                            '燃費': float(info.loc[name, '燃費']),
+                            '距離': float(plan.distances[name]),
+                            'ETC': int(trip_etc),
+                            '他': 0
+                        } for name in plan.riders])
+                        st.session_state.prev_drivers = list(plan.riders)
+                    
+                    st.button("⬇️ この配車を使う", use_container_width=True, key="carpool_apply", on_click=use_carpool_plan)
+            
             sel_drivers = st.multiselect("配車ドライバー", driver_names, key="sel_drivers")
             
             if len(sel_drivers) > 0:
@@ -680,6 +782,7 @@ with tab2:
                         
                         driver_list = ', '.join(calc_df[calc_df['支給額'] > 0]['ドライバー'].tolist())
                         add_transport_balance_entry(event_date.strftime('%Y-%m-%d'), f"{col_name} ({driver_list})", 0, int(total_payment))
+                        sheets_data['transport_balance'] = load_transport_balance()
                         
                         st.success("✨ 徴収リストに追加しました！")
                         st.balloons()
@@ -766,7 +869,7 @@ with tab3:
         st.markdown('<div class="card">', unsafe_allow_html=True)
         st.markdown('<p class="section-title">💰 交通費会計</p>', unsafe_allow_html=True)
         
-        balance_df = load_transport_balance()
+        balance_df = sheets_data['transport_balance']
         if len(balance_df) > 0:
             current = balance_df['残高'].iloc[-1]
             income = balance_df['収入'].sum()
@@ -807,3 +910,5 @@ st.markdown("""
     交通費精算システム v5.0 - Stable Edition
 </div>
 """, unsafe_allow_html=True)
+
+finish_profile(profiler)
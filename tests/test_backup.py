@@ -0,0 +1,116 @@
+"""バックアップの行の差分（diff_rows / apply_ops）・保存と復元のテスト"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils import backup
+from utils.backup import apply_ops, diff_rows
+from utils.sheets import SHEET_DATABASE
+
+ROWS = [[f'2026-05-{d:02d}', '支出', '備品', d * 100] for d in range(1, 21)]
+
+
+@pytest.mark.parametrize('new', [
+    ROWS,
+    ROWS + [['2026-05-21', '収入', '会費', 3000]],
+    ROWS[:5] + [['2026-05-06', '支出', '備品', 650]] + ROWS[6:],
+    ROWS[:3] + ROWS[10:],
+    [['2026-04-30', '収入', '繰越', 10000]] + ROWS,
+    ROWS[::-1],
+    [],
+])
+def test_apply_ops_restores_new_rows(new):
+    assert apply_ops(ROWS, diff_rows(ROWS, new)) == new
+
+
+def test_unchanged_rows_have_no_ops():
+    assert diff_rows(ROWS, [list(row) for row in ROWS]) == []
+
+
+def test_append_is_a_single_insert():
+    new = ROWS + [['2026-05-21', '収入', '会費', 3000]]
+    assert diff_rows(ROWS, new) == [[20, 20, [['2026-05-21', '収入', '会費', 3000]]]]
+
+
+def test_one_row_change_replaces_only_that_row():
+    new = [list(row) for row in ROWS]
+    new[7][3] = 999
+    assert diff_rows(ROWS, new) == [[7, 8, [new[7]]]]
+
+
+def test_random_edits_round_trip():
+    rng = random.Random(0)
+    for _ in range(50):
+        new = [list(row) for row in ROWS]
+        for _ in range(rng.randint(1, 6)):
+            i = rng.randrange(len(new) + 1)
+            op = rng.choice(['insert', 'delete', 'update'])
+            if op == 'insert' or not new:
+                new.insert(i, ['2026-06-01', '収入', '会費', rng.randint(1, 9999)])
+            elif op == 'delete':
+                del new[min(i, len(new) - 1)]
+            else:
+                new[min(i, len(new) - 1)][3] = rng.randint(1, 9999)
+        assert apply_ops(ROWS, diff_rows(ROWS, new)) == new
+
+
+def test_large_changes_fall_back_to_one_replacement(monkeypatch):
+    monkeypatch.setattr(backup, 'DIFF_LIMIT', 10)
+    new = ROWS[:2] + [[r[0], r[1], r[2], r[3] + 1] for r in ROWS[2:18]] + ROWS[18:]
+    ops = diff_rows(ROWS, new)
+    assert ops == [[2, 18, new[2:18]]]
+    assert apply_ops(ROWS, ops) == new
+
+
+def test_backup_chain_restores_each_revision(monkeypatch, tmp_path):
+    # シートの代わりに行のリストを返し、完全バックアップ + 差分から各時点の内容を復元する
+    versions = [ROWS, ROWS + [['2026-05-21', '収入', '会費', 3000]], ROWS[1:] + [['2026-05-22', '支出', '雑費', 50]]]
+    header = ['日付', '種別', '科目', '金額']
+    start = datetime(2026, 5, 1, 9, 0)
+    for revision, rows in enumerate(versions, 1):
+        monkeypatch.setattr(backup, '_current_rows', lambda sheet, rows=rows: (header, rows))
+        backup.backup_sheet(SHEET_DATABASE, revision, str(tmp_path), start + timedelta(hours=revision))
+
+    entries = backup.list_backups(SHEET_DATABASE, str(tmp_path))
+    assert [e.kind for e in entries] == ['full', 'delta', 'delta']
+    for upto, rows in enumerate(versions):
+        assert backup._restore_rows(entries, upto) == (header, rows)
+
+
+def test_backup_all_saves_direct_edits(monkeypatch, tmp_path):
+    # シートを直接編集するとリビジョンは同じまま内容だけが変わる
+    header = ['日付', '種別', '科目', '金額']
+    current = {'rows': ROWS}
+    monkeypatch.setattr(backup, 'get_sheet_revisions', lambda *sheets: {sheet: 5 for sheet in sheets})
+    monkeypatch.setattr(backup, '_current_rows', lambda sheet: (header, current['rows']))
+    start = datetime(2026, 5, 1, 9, 0)
+    assert len(backup.backup_all(str(tmp_path), [SHEET_DATABASE], start)) == 1
+    assert backup.backup_all(str(tmp_path), [SHEET_DATABASE], start + timedelta(hours=1)) == []
+
+    current['rows'] = ROWS[:-1] + [['2026-05-20', '支出', '備品', 9999]]
+    created = backup.backup_all(str(tmp_path), [SHEET_DATABASE], start + timedelta(hours=2))
+    assert [e.kind for e in created] == ['delta']
+    entries = backup.list_backups(SHEET_DATABASE, str(tmp_path))
+    assert backup._restore_rows(entries, len(entries) - 1) == (header, current['rows'])
+
+
+def test_restore_keeps_row_ids(monkeypatch, tmp_path):
+    # 削除で行IDが飛んでいても、復元後の行IDはバックアップした時点と同じ
+    from utils import sheets
+    header = ['日付', '種別', '科目', '金額', '備考', '決済方法', '行ID']
+    rows = [['2026-05-01', '収入', '会費', 3000, '', '銀行口座', 0],
+            ['2026-05-03', '支出', '備品', 1200, '', '現金 (財布)', 2],
+            ['2026-05-04', '支出', '雑費', 100, '', '現金 (財布)', 7]]
+    monkeypatch.setattr(backup, '_current_rows', lambda sheet: (header, rows))
+    backup.backup_sheet(SHEET_DATABASE, 1, str(tmp_path), datetime(2026, 5, 5))
+
+    written = {}
+    monkeypatch.setattr(sheets, 'get_sheet_revision', lambda sheet: 1)
+    monkeypatch.setattr(sheets, '_write_snapshot', lambda df, revision, reseal=False: written.setdefault('df', df) is df)
+    monkeypatch.setattr(backup, 'get_sheet_revisions', lambda *s: {sheet: 1 for sheet in s})
+    ok, _, _ = backup.restore_sheet(SHEET_DATABASE, root=str(tmp_path))
+    assert ok
+    assert written['df'].index.tolist() == [0, 2, 7]
+    assert '行ID' not in written['df'].columns
+    assert written['df']['金額'].tolist() == [3000, 1200, 100]
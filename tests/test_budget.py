@@ -0,0 +1,56 @@
+"""予算の支出実績（BudgetTracker）のテスト"""
+import pandas as pd
+import pytest
+
+from utils.budget import BudgetTracker
+from utils.cube import LedgerCube
+
+
+def ledger(rows, index=None):
+    df = pd.DataFrame(rows, columns=['日付', '種別', '科目', '金額', '備考', '決済方法'], index=index)
+    return df.assign(日付=pd.to_datetime(df['日付']))
+
+
+LEDGER = ledger([
+    ['2026-03-31', '支出', '備品', 1000, '', '現金 (財布)'],
+    ['2026-04-01', '支出', '備品', 1200, '', '現金 (財布)'],
+    ['2026-12-10', '支出', '交通費', 800, '', '銀行口座'],
+    ['2027-03-20', '支出', '備品', 300, '', '銀行口座'],
+    ['2026-05-01', '収入', '会費', 3000, '', '銀行口座'],
+    [None, '支出', '備品', 999, '日付なし', '現金 (財布)'],
+])
+
+
+def test_spent_per_fiscal_year_from_the_cube():
+    # 4月始まりの年度で集計し、収入と日付のない行は含めない
+    tracker = BudgetTracker.from_cube(LedgerCube.from_ledger(LEDGER))
+    assert tracker.spent(2025, '備品') == 1000
+    assert tracker.spent(2026, '備品') == 1500
+    assert tracker.spent(2026, '交通費') == 800
+    assert tracker.spent(2026, '会費') == 0
+
+
+def test_incremental_apply_matches_rebuild():
+    tracker = BudgetTracker.from_cube(LedgerCube.from_ledger(LEDGER))
+    removed = LEDGER.loc[[1, 2]]
+    added = ledger([
+        ['2026-04-01', '支出', '備品', 2000, '', '現金 (財布)'],
+        ['2027-04-02', '支出', '交通費', 500, '', '銀行口座'],
+    ], index=[1, 6])
+    tracker.apply(removed, added)
+    rebuilt = BudgetTracker.from_cube(LedgerCube.from_ledger(pd.concat([LEDGER.drop(index=[1, 2]), added])))
+    for key in set(tracker.actual) | set(rebuilt.actual):
+        assert tracker.actual.get(key, 0) == pytest.approx(rebuilt.actual.get(key, 0)), key
+
+
+def test_report_compares_budget_and_actual():
+    tracker = BudgetTracker.from_cube(LedgerCube.from_ledger(LEDGER))
+    budget = pd.DataFrame({'年度': [2026, 2026, 2025], '科目': ['備品', '交通費', '備品'], '予算': [2000, 0, 5000]})
+    report = tracker.report(budget, 2026, ['備品', '交通費', '雑費']).set_index('科目')
+    assert report.loc['備品', '実績'] == 1500
+    assert report.loc['備品', '残り'] == 500
+    assert report.loc['備品', '消化率'] == pytest.approx(0.75)
+    # 予算が0・未設定の科目は消化率なし
+    assert report.loc['交通費', '残り'] == -800
+    assert pd.isna(report.loc['交通費', '消化率'])
+    assert report.loc['雑費', '予算'] == 0
@@ -0,0 +1,83 @@
+"""plan_carpool（配車）のテスト"""
+import pandas as pd
+import pytest
+
+from utils.carpool import plan_carpool, plan_table
+
+PRICES = {'レギュラー': 170, 'ハイオク': 180, '軽油': 150}
+
+
+def participants(rows):
+    return pd.DataFrame(rows, columns=['名前', '乗車地'])
+
+
+def drivers(rows):
+    return pd.DataFrame(rows, columns=['名前', '燃料タイプ', '燃費', '定員', '乗車地'])
+
+
+def assigned(plan):
+    return sorted(name for riders in plan.riders.values() for name in riders)
+
+
+def test_everyone_rides_with_the_fewest_cars():
+    people = participants([
+        ['佐藤', '駅'], ['鈴木', '駅'], ['高橋', '駅'], ['田中', '学校'], ['伊藤', '学校'],
+    ])
+    cars = drivers([
+        ['佐藤', 'レギュラー', 17, 5, '駅'],
+        ['田中', 'レギュラー', 10, 5, '学校'],
+        ['山本', '軽油', 15, 8, '駅'],
+    ])
+    plan = plan_carpool(people, cars, PRICES, distance=100)
+    # 席1つあたりが最も安い山本の車1台で全員が乗れる
+    assert list(plan.riders) == ['山本']
+    assert assigned(plan) == ['伊藤', '佐藤', '田中', '鈴木', '高橋']
+    assert plan.unassigned == []
+    assert plan.total_cost == pytest.approx(100 * 150 / 15)
+
+
+def test_detour_and_etc_are_costed():
+    people = participants([['佐藤', '駅'], ['鈴木', '学校']])
+    cars = drivers([['佐藤', 'レギュラー', 10, 4, '駅']])
+    plan = plan_carpool(people, cars, PRICES, distance=100, detour=5, etc=2000)
+    assert plan.stops == {'佐藤': ['学校']}
+    assert plan.distances == {'佐藤': 105}
+    assert plan.total_cost == pytest.approx(105 * 17 + 2000)
+
+
+def test_riders_are_moved_to_a_car_that_already_stops_there():
+    people = participants([
+        ['佐藤', '駅'], ['田中', '学校'], ['鈴木', '駅'], ['高橋', '学校'], ['伊藤', '学校'],
+    ])
+    cars = drivers([
+        ['佐藤', 'レギュラー', 10, 3, '駅'],
+        ['田中', 'レギュラー', 10, 3, '学校'],
+    ])
+    plan = plan_carpool(people, cars, PRICES, distance=100, detour=10)
+    assert all(stops == [] for stops in plan.stops.values())
+    assert assigned(plan) == ['伊藤', '鈴木', '高橋']
+    assert plan.unassigned == []
+
+
+def test_unassigned_when_seats_run_out():
+    people = participants([['佐藤', '駅'], ['鈴木', '駅'], ['高橋', '駅']])
+    cars = drivers([['山本', 'レギュラー', 10, 2, '駅']])
+    plan = plan_carpool(people, cars, PRICES, distance=50)
+    assert len(plan.riders['山本']) == 1
+    assert len(plan.unassigned) == 2
+
+
+def test_blank_cells_in_the_driver_table():
+    # 燃費が空欄・0の車は候補にせず、定員が空欄なら既定の定員
+    people = participants([['鈴木', '駅']])
+    cars = drivers([
+        ['佐藤', 'レギュラー', 0, 5, '駅'],
+        ['田中', 'レギュラー', None, 5, '駅'],
+        ['山本', 'ハイオク', 12, None, '駅'],
+    ])
+    plan = plan_carpool(people, cars, PRICES, distance=60)
+    assert plan.riders == {'山本': ['鈴木']}
+    table = plan_table(plan)
+    assert table.to_dict('records') == [
+        {'ドライバー': '山本', '同乗者': '鈴木', '人数': 2, '寄る乗車地': '', '距離': 60},
+    ]
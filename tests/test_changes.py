@@ -0,0 +1,148 @@
+"""ChangeFeed.poll のテスト（スプレッドシートはメモリ上の偽物）"""
+import pytest
+from gspread.exceptions import APIError
+from requests import Response
+
+from utils import changes
+from utils.changes import ChangeFeed
+from utils.sheets import SHEET_DATABASE, SHEET_JOURNAL, SHEET_MEMBERS
+
+
+class FakeWorksheet:
+    def __init__(self, title, values):
+        self.title = title
+        self.values = values
+
+
+class FakeSpreadsheet:
+    """更新日時・リビジョン・内容だけを持つスプレッドシート"""
+
+    def __init__(self):
+        self.sheets = {
+            SHEET_DATABASE: [['日付', '金額'], ['2026-05-01', 100]],
+            SHEET_JOURNAL: [['リビジョン']],
+            SHEET_MEMBERS: [['名前'], ['山田']],
+        }
+        self.revisions = {}
+        self.modified = 0
+
+    def get_lastUpdateTime(self):
+        return str(self.modified)
+
+    def worksheets(self):
+        return [FakeWorksheet(title, values) for title, values in self.sheets.items()]
+
+    def values_batch_get(self, ranges):
+        return {'valueRanges': [{'values': self.sheets[name.strip("'")]} for name in ranges]}
+
+    def app_write(self, sheet, row):
+        """アプリの保存（内容とリビジョンが変わる）"""
+        self.sheets[sheet].append(row)
+        self.revisions[sheet] = self.revisions.get(sheet, 0) + 1
+        self.modified += 1
+
+    def direct_edit(self, sheet, row, column, value):
+        """シートの直接編集（内容だけが変わる）"""
+        self.sheets[sheet][row][column] = value
+        self.modified += 1
+
+
+@pytest.fixture
+def spreadsheet(monkeypatch):
+    fake = FakeSpreadsheet()
+    monkeypatch.setattr(changes, 'get_spreadsheet', lambda: fake)
+    monkeypatch.setattr(changes, 'get_cached_revisions', lambda ttl=0: dict(fake.revisions))
+    return fake
+
+
+def test_first_poll_sets_baseline(spreadsheet):
+    feed = ChangeFeed('test')
+    assert feed.poll() == []
+    assert all(change.version == 0 for change in feed.current().values())
+
+
+def test_unchanged_modified_time_skips(spreadsheet):
+    feed = ChangeFeed('test')
+    feed.poll()
+    spreadsheet.sheets[SHEET_MEMBERS][1][0] = '佐藤'
+    # 更新日時が変わらなければ内容は読まない
+    assert feed.poll() == []
+
+
+def test_app_write_is_not_external(spreadsheet):
+    feed = ChangeFeed('test')
+    feed.poll()
+    spreadsheet.app_write(SHEET_MEMBERS, ['佐藤'])
+    assert feed.poll() == [SHEET_MEMBERS]
+    change = feed.current()[SHEET_MEMBERS]
+    assert change.version == 1
+    assert change.revision == 1
+    assert not change.external
+
+
+def test_direct_edit_is_external(spreadsheet):
+    feed = ChangeFeed('test')
+    feed.poll()
+    spreadsheet.direct_edit(SHEET_DATABASE, 1, 1, 999)
+    assert feed.poll() == [SHEET_DATABASE]
+    assert feed.current()[SHEET_DATABASE].external
+
+
+def test_direct_edit_after_app_write(spreadsheet):
+    feed = ChangeFeed('test')
+    feed.poll()
+    spreadsheet.app_write(SHEET_MEMBERS, ['佐藤'])
+    assert feed.poll() == [SHEET_MEMBERS]
+    # アプリの書き込みの直後の直接編集も検知する
+    spreadsheet.direct_edit(SHEET_MEMBERS, 2, 0, '鈴木')
+    assert feed.poll() == [SHEET_MEMBERS]
+    change = feed.current()[SHEET_MEMBERS]
+    assert change.version == 2
+    assert change.external
+
+
+def test_modified_without_content_change(spreadsheet):
+    feed = ChangeFeed('test')
+    feed.poll()
+    spreadsheet.modified += 1
+    assert feed.poll() == []
+
+
+def test_lost_revisions_raise(spreadsheet):
+    feed = ChangeFeed('test')
+    spreadsheet.app_write(SHEET_MEMBERS, ['佐藤'])
+    feed.poll()
+    spreadsheet.revisions = {}
+    spreadsheet.modified += 1
+    with pytest.raises(RuntimeError):
+        feed.poll()
+
+
+def api_error(status):
+    response = Response()
+    response.status_code = status
+    response._content = b'{"error": {"code": %d, "message": "denied", "status": "PERMISSION_DENIED"}}' % status
+    return APIError(response)
+
+
+def test_no_drive_access_falls_back_to_revisions(spreadsheet, monkeypatch):
+    def denied():
+        raise api_error(403)
+
+    monkeypatch.setattr(spreadsheet, 'get_lastUpdateTime', denied)
+    feed = ChangeFeed('test')
+    assert feed.poll() == []
+    assert not feed.use_modified_time
+    spreadsheet.app_write(SHEET_MEMBERS, ['佐藤'])
+    assert feed.poll() == [SHEET_MEMBERS]
+
+
+def test_other_api_errors_are_retried(spreadsheet, monkeypatch):
+    def unavailable():
+        raise api_error(503)
+
+    monkeypatch.setattr(spreadsheet, 'get_lastUpdateTime', unavailable)
+    feed = ChangeFeed('test')
+    with pytest.raises(APIError):
+        feed.poll()
+    assert feed.use_modified_time
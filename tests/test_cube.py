@@ -0,0 +1,70 @@
+"""集計キューブ（LedgerCube）のテスト"""
+import pandas as pd
+import pytest
+
+from utils.cube import LedgerCube
+from utils.summary import kpi_summary
+
+
+def ledger(rows, index=None):
+    return pd.DataFrame(rows, columns=['日付', '種別', '科目', '金額', '備考', '決済方法'], index=index)
+
+
+LEDGER = ledger([
+    ['2026-04-01', '収入', '会費', 3000, '', '銀行口座'],
+    ['2026-04-15', '収入', '会費', 2000, '', '銀行口座'],
+    ['2026-04-20', '支出', '備品', 1200, '', '現金 (財布)'],
+    ['2026-05-10', '支出', '交通費', 800, '', '銀行口座'],
+    ['', '収入', '寄付', 500, '日付なし', '現金 (財布)'],
+])
+
+
+def test_cells_group_rows_by_month_kind_category_and_method():
+    cube = LedgerCube.from_ledger(LEDGER)
+    assert cube.cells[(2026, 4, '収入', '会費', '銀行口座')] == [5000, 2]
+    # 日付が読めない行は 年=0, 月=0 で合計に含める
+    assert cube.cells[(0, 0, '収入', '寄付', '現金 (財布)')] == [500, 1]
+    assert cube.total() == 7500
+    assert cube.total(種別='支出') == 2000
+
+
+def test_balances_match_the_kpi_summary():
+    cube = LedgerCube.from_ledger(LEDGER)
+    assert cube.balance() == pytest.approx(3500)
+    assert cube.balance('現金 (財布)') == pytest.approx(-700)
+    assert cube.balance('現金 (財布)') + cube.balance('銀行口座') == pytest.approx(kpi_summary(LEDGER)['総資産'])
+
+
+def test_monthly_skips_undated_rows():
+    table = LedgerCube.from_ledger(LEDGER).monthly()
+    assert table['年月'].tolist() == ['2026-04', '2026-05']
+    assert table['収入'].tolist() == [5000, 0]
+    assert table['支出'].tolist() == [1200, 800]
+
+
+def test_pivot_and_rollup_filters():
+    cube = LedgerCube.from_ledger(LEDGER)
+    pivot = cube.pivot('科目', 決済方法='銀行口座')
+    assert pivot.set_index('科目').to_dict('index') == {
+        '交通費': {'収入': 0, '支出': 800}, '会費': {'収入': 5000, '支出': 0},
+    }
+    rollup = cube.rollup(['月'], 種別=['収入', '支出'], 年=2026)
+    assert rollup['金額'].tolist() == [6200, 800]
+    assert rollup['件数'].tolist() == [3, 1]
+
+
+def test_incremental_apply_matches_rebuild():
+    cube = LedgerCube.from_ledger(LEDGER)
+    before = cube.to_frame()
+    removed = LEDGER.loc[[1, 3]]
+    added = ledger([
+        ['2026-04-15', '収入', '会費', 2500, '', '銀行口座'],
+        ['2026-06-01', '支出', '雑費', 300, '', 'PayPay'],
+    ], index=[1, 5])
+    cube.apply(removed, added)
+    rebuilt = LedgerCube.from_ledger(pd.concat([LEDGER.drop(index=[1, 3]), added]))
+    assert cube.cells == rebuilt.cells
+    # 件数が0になったセルは消え、集計表は作り直される
+    assert (2026, 5, '支出', '交通費', '銀行口座') not in cube.cells
+    assert cube.to_frame() is not before
+    assert cube.total() == rebuilt.total()
@@ -0,0 +1,76 @@
+"""重複検出（DuplicateIndex・scan_duplicates・check_ledger）のテスト"""
+import pandas as pd
+
+from utils.checks import check_ledger
+from utils.duplicates import DuplicateIndex, scan_duplicates
+
+COLUMNS = ['日付', '種別', '科目', '金額', '備考', '決済方法']
+METHODS = ['現金 (財布)', '銀行口座']
+
+
+def ledger(rows, index=None):
+    df = pd.DataFrame(rows, columns=COLUMNS, index=index)
+    return df.assign(日付=pd.to_datetime(df['日付']))
+
+
+LEDGER = ledger([
+    ['2026-05-01', '収入', '会費', 3000, '山田', '現金 (財布)'],
+    ['2026-05-01', '収入', '会費', 3000, '佐藤', '現金 (財布)'],
+    ['2026-05-02', '支出', '備品', 1200, 'ボール', '現金 (財布)'],
+    ['2026-05-03', '支出', '交通費', 800, '', '銀行口座'],
+])
+
+
+def test_find_uses_the_form_key():
+    index = DuplicateIndex.from_ledger(LEDGER)
+    entry = ledger([['2026-05-02', '支出', '備品', 1200.0, '別の備考', '現金 (財布)']], index=[99])
+    assert index.find(entry) == {99: [2]}
+    other = ledger([['2026-05-02', '支出', '備品', 1200, '', '銀行口座']], index=[99])
+    assert index.find(other) == {}
+
+
+def test_incremental_apply_matches_rebuild():
+    index = DuplicateIndex.from_ledger(LEDGER)
+    removed = LEDGER.loc[[1, 2]]
+    added = pd.concat([
+        ledger([['2026-05-02', '支出', '備品', 1500, 'ボール', '現金 (財布)']], index=[2]),
+        ledger([['2026-05-03', '支出', '交通費', 800, '', '銀行口座']], index=[4]),
+    ])
+    index.apply(removed, added)
+    frame = pd.concat([LEDGER.drop(index=[1, 2]), added])
+    assert index.labels == DuplicateIndex.from_ledger(frame).labels
+
+    # 同じキーの行が残っていれば、1件削除してもキーは残る
+    index.apply(frame.loc[[4]], frame.iloc[0:0])
+    entry = ledger([['2026-05-03', '支出', '交通費', 800, '', '銀行口座']], index=[99])
+    assert index.find(entry) == {99: [3]}
+    index.apply(frame.loc[[3]], frame.iloc[0:0])
+    assert index.find(entry) == {}
+
+
+def test_scan_groups_rows_with_the_same_key():
+    df = pd.concat([LEDGER, ledger([
+        ['2026-05-02', '支出', '備品', 1200, '', '現金 (財布)'],
+        ['2026-05-01', '収入', '会費', 3000, '鈴木', '現金 (財布)'],
+    ], index=[4, 5])])
+    result = scan_duplicates(df)
+    assert result.index.tolist() == [0, 1, 5, 2, 4]
+    assert result['グループ'].tolist() == [1, 1, 1, 2, 2]
+
+
+def test_scan_without_duplicates_is_empty():
+    result = scan_duplicates(LEDGER.loc[[0, 2, 3]])
+    assert len(result) == 0
+    assert 'グループ' in result.columns
+
+
+def test_check_keeps_rows_that_differ_in_note():
+    # 同じ日の会費を部員ごとに登録した行（備考だけが違う）は重複として報告しない
+    assert len(check_ledger(LEDGER, METHODS)) == 0
+
+
+def test_check_reports_identical_rows_after_the_first():
+    df = pd.concat([LEDGER, LEDGER.loc[[2]].set_axis([4])])
+    issues = check_ledger(df, METHODS)
+    assert issues['チェック'].tolist() == ['重複の可能性']
+    assert issues['行'].tolist() == [4]
@@ -0,0 +1,70 @@
+"""import_ledger_file（重複除外・列マッピング）のテスト"""
+from io import BytesIO
+
+import pandas as pd
+
+from utils.importer import LEDGER_COLUMNS, import_ledger_file
+
+
+def csv_file(text, encoding='utf-8'):
+    return BytesIO(text.encode(encoding))
+
+
+def run_import(text, existing=None, **kwargs):
+    """取り込んで (結果, 追記された行) を返す"""
+    appended = []
+
+    def append_rows(rows):
+        appended.extend(rows)
+        return True
+
+    existing = existing if existing is not None else pd.DataFrame(columns=LEDGER_COLUMNS)
+    result = import_ledger_file(csv_file(text), 'bank.csv', existing, append_rows, **kwargs)
+    return result, appended
+
+
+def test_identical_rows_in_one_file_are_all_imported():
+    text = "日付,金額,備考\n2026-05-01,500,ジュース\n2026-05-01,500,ジュース\n"
+    result, appended = run_import(text)
+    assert result.imported == 2
+    assert result.duplicates == 0
+    assert len(appended) == 2
+
+
+def test_existing_rows_are_consumed_once_each():
+    existing = pd.DataFrame(
+        [[pd.Timestamp('2026-05-01'), '収入', 'その他', 500, 'ジュース', '銀行口座']],
+        columns=LEDGER_COLUMNS,
+    )
+    text = "日付,金額,備考\n2026-05-01,500,ジュース\n2026-05-01,500,ジュース\n2026-05-02,800,\n"
+    result, appended = run_import(text, existing)
+    assert result.duplicates == 1
+    assert result.imported == 2
+    assert [row[0] for row in appended] == ['2026-05-01', '2026-05-02']
+
+
+def test_importing_the_same_file_twice_adds_nothing():
+    text = "日付,金額,備考\n2026-05-01,500,ジュース\n2026-05-01,500,ジュース\n"
+    _, appended = run_import(text)
+    existing = pd.DataFrame(appended, columns=LEDGER_COLUMNS)
+    result, again = run_import(text, existing)
+    assert result.duplicates == 2
+    assert again == []
+
+
+def test_deposit_and_withdrawal_types_are_mapped():
+    text = "日付,入出金区分,金額,摘要\n2026-05-01,入金,3000,会費\n2026-05-02,出金,1200,ボール\n"
+    result, appended = run_import(text)
+    assert result.invalid == 0
+    assert [row[1] for row in appended] == ['収入', '支出']
+
+
+def test_passbook_columns_and_invalid_rows():
+    text = "取引日,お預り金額,お引出金額,摘要\n2026/05/01,\"3,000\",,会費\n2026/05/02,,1200,ボール\n不明,100,,\n"
+    result, appended = run_import(text, chunk_size=2)
+    assert result.read == 3
+    assert result.invalid == 1
+    assert appended == [
+        ['2026-05-01', '収入', 'その他', 3000, '会費', '銀行口座'],
+        ['2026-05-02', '支出', 'その他', 1200, 'ボール', '銀行口座'],
+    ]
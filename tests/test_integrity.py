@@ -0,0 +1,213 @@
+"""MerkleTree.differences・行のハッシュ・記録の連鎖のテスト"""
+import hashlib
+
+import pandas as pd
+import pytest
+
+from utils import integrity
+from utils.checks import check_seal_log
+from utils.integrity import (
+    EMPTY, MerkleTree, load_seals, read_anchor, row_hashes, seal_frame, seal_rows, verify_sheet, write_anchor,
+)
+from utils.sheets import SHEET_DATABASE
+
+
+def leaf(value) -> bytes:
+    return hashlib.sha256(str(value).encode()).digest()
+
+
+def tree(values: dict) -> MerkleTree:
+    return MerkleTree.from_leaves({label: leaf(v) for label, v in values.items()})
+
+
+def test_identical_trees_have_no_differences():
+    a = tree({i: i for i in range(10)})
+    b = tree({i: i for i in range(10)})
+    assert a.root == b.root
+    assert list(a.differences(b)) == []
+
+
+def test_differences_are_sorted_labels_of_changed_leaves():
+    a = tree({i: i for i in range(100)})
+    b = tree({i: i for i in range(100)})
+    for label in (70, 3, 64):
+        b.set(label, leaf('changed'))
+    assert list(a.differences(b)) == [3, 64, 70]
+    assert list(b.differences(a)) == [3, 64, 70]
+
+
+def test_differences_between_trees_of_different_size():
+    # 追加された行・削除された行（空きの葉）も異なる葉になる
+    a = tree({i: i for i in range(5)})
+    b = tree({i: i for i in range(20)})
+    b.set(2, EMPTY)
+    assert list(a.differences(b)) == [2] + list(range(5, 20))
+
+
+def test_incremental_updates_match_a_rebuilt_tree():
+    a = MerkleTree()
+    for i in range(37):
+        a.set(i, leaf(i))
+    a.set(11, leaf('x'))
+    a.assign({i: leaf('x' if i == 11 else i) for i in range(36)})
+    expected = {i: i for i in range(36)}
+    expected[11] = 'x'
+    b = tree(expected)
+    assert a.root == b.root
+    assert list(a.differences(b)) == []
+
+
+def test_row_hashes_ignore_how_values_were_read():
+    # シートから読んだ文字列と、アプリの日付・数値で同じハッシュになる
+    read = pd.DataFrame({
+        '日付': ['2026/05/01'], '種別': ['収入'], '科目': ['会費'],
+        '金額': ['3000'], '備考': [' 5月分 '], '決済方法': ['銀行口座'],
+    })
+    typed = pd.DataFrame({
+        '日付': [pd.Timestamp('2026-05-01')], '種別': ['収入'], '科目': ['会費'],
+        '金額': [3000.0], '備考': ['5月分'], '決済方法': ['銀行口座'],
+    })
+    assert row_hashes(SHEET_DATABASE, read) == row_hashes(SHEET_DATABASE, typed)
+
+
+def test_verify_sheet_reports_edited_rows(monkeypatch):
+    monkeypatch.setattr(integrity, '_trees', {})
+    df = pd.DataFrame({
+        '日付': pd.to_datetime(['2026-05-01', '2026-05-02', '2026-05-03']),
+        '種別': ['収入', '支出', '支出'], '科目': ['会費', '備品', '交通費'],
+        '金額': [3000, 1200, 800], '備考': ['', '', ''], '決済方法': ['銀行口座'] * 3,
+    })
+    sealed = row_hashes(SHEET_DATABASE, df)
+    assert verify_sheet(SHEET_DATABASE, df, sealed).ok
+
+    edited = df.copy()
+    edited.loc[1, '金額'] = 12000
+    result = verify_sheet(SHEET_DATABASE, edited, sealed)
+    assert result.diverged == [1]
+    assert result.current == row_hashes(SHEET_DATABASE, edited)[1]
+    assert result.recorded == sealed[1]
+
+    # 前回の木を使い回しても、元に戻せば一致する
+    assert verify_sheet(SHEET_DATABASE, df, sealed).ok
+
+
+# ======================
+# 記録の連鎖
+# ======================
+
+class FakeLog:
+    """_seals シートの代わり（append_rows_to_sheet と同じく列順の行を追記する）"""
+
+    def __init__(self):
+        self.rows = []
+
+    def load(self, sheet, columns):
+        return pd.DataFrame([list(row) for row in self.rows], columns=columns)
+
+    def append(self, rows, columns, sheet, bump_revision=True):
+        self.rows += [list(row) for row in rows]
+        return True
+
+    def save(self, df, sheet):
+        self.rows = df.values.tolist()
+        return True
+
+
+@pytest.fixture
+def seal_log(monkeypatch):
+    log = FakeLog()
+    monkeypatch.setattr(integrity, 'load_sheet_as_dataframe', log.load)
+    monkeypatch.setattr(integrity, 'append_rows_to_sheet', log.append)
+    monkeypatch.setattr(integrity, 'save_dataframe_to_sheet', log.save)
+    monkeypatch.setattr(integrity, '_key', lambda: b'secret')
+    monkeypatch.setattr(integrity, '_heads', {})
+    return log
+
+
+LEDGER = pd.DataFrame({
+    '日付': pd.to_datetime(['2026-05-01', '2026-05-02', '2026-05-03']),
+    '種別': ['収入', '支出', '支出'], '科目': ['会費', '備品', '交通費'],
+    '金額': [3000, 1200, 800], '備考': ['', '', ''], '決済方法': ['銀行口座'] * 3,
+})
+
+
+def test_row_hashes_are_keyed(seal_log, monkeypatch):
+    keyed = row_hashes(SHEET_DATABASE, LEDGER)
+    monkeypatch.setattr(integrity, '_key', lambda: b'other')
+    assert row_hashes(SHEET_DATABASE, LEDGER)[0] != keyed[0]
+
+
+def test_chain_accepts_records_written_by_the_app(seal_log):
+    seal_frame(SHEET_DATABASE, LEDGER)
+    edited = LEDGER.copy()
+    edited.loc[1, '金額'] = 1500
+    assert seal_rows(SHEET_DATABASE, edited.loc[[1]], deleted=[2])
+    log = load_seals()
+    assert log.broken == []
+    assert sorted(log.seals[SHEET_DATABASE]) == [0, 1]
+    assert verify_sheet(SHEET_DATABASE, edited.drop(index=2), log.seals[SHEET_DATABASE]).ok
+
+
+def test_appended_seal_without_the_key_is_rejected(seal_log, monkeypatch):
+    # シートを直接編集し、鍵を知らずに作った記録を追記しても使われない
+    seal_frame(SHEET_DATABASE, LEDGER)
+    edited = LEDGER.copy()
+    edited.loc[1, '金額'] = 12000
+    monkeypatch.setattr(integrity, '_key', lambda: b'guess')
+    forged = integrity._chain(integrity._records(SHEET_DATABASE, row_hashes(SHEET_DATABASE, edited.loc[[1]])),
+                              bytes.fromhex(seal_log.rows[-1][-1]))
+    seal_log.rows += forged
+    monkeypatch.setattr(integrity, '_key', lambda: b'secret')
+    log = load_seals()
+    assert log.broken == [len(seal_log.rows) - 1]
+    assert verify_sheet(SHEET_DATABASE, edited, log.seals[SHEET_DATABASE]).diverged == [1]
+
+
+def test_replayed_and_removed_records_break_the_chain(seal_log):
+    seal_frame(SHEET_DATABASE, LEDGER)
+    edited = LEDGER.copy()
+    edited.loc[1, '金額'] = 1500
+    seal_rows(SHEET_DATABASE, edited.loc[[1]])
+    seal_rows(SHEET_DATABASE, edited.loc[[2]].assign(金額=900))
+    original = [list(row) for row in seal_log.rows]
+
+    # 古い記録をもう一度追記する（行を前の内容に戻すため）
+    seal_log.rows = original + [original[1]]
+    assert load_seals().broken == [len(original)]
+
+    # 途中の記録を消す（次の記録の前がなくなる）
+    seal_log.rows = original[:-2] + original[-1:]
+    assert load_seals().broken == [len(original) - 2]
+
+
+def test_separate_writers_fork_without_breaking(seal_log):
+    # 別のプロセスが同じ連鎖の続きに追記しても、どちらも一致する
+    seal_frame(SHEET_DATABASE, LEDGER)
+    head = load_seals().head
+    integrity._append(integrity._records(SHEET_DATABASE, row_hashes(SHEET_DATABASE, LEDGER.loc[[0]])), head)
+    integrity._append(integrity._records(SHEET_DATABASE, row_hashes(SHEET_DATABASE, LEDGER.loc[[1]])), head)
+    assert load_seals().broken == []
+
+
+def test_anchor_survives_rewriting_the_log(seal_log, tmp_path, monkeypatch):
+    seal_frame(SHEET_DATABASE, LEDGER)
+    seal_rows(SHEET_DATABASE, LEDGER.loc[[1]].assign(金額=1300))
+    path = str(tmp_path / 'anchor.txt')
+    write_anchor(path, load_seals())
+    anchor = read_anchor(path)
+    assert check_seal_log(load_seals(), anchor).empty
+
+    # 控えより後の記録を消すと、控えの連鎖がなくなる
+    original = [list(row) for row in seal_log.rows]
+    seal_log.rows = original[:-1]
+    issues = check_seal_log(load_seals(), anchor)
+    assert issues['チェック'].tolist() == ['控えの連鎖が記録にない（記録の削除の可能性）']
+
+    # 記録が長くなって書き直しても、書き直す前の連鎖は残る
+    seal_log.rows = original
+    monkeypatch.setattr(integrity, 'SEAL_COMPACT_RATIO', 1)
+    monkeypatch.setattr(integrity, 'SEAL_COMPACT_MIN', 0)
+    seal_frame(SHEET_DATABASE, LEDGER.assign(金額=[3000, 1300, 900]), changed=[2])
+    assert seal_log.rows[0][0] == integrity.SHEET_SEALS
+    assert len(seal_log.rows) == 4
+    assert check_seal_log(load_seals(), anchor).empty
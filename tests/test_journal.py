@@ -0,0 +1,170 @@
+"""journal の再生・行ID・付け直しのテスト"""
+from datetime import datetime
+
+import pandas as pd
+
+from utils import sheets
+from utils.journal import (
+    JOURNAL_COLUMNS, LEDGER_COLUMNS, OP_DELETE, OP_INSERT, OP_UPDATE,
+    build_events, next_label, rebase_changes, renumber_inserts, replay, snapshot_rows, typed_journal,
+)
+
+
+def ledger(rows, index=None):
+    df = pd.DataFrame(rows, columns=LEDGER_COLUMNS, index=index)
+    return df.assign(日付=pd.to_datetime(df['日付']), 金額=pd.to_numeric(df['金額']))
+
+
+def journal(events):
+    return typed_journal(pd.DataFrame(events, columns=JOURNAL_COLUMNS))
+
+
+def event(revision, op, label, row):
+    return [revision, '2026-05-01 10:00:00', '山田', op, label] + list(row)
+
+
+SNAPSHOT = ledger([
+    ['2026-05-01', '収入', '会費', 3000, '5月分', '銀行口座'],
+    ['2026-05-02', '支出', '備品', 1200, 'ボール', '現金 (財布)'],
+    ['2026-05-03', '支出', '交通費', 800, '', '現金 (財布)'],
+])
+
+
+def test_replay_without_events_returns_snapshot():
+    assert replay(SNAPSHOT, journal([]), 0) is SNAPSHOT
+
+
+def test_replay_applies_insert_update_delete():
+    events = journal([
+        event(1, OP_UPDATE, 1, ['2026-05-02', '支出', '備品', 1500, 'ボール', '現金 (財布)']),
+        event(1, OP_DELETE, 2, ['2026-05-03', '支出', '交通費', 800, '', '現金 (財布)']),
+        event(2, OP_INSERT, 3, ['2026-05-04', '収入', '寄付', 5000, '', '銀行口座']),
+    ])
+    result = replay(SNAPSHOT, events, 0)
+    assert sorted(result.index) == [0, 1, 3]
+    assert result.loc[1, '金額'] == 1500
+    assert result.loc[3, '科目'] == '寄付'
+    assert result.loc[3, '日付'] == pd.Timestamp('2026-05-04')
+
+
+def test_replay_uses_last_event_per_row():
+    events = journal([
+        event(1, OP_INSERT, 3, ['2026-05-04', '収入', '寄付', 5000, '', '銀行口座']),
+        event(2, OP_UPDATE, 3, ['2026-05-04', '収入', '寄付', 6000, '', '銀行口座']),
+        event(3, OP_DELETE, 0, ['2026-05-01', '収入', '会費', 3000, '5月分', '銀行口座']),
+        event(4, OP_INSERT, 0, ['2026-05-05', '収入', '会費', 3000, '6月分', '銀行口座']),
+    ])
+    result = replay(SNAPSHOT, events, 0)
+    assert result.loc[3, '金額'] == 6000
+    assert result.loc[0, '備考'] == '6月分'
+    assert len(result) == 4
+
+
+def test_replay_skips_events_before_snapshot_revision():
+    events = journal([
+        event(1, OP_DELETE, 0, ['2026-05-01', '収入', '会費', 3000, '5月分', '銀行口座']),
+        event(2, OP_UPDATE, 1, ['2026-05-02', '支出', '備品', 1500, 'ボール', '現金 (財布)']),
+    ])
+    result = replay(SNAPSHOT, events, 1)
+    assert 0 in result.index
+    assert result.loc[1, '金額'] == 1500
+
+
+def test_replay_deleting_every_row():
+    events = journal([
+        event(1, OP_DELETE, label, row)
+        for label, row in zip(SNAPSHOT.index, SNAPSHOT.astype(str).values.tolist())
+    ])
+    assert len(replay(SNAPSHOT, events, 0)) == 0
+
+
+def test_build_events_round_trips_through_replay():
+    removed = SNAPSHOT.loc[[1, 2]]
+    added = pd.concat([
+        ledger([['2026-05-02', '支出', '備品', 1500, 'ボール', '現金 (財布)']], index=[1]),
+        ledger([['2026-05-06', '収入', '寄付', 2000, '', '銀行口座']], index=[3]),
+    ])
+    events = build_events(removed, added, 7, '山田', datetime(2026, 5, 6, 9, 0))
+    assert [e[3] for e in events] == [OP_DELETE, OP_UPDATE, OP_INSERT]
+    assert [e[4] for e in events] == [2, 1, 3]
+    assert events[0][1] == '2026-05-06 09:00:00'
+
+    result = replay(SNAPSHOT, journal(events), 6)
+    assert sorted(result.index) == [0, 1, 3]
+    assert result.loc[1, '金額'] == 1500
+
+
+def test_snapshot_rows_uses_row_id_column():
+    snapshot = SNAPSHOT.assign(行ID=['5', '2', '9'])
+    rows = snapshot_rows(snapshot, journal([]))
+    assert list(rows.index) == [5, 2, 9]
+    assert '行ID' not in rows.columns
+
+
+def test_snapshot_rows_numbers_rows_added_outside_the_app():
+    # 空・重複の行IDには、スナップショットの続きでジャーナルが使っていない番号を振る
+    snapshot = SNAPSHOT.assign(行ID=['4', '', '4'])
+    events = journal([event(1, OP_INSERT, 5, ['2026-05-04', '収入', '寄付', 5000, '', '銀行口座'])])
+    rows = snapshot_rows(snapshot, events)
+    assert list(rows.index) == [4, 6, 7]
+
+
+def test_snapshot_rows_keeps_legacy_snapshot():
+    assert snapshot_rows(SNAPSHOT, journal([])) is SNAPSHOT
+
+
+def test_next_label_does_not_reuse_deleted_ids():
+    # 最新の行（行ID 2）を削除しても、ジャーナル・アーカイブに残る行IDの続きを振る
+    current = SNAPSHOT.drop(index=2)
+    assert next_label(current) == 2
+    events = journal([event(1, OP_DELETE, 2, ['2026-05-03', '支出', '交通費', 800, '', '現金 (財布)'])])
+    assert next_label(current, journal([]), events) == 3
+    assert next_label(current, floor=8) == 8
+    assert next_label(SNAPSHOT.iloc[0:0]) == 0
+
+
+def test_renumber_inserts_keeps_updates():
+    removed = SNAPSHOT.loc[[1]]
+    added = pd.concat([
+        ledger([['2026-05-02', '支出', '備品', 1500, 'ボール', '現金 (財布)']], index=[1]),
+        ledger([['2026-05-06', '収入', '寄付', 2000, '', '銀行口座'],
+                ['2026-05-07', '収入', '寄付', 1000, '', '銀行口座']], index=[3, 4]),
+    ])
+    assert list(renumber_inserts(removed, added, 7).index) == [1, 7, 8]
+    assert renumber_inserts(removed, added, 3) is added
+
+
+def test_rebase_prefers_the_same_row_id():
+    # 同じ内容の行が複数あるときは、変更した行と同じ行IDの行を対象にする
+    row = ['2026-05-01', '収入', '会費', 3000, '', '銀行口座']
+    theirs = ledger([row, row, row], index=[0, 1, 2])
+    removed = theirs.loc[[2]]
+    added = ledger([row[:3] + [3500] + row[4:]], index=[2])
+    rebased_removed, rebased_added, conflicts = rebase_changes(removed, added, theirs)
+    assert list(rebased_removed.index) == [2]
+    assert list(rebased_added.index) == [2]
+    assert len(conflicts) == 0
+
+    # 同じ行IDの行が他の人に削除されていれば、同じ内容の別の行を対象にする
+    rebased_removed, _, _ = rebase_changes(removed, added, theirs.drop(index=2))
+    assert list(rebased_removed.index) == [0]
+
+
+def test_save_renumbers_rows_that_reuse_deleted_ids(monkeypatch):
+    written = {}
+    monkeypatch.setattr(sheets, 'get_sheet_revisions', lambda *names: {
+        sheets.SHEET_DATABASE: 3, sheets.SNAPSHOT_REVISION_KEY: 0, sheets.NEXT_LABEL_KEY: 5,
+    })
+    monkeypatch.setattr(sheets, '_append_journal', lambda events: written.setdefault('events', events) is events)
+    monkeypatch.setattr(sheets, '_seal_changes', lambda removed, added: True)
+    monkeypatch.setattr(sheets, 'set_sheet_revision', lambda name, revision=None: written.setdefault(name, revision))
+    monkeypatch.setattr(sheets, 'bump_sheet_revision', lambda name: 4)
+
+    # 行ID 3・4 の行は削除済み（アプリは残っている行の続きの 3 を振る）
+    added = ledger([['2026-05-06', '収入', '寄付', 2000, '', '銀行口座']], index=[3])
+    result = sheets.save_database_changes(pd.concat([SNAPSHOT, added]), SNAPSHOT.iloc[0:0], added, 3)
+    assert result.ok and not result.merged
+    assert list(result.added.index) == [5]
+    assert list(result.data.index) == [0, 1, 2, 5]
+    assert [e[4] for e in written['events']] == [5]
+    assert written[sheets.NEXT_LABEL_KEY] == 6
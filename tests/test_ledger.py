@@ -0,0 +1,68 @@
+"""台帳（Ledger）の履歴エディタの変更のテスト"""
+import pandas as pd
+
+from utils.ledger import DELETE_COLUMN, Ledger
+
+COLUMNS = ['日付', '種別', '科目', '金額', '備考', '決済方法']
+
+# 表示順（新しい順）は 行ラベル 3, 1, 2, 0
+LEDGER = Ledger(pd.DataFrame([
+    ['2026-05-01', '収入', '会費', 3000, '', '銀行口座'],
+    ['2026-05-03', '支出', '備品', 1200, 'ボール', '現金 (財布)'],
+    ['2026-05-02', '支出', '交通費', 800, '', '現金 (財布)'],
+    ['2026-05-04', '収入', '寄付', 5000, '', '銀行口座'],
+], columns=COLUMNS), 1)
+
+
+def test_no_changes():
+    removed, added = LEDGER.editor_changes({})
+    assert len(removed) == 0 and len(added) == 0
+    removed, added = LEDGER.editor_changes({'edited_rows': {}, 'added_rows': [], 'deleted_rows': []})
+    assert len(removed) == 0 and len(added) == 0
+
+
+def test_edited_row_keeps_its_label():
+    removed, added = LEDGER.editor_changes({'edited_rows': {1: {'金額': 1500}}})
+    assert list(removed.index) == [1]
+    assert list(added.index) == [1]
+    assert added.loc[1, '金額'] == 1500
+    assert removed.loc[1, '金額'] == 1200
+
+
+def test_edited_dates_are_typed():
+    _, added = LEDGER.editor_changes({'edited_rows': {'3': {'日付': '2026-04-30'}}})
+    assert added.loc[0, '日付'] == pd.Timestamp('2026-04-30')
+
+
+def test_reverted_edit_is_not_a_change():
+    removed, added = LEDGER.editor_changes({'edited_rows': {0: {'金額': 5000, '備考': ''}}})
+    assert len(removed) == 0 and len(added) == 0
+
+
+def test_deleted_rows_and_delete_checkbox():
+    state = {
+        'deleted_rows': [2],
+        'edited_rows': {
+            # 削除した行の編集は無視する
+            2: {'金額': 1},
+            0: {DELETE_COLUMN: True},
+        },
+    }
+    removed, added = LEDGER.editor_changes(state)
+    assert sorted(removed.index) == [2, 3]
+    assert len(added) == 0
+
+
+def test_added_rows_get_new_labels():
+    state = {'added_rows': [
+        {'日付': '2026-05-05', '種別': '支出', '科目': '雑費', '金額': 300, '決済方法': '現金 (財布)'},
+        # 空の行と、削除チェックを付けた行は追加しない
+        {'日付': None, '金額': None},
+        {'日付': '2026-05-06', '種別': '支出', '科目': '雑費', '金額': 100, DELETE_COLUMN: True},
+    ]}
+    removed, added = LEDGER.editor_changes(state)
+    assert len(removed) == 0
+    assert list(added.index) == [4]
+    assert added.loc[4, '金額'] == 300
+    assert added.loc[4, '備考'] == ''
+    assert added.loc[4, '日付'] == pd.Timestamp('2026-05-05')
@@ -0,0 +1,86 @@
+"""merge_rows（行単位の3-wayマージ）のテスト"""
+import pandas as pd
+
+from utils.merge import merge_rows
+
+COLUMNS = ['日付', '科目', '金額']
+
+
+def frame(rows, index=None):
+    return pd.DataFrame(rows, columns=COLUMNS, index=index)
+
+
+BASE = frame([
+    ['2026-05-01', '会費', 3000],
+    ['2026-05-02', '備品', 1200],
+    ['2026-05-03', '交通費', 800],
+])
+
+
+def rows(df):
+    return df.astype(str).values.tolist()
+
+
+def test_my_changes_apply_on_top_of_theirs():
+    # 他の人は末尾に1行追加、自分は1行目を変更・3行目を削除・1行追加
+    theirs = pd.concat([BASE, frame([['2026-05-04', '寄付', 5000]])], ignore_index=True)
+    mine = frame([
+        ['2026-05-01', '会費', 3500],
+        ['2026-05-02', '備品', 1200],
+        ['2026-05-05', '雑費', 300],
+    ], index=[0, 1, 3])
+    merged, conflicts = merge_rows(BASE, mine, theirs, COLUMNS)
+    assert rows(merged) == [
+        ['2026-05-01', '会費', '3500'],
+        ['2026-05-02', '備品', '1200'],
+        ['2026-05-04', '寄付', '5000'],
+        ['2026-05-05', '雑費', '300'],
+    ]
+    assert len(conflicts) == 0
+
+
+def test_rows_are_matched_by_content_not_position():
+    # 他の人が並べ替えても、変更前と同じ内容の行に適用する
+    theirs = BASE.iloc[::-1].reset_index(drop=True)
+    mine = BASE.copy()
+    mine.loc[1, '金額'] = 1500
+    merged, conflicts = merge_rows(BASE, mine, theirs, COLUMNS)
+    assert rows(merged)[1] == ['2026-05-02', '備品', '1500']
+    assert rows(merged)[0][1] == '交通費'
+    assert len(conflicts) == 0
+
+
+def test_row_changed_by_someone_else_is_a_conflict():
+    theirs = BASE.copy()
+    theirs.loc[1, '金額'] = 2000
+    mine = BASE.copy()
+    mine.loc[1, '金額'] = 1500
+    merged, conflicts = merge_rows(BASE, mine, theirs, COLUMNS)
+    assert rows(merged) == rows(theirs)
+    assert rows(conflicts) == [['2026-05-02', '備品', '1500']]
+
+
+def test_delete_of_row_deleted_by_someone_else_is_a_conflict():
+    theirs = BASE.drop(index=2).reset_index(drop=True)
+    mine = BASE.drop(index=2)
+    merged, conflicts = merge_rows(BASE, mine, theirs, COLUMNS)
+    assert rows(merged) == rows(theirs)
+    assert rows(conflicts) == [['2026-05-03', '交通費', '800']]
+
+
+def test_duplicate_rows_are_updated_one_at_a_time():
+    base = frame([['2026-05-01', '会費', 3000], ['2026-05-01', '会費', 3000]])
+    mine = base.drop(index=0)
+    merged, conflicts = merge_rows(base, mine, base.copy(), COLUMNS)
+    assert rows(merged) == [['2026-05-01', '会費', '3000']]
+    assert len(conflicts) == 0
+
+
+def test_dates_and_amounts_compare_after_normalization():
+    # シートから読んだ文字列と、編集後の日付・数値を同じ行とみなす
+    theirs = frame([['2026-05-01 00:00:00', '会費', '3000']])
+    base = frame([[pd.Timestamp('2026-05-01'), '会費', 3000.0]])
+    mine = base.drop(index=0)
+    merged, conflicts = merge_rows(base, mine, theirs, COLUMNS)
+    assert len(merged) == 0
+    assert len(conflicts) == 0
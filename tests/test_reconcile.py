@@ -0,0 +1,83 @@
+"""明細と取引の対応付け（_merge_exact / _merge_splits）のテスト"""
+import numpy as np
+
+from utils.reconcile import _cents, _days, _merge_exact, _merge_splits
+
+
+def days(*dates):
+    return _days(list(dates))
+
+
+def test_exact_pairs_same_amount_within_tolerance():
+    s_amt = _cents([500, 1200, 800])
+    s_day = days('2026-05-01', '2026-05-02', '2026-05-03')
+    l_amt = _cents([1200, 500, 800])
+    l_day = days('2026-05-04', '2026-05-01', '2026-05-10')
+    pairs = _merge_exact(s_amt, s_day, l_amt, l_day, tolerance=3)
+    assert sorted(pairs) == [(0, 1), (1, 0)]
+
+
+def test_exact_pairs_each_row_once_and_nearest_in_order():
+    # 同じ金額が複数あれば、日付順に1対1で対応付ける
+    s_amt = _cents([500, 500])
+    s_day = days('2026-05-01', '2026-05-08')
+    l_amt = _cents([500, 500, 500])
+    l_day = days('2026-05-02', '2026-05-07', '2026-05-20')
+    pairs = _merge_exact(s_amt, s_day, l_amt, l_day, tolerance=2)
+    assert sorted(pairs) == [(0, 0), (1, 1)]
+
+
+def test_exact_skips_rows_outside_tolerance():
+    s_amt = _cents([500, 500])
+    s_day = days('2026-05-01', '2026-05-20')
+    l_amt = _cents([500])
+    l_day = days('2026-05-19')
+    assert _merge_exact(s_amt, s_day, l_amt, l_day, tolerance=1) == [(1, 0)]
+
+
+def test_exact_compares_cents():
+    s_amt = _cents([0.1 + 0.2])
+    l_amt = _cents([0.3])
+    day = days('2026-05-01')
+    assert _merge_exact(s_amt, day, l_amt, day, tolerance=0) == [(0, 0)]
+
+
+def test_split_matches_one_row_to_several():
+    # 明細の1件（3000円の入金）を、取引の1000円 + 2000円と対応付ける
+    one_amt = _cents([3000])
+    one_day = days('2026-05-05')
+    one_free = np.array([True])
+    many_amt = _cents([1000, 500, 2000, 1000])
+    many_day = days('2026-05-04', '2026-05-05', '2026-05-06', '2026-05-30')
+    many_free = np.array([True, True, True, True])
+    groups = _merge_splits(one_amt, one_day, one_free, many_amt, many_day, many_free, tolerance=2)
+    assert len(groups) == 1
+    i, chosen = groups[0]
+    assert i == 0
+    assert sorted(chosen) == [0, 2]
+    assert not one_free[0]
+    assert list(many_free) == [False, True, False, True]
+
+
+def test_split_ignores_used_rows_and_opposite_sign():
+    one_amt = _cents([-3000])
+    one_day = days('2026-05-05')
+    one_free = np.array([True])
+    many_amt = _cents([-1000, -2000, 1000, -2000])
+    many_day = days('2026-05-05', '2026-05-05', '2026-05-05', '2026-05-05')
+    many_free = np.array([True, False, True, True])
+    groups = _merge_splits(one_amt, one_day, one_free, many_amt, many_day, many_free, tolerance=0)
+    assert groups == [(0, [0, 3])]
+
+
+def test_split_needs_at_least_two_rows():
+    one_amt = _cents([3000])
+    one_day = days('2026-05-05')
+    one_free = np.array([True])
+    many_amt = _cents([3000, 1000])
+    many_day = days('2026-05-05', '2026-05-05')
+    many_free = np.array([True, True])
+    groups = _merge_splits(one_amt, one_day, one_free, many_amt, many_day, many_free, tolerance=0)
+    assert groups == []
+    assert one_free[0]
+    assert list(many_free) == [True, True]
@@ -0,0 +1,89 @@
+"""検索インデックス（LedgerIndex）のテスト"""
+from datetime import date
+
+import pandas as pd
+
+from utils.search import LedgerIndex, tokenize
+
+
+def ledger(rows, index=None):
+    df = pd.DataFrame(rows, columns=['日付', '種別', '科目', '金額', '備考', '決済方法'], index=index)
+    return df.assign(日付=pd.to_datetime(df['日付']))
+
+
+LEDGER = ledger([
+    ['2026-05-01', '収入', '会費', 3000, '5月分 会費', '銀行口座'],
+    ['2026-05-03', '支出', '備品', 1200, 'ボール購入', '現金 (財布)'],
+    ['2026-05-02', '支出', '交通費', 800, '合宿 バス', '現金 (財布)'],
+    ['2026-05-10', '支出', '備品', 400, 'Ball ネット', '銀行口座'],
+    [None, '収入', '寄付', 500, '', '現金 (財布)'],
+])
+
+
+def brute_force(df, start=None, end=None, keyword='', **filters):
+    """条件を行ごとに確かめた結果（日付の新しい順）"""
+    mask = pd.Series(True, index=df.index)
+    for col, values in filters.items():
+        if values:
+            mask &= df[col].isin(values)
+    if start is not None or end is not None:
+        mask &= df['日付'].notna()
+    if start is not None:
+        mask &= df['日付'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df['日付'] <= pd.Timestamp(end)
+    if keyword.strip():
+        mask &= df['備考'].str.lower().str.contains(keyword.strip().lower(), regex=False)
+    hits = df[mask]
+    return hits.assign(順=hits['日付'].fillna(pd.Timestamp.min)).sort_values('順', ascending=False, kind='stable').index.tolist()
+
+
+def test_tokenize_uses_words_and_bigrams():
+    assert tokenize('Ball ネット') == {'ba', 'al', 'll', 'ネッ', 'ット'}
+    assert tokenize('a b') == {'a', 'b'}
+
+
+def test_date_range_is_inclusive_and_newest_first():
+    index = LedgerIndex.from_ledger(LEDGER)
+    assert index.date_range(date(2026, 5, 2), date(2026, 5, 3)) == [1, 2]
+    # 日付のない行は期間に含めない
+    assert index.date_range() == [3, 1, 2, 0]
+    assert index.search() == [3, 1, 2, 0, 4]
+
+
+def test_keyword_search():
+    index = LedgerIndex.from_ledger(LEDGER)
+    assert index.keyword('ボール') == {1}
+    assert index.keyword('ball') == {3}
+    assert index.keyword('バ') == {2}
+    assert index.keyword('ネットワーク') == set()
+
+
+def test_search_matches_brute_force():
+    index = LedgerIndex.from_ledger(LEDGER)
+    cases = [
+        {},
+        {'種別': ['支出']},
+        {'科目': ['備品', '寄付'], '決済方法': ['銀行口座']},
+        {'start': date(2026, 5, 2), '種別': ['支出']},
+        {'end': date(2026, 5, 5), 'keyword': '会費'},
+        {'keyword': 'ボ', '科目': ['備品']},
+    ]
+    for conditions in cases:
+        assert index.search(**conditions) == brute_force(LEDGER, **conditions), conditions
+
+
+def test_incremental_apply_matches_rebuild():
+    index = LedgerIndex.from_ledger(LEDGER)
+    removed = LEDGER.loc[[1, 4]]
+    added = ledger([
+        ['2026-05-03', '支出', '備品', 1500, 'ボール 2個', '銀行口座'],
+        ['2026-04-28', '収入', '会費', 2000, '4月分', '銀行口座'],
+    ], index=[1, 5])
+    index.apply(removed, added)
+    rebuilt = LedgerIndex.from_ledger(pd.concat([LEDGER.drop(index=[1, 4]), added]))
+    assert index.dates == rebuilt.dates
+    assert index.postings == rebuilt.postings
+    assert index.tokens == rebuilt.tokens
+    assert index.notes == rebuilt.notes
+    assert index.values('科目') == ['交通費', '会費', '備品']
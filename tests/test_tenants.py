@@ -0,0 +1,104 @@
+"""テナントのキャッシュ（estimate_bytes・TenantRegistry）のテスト"""
+import threading
+import time
+
+import pandas as pd
+
+from utils.ledger import Ledger
+from utils.tenants import TenantRegistry, estimate_bytes
+
+LEDGER = pd.DataFrame({
+    '日付': pd.to_datetime(['2026-05-01', '2026-05-02', '2026-05-03'] * 100),
+    '種別': ['収入', '支出', '支出'] * 100, '科目': ['会費', '備品', '交通費'] * 100,
+    '金額': [3000, 1200, 800] * 100, '備考': ['5月分', 'ボール', ''] * 100,
+    '決済方法': ['銀行口座', '現金 (財布)', '現金 (財布)'] * 100,
+})
+
+
+def test_ledger_counts_derived_structures():
+    ledger = Ledger(LEDGER, 1)
+    bare = estimate_bytes(ledger)
+    assert bare > estimate_bytes(ledger.frame)
+    ledger.search_index
+    ledger.display_frame(['日付', '種別', '科目', '金額'])
+    assert estimate_bytes(ledger) > bare
+
+
+def test_shared_objects_are_counted_once():
+    frame = LEDGER.copy()
+    assert estimate_bytes([frame, frame]) < 2 * estimate_bytes(frame)
+
+
+def test_figures_are_counted_by_their_data():
+    class Figure:
+        def to_plotly_json(self):
+            return {}
+
+        def to_json(self):
+            return 'x' * 5000
+
+    assert estimate_bytes({'balance': Figure()}) >= 5000
+
+
+def test_newer_version_drops_superseded_entries():
+    registry = TenantRegistry()
+    registry.cached('a', ('guest_snapshot', 1), lambda: 'old', supersedes=('guest_snapshot',))
+    registry.cached('a', ('report', 1), lambda: 'report')
+    registry.cached('a', ('guest_snapshot', 2), lambda: 'new', supersedes=('guest_snapshot',))
+    handle = registry.handle('a')
+    assert list(handle.cache) == [('report', 1), ('guest_snapshot', 2)]
+    assert handle.nbytes == sum(size for _, size in handle.cache.values())
+
+
+def test_least_recently_used_tenant_is_dropped():
+    registry = TenantRegistry(max_tenants=2)
+    registry.cached('a', 'x', lambda: b'a')
+    registry.cached('b', 'x', lambda: b'b')
+    # a を使うと、次に破棄されるのは b
+    assert registry.cached('a', 'x', lambda: b'new') == b'a'
+    registry.cached('c', 'x', lambda: b'c')
+    assert list(registry.handles) == ['a', 'c']
+
+
+def test_byte_limit_clears_other_tenants_first():
+    registry = TenantRegistry(max_bytes=250)
+    registry.cached('a', 1, lambda: b'x' * 100)
+    registry.cached('b', 1, lambda: b'x' * 100)
+    registry.cached('b', 2, lambda: b'x' * 100)
+    assert registry.handle('a').nbytes == 0
+    assert registry.total_bytes() == 200
+
+    # 現在のテナントだけで超える場合は古いキャッシュから破棄し、最新の1件は残す
+    registry.cached('b', 3, lambda: b'x' * 300)
+    assert list(registry.handle('b').cache) == [3]
+    assert registry.total_bytes() == 300
+
+
+def test_lookup_refreshes_the_entry():
+    registry = TenantRegistry(max_bytes=250)
+    registry.cached('a', 1, lambda: b'x' * 100)
+    registry.cached('a', 2, lambda: b'x' * 100)
+    registry.cached('a', 1, lambda: b'')
+    registry.cached('a', 3, lambda: b'x' * 100)
+    assert list(registry.handle('a').cache) == [1, 3]
+
+
+def test_concurrent_requests_compute_once():
+    registry = TenantRegistry()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return b'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.cached('a', 'k', compute)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [b'value'] * 5
+    assert registry.building == {}
@@ -0,0 +1,75 @@
+"""残高の推移（LTTB・差分更新・総資産）のテスト"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.summary import kpi_summary
+from utils.timeline import TOTAL_LABEL, BalanceTimeline, lttb
+
+
+def ledger(rows):
+    return pd.DataFrame(rows, columns=['日付', '種別', '科目', '金額', '備考', '決済方法'])
+
+
+LEDGER = ledger([
+    ['2026-05-01', '収入', '会費', 3000, '', '銀行口座'],
+    ['2026-05-01', '収入', '会費', 1000, '', '現金 (財布)'],
+    ['2026-05-03', '支出', '備品', 1200, '', '現金 (財布)'],
+    ['2026-05-10', '支出', '交通費', 800, '', '銀行口座'],
+    ['', '収入', '寄付', 500, '日付なし', '現金 (財布)'],
+    ['2026-05-12', '支出', '雑費', 100, '', 'PayPay'],
+])
+
+
+def test_lttb_keeps_endpoints_and_point_count():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50)
+    keep = lttb(x, y, 100)
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_lttb_keeps_spikes():
+    x = np.arange(500, dtype=float)
+    y = np.zeros(500)
+    y[123] = 100
+    y[377] = -100
+    keep = lttb(x, y, 20)
+    assert 123 in keep
+    assert 377 in keep
+
+
+def test_lttb_returns_all_points_when_few():
+    x = np.arange(5, dtype=float)
+    assert list(lttb(x, x, 10)) == [0, 1, 2, 3, 4]
+    assert list(lttb(x, x, 2)) == [0, 1, 2, 3, 4]
+
+
+def test_balance_is_cumulative_per_method():
+    frame = BalanceTimeline.from_ledger(LEDGER).to_frame(['現金 (財布)', '銀行口座'])
+    assert list(frame.index.strftime('%m-%d')) == ['05-01', '05-03', '05-10', '05-12']
+    # 日付が読めない500円はすべての日の財布の残高に含まれる
+    assert list(frame['現金 (財布)']) == [1500, 300, 300, 300]
+    assert list(frame['銀行口座']) == [3000, 3000, 2200, 2200]
+
+
+def test_last_total_matches_kpi_total_assets():
+    frame = BalanceTimeline.from_ledger(LEDGER).to_frame(['銀行口座'])
+    assert frame[TOTAL_LABEL].iloc[-1] == pytest.approx(kpi_summary(LEDGER)['総資産'])
+
+
+def test_incremental_update_matches_rebuild():
+    timeline = BalanceTimeline.from_ledger(LEDGER)
+    removed = LEDGER.iloc[[2, 4]]
+    added = ledger([
+        ['2026-05-02', '支出', '備品', 1500, '', '現金 (財布)'],
+        ['2026-04-30', '収入', '繰越', 10000, '', '銀行口座'],
+    ])
+    timeline.apply(removed, added)
+    rebuilt = BalanceTimeline.from_ledger(pd.concat([LEDGER.drop(index=[2, 4]), added]))
+    methods = ['現金 (財布)', '銀行口座', 'PayPay']
+    a = timeline.to_frame(methods)
+    b = rebuilt.to_frame(methods)
+    # 削除で入出金が0になった日は残るため、再構築した日付の行で比べる
+    pd.testing.assert_frame_equal(a.loc[b.index], b, check_freq=False)
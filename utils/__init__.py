@@ -1,9 +1,15 @@
 # utilsパッケージ初期化
 from .sheets import (
     load_database, save_database,
+    load_database_with_revision, save_database_with_revision,
+    save_database_changes, compact_database_journal, load_audit_log,
+    import_database_file,
     load_members, save_members,
     load_drivers, save_drivers,
     load_collection, save_collection,
     load_transport_balance, save_transport_balance,
-    add_transport_balance_entry
+    add_transport_balance_entry,
+    load_budget, save_budget,
+    load_concurrently,
+    get_connection_stats
 )
@@ -0,0 +1,268 @@
+"""
+シートのバックアップと復元
+各シートの内容をローカルのgzip圧縮ファイルに保存する。完全バックアップの後は前回からの行の差分だけを保存し、
+復元は完全バックアップに差分を順に適用した内容を1回の書き込みでシートに戻す
+
+保存先: <BACKUP_DIR>/<テナント>/<シート>/<日時>.r<リビジョン>.<full|delta>.json.gz
+"""
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+from typing import NamedTuple
+
+import pandas as pd
+
+from .sheets import (
+    SHEET_BUDGET, SHEET_COLLECTION, SHEET_DATABASE, SHEET_DRIVERS, SHEET_MEMBERS, SHEET_TRANSPORT_BALANCE,
+    _to_sheet_values, get_sheet_revisions, load_database_with_revision, load_sheet_as_dataframe,
+    replace_database, save_dataframe_to_sheet
+)
+from .tenants import current_tenant
+
+BACKUP_DIR = 'backups'
+
+BACKUP_SHEETS = [
+    SHEET_DATABASE, SHEET_MEMBERS, SHEET_DRIVERS, SHEET_COLLECTION, SHEET_TRANSPORT_BALANCE, SHEET_BUDGET
+]
+
+# 差分がこの数たまったら次は完全バックアップにする（復元時に適用する差分の数の上限）
+FULL_EVERY = 24
+
+# 保持期間: この日数以内のバックアップはすべて残し、それより古いものは月ごとに完全バックアップを1つだけ残す
+KEEP_DAYS = 30
+KEEP_MONTHS = 12
+
+# 差分の計算で行どうしを比較する回数の上限（超える場合は変更範囲をまとめて置き換える）
+DIFF_LIMIT = 4_000_000
+
+TIME_FORMAT = '%Y%m%dT%H%M%S%f'
+
+
+class BackupEntry(NamedTuple):
+    """バックアップファイル"""
+    sheet: str
+    time: datetime
+    revision: int
+    # 'full'（完全）/ 'delta'（前回からの差分）
+    kind: str
+    path: str
+
+
+def _sheet_dir(sheet: str, root: str) -> str:
+    return os.path.join(root, current_tenant(), sheet)
+
+
+def _parse_entry(sheet: str, directory: str, filename: str):
+    parts = filename.split('.')
+    if len(parts) != 5 or parts[3:] != ['json', 'gz'] or parts[2] not in ('full', 'delta'):
+        return None
+    try:
+        return BackupEntry(sheet, datetime.strptime(parts[0], TIME_FORMAT), int(parts[1][1:]),
+                           parts[2], os.path.join(directory, filename))
+    except ValueError:
+        return None
+
+
+def list_backups(sheet: str, root: str = BACKUP_DIR) -> list:
+    """シートのバックアップを古い順に取得"""
+    directory = _sheet_dir(sheet, root)
+    if not os.path.isdir(directory):
+        return []
+    entries = [_parse_entry(sheet, directory, name) for name in os.listdir(directory)]
+    return sorted((e for e in entries if e is not None), key=lambda e: e.time)
+
+
+def _read(path: str) -> dict:
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write(path: str, payload: dict):
+    # 書き込み途中のファイルを残さないよう、一時ファイルに書いてから置き換える
+    temp = path + '.tmp'
+    with gzip.open(temp, 'wt', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temp, path)
+
+
+# ======================
+# 行の差分
+# ======================
+
+def diff_rows(old: list, new: list) -> list:
+    """old を new にする置き換えの列 [[開始, 終了, 新しい行], ...]（old の行番号、昇順）"""
+    old_keys = [tuple(row) for row in old]
+    new_keys = [tuple(row) for row in new]
+    # 先頭・末尾の一致部分は比較しない（追記・1行の変更はここで範囲が決まる）
+    start = 0
+    limit = min(len(old_keys), len(new_keys))
+    while start < limit and old_keys[start] == new_keys[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old_keys[-1 - end] == new_keys[-1 - end]:
+        end += 1
+    a = old_keys[start:len(old_keys) - end]
+    b = new_keys[start:len(new_keys) - end]
+    if not a and not b:
+        return []
+    if len(a) * len(b) > DIFF_LIMIT:
+        return [[start, start + len(a), new[start:len(new) - end]]]
+
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    return [
+        [start + i1, start + i2, new[start + j1:start + j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal'
+    ]
+
+
+def apply_ops(rows: list, ops: list) -> list:
+    """diff_rows の置き換えを適用"""
+    rows = list(rows)
+    for i1, i2, replacement in reversed(ops):
+        rows[i1:i2] = replacement
+    return rows
+
+
+# ======================
+# バックアップ
+# ======================
+
+def _chain(entries: list, upto: int) -> list:
+    """entries[upto] を復元するのに必要な完全バックアップと差分"""
+    start = upto
+    while start > 0 and entries[start].kind != 'full':
+        start -= 1
+    if entries[start].kind != 'full':
+        raise ValueError(f"{entries[upto].path} の元になる完全バックアップがありません")
+    return entries[start:upto + 1]
+
+
+def _restore_rows(entries: list, upto: int):
+    """entries[upto] 時点の (ヘッダー, 行)"""
+    header, rows = None, []
+    for entry in _chain(entries, upto):
+        payload = _read(entry.path)
+        header = payload['header']
+        rows = payload['rows'] if entry.kind == 'full' else apply_ops(rows, payload['ops'])
+    return header, rows
+
+
+def _current_rows(sheet: str):
+    """シートの現在の (ヘッダー, 行)（取引履歴はジャーナルを再生した内容で、行ラベルを行IDの列に含める）"""
+    if sheet == SHEET_DATABASE:
+        df = load_database_with_revision()[0]
+        df = df.assign(行ID=df.index.to_numpy())
+    else:
+        df = load_sheet_as_dataframe(sheet)
+    return [str(c) for c in df.columns], _to_sheet_values(df)
+
+
+def backup_sheet(sheet: str, revision: int, root: str = BACKUP_DIR, now: datetime = None,
+                 current: tuple = None) -> BackupEntry:
+    """シートの現在の内容（current があればその (ヘッダー, 行)）を保存
+
+    前回の完全バックアップからの差分が小さければ差分で保存する
+    """
+    now = now or datetime.now()
+    header, rows = current or _current_rows(sheet)
+    entries = list_backups(sheet, root)
+
+    kind, payload = 'full', {'header': header, 'rows': rows}
+    if entries:
+        deltas = 0
+        while deltas < len(entries) and entries[-1 - deltas].kind == 'delta':
+            deltas += 1
+        last_header, last_rows = _restore_rows(entries, len(entries) - 1)
+        if deltas < FULL_EVERY and last_header == header:
+            ops = diff_rows(last_rows, rows)
+            # 差分が完全バックアップの半分を超えるなら完全バックアップにする
+            if sum(len(replacement) + 1 for _, _, replacement in ops) <= len(rows) // 2:
+                kind, payload = 'delta', {'header': header, 'ops': ops}
+
+    directory = _sheet_dir(sheet, root)
+    os.makedirs(directory, exist_ok=True)
+    entry = BackupEntry(sheet, now, revision, kind, os.path.join(
+        directory, f"{now.strftime(TIME_FORMAT)}.r{revision}.{kind}.json.gz"
+    ))
+    _write(entry.path, dict(payload, sheet=sheet, time=now.isoformat(), revision=revision))
+    return entry
+
+
+def backup_all(root: str = BACKUP_DIR, sheets: list = None, now: datetime = None) -> list:
+    """前回のバックアップから内容が変わったシートだけを保存し、保持期間を過ぎたものを削除
+
+    シートを直接編集してもリビジョンは変わらないため、リビジョンが同じでも内容を前回のバックアップと比べる
+    """
+    now = now or datetime.now()
+    sheets = sheets or BACKUP_SHEETS
+    revisions = get_sheet_revisions(*sheets)
+    created = []
+    for sheet in sheets:
+        entries = list_backups(sheet, root)
+        current = _current_rows(sheet)
+        if (entries and entries[-1].revision == revisions[sheet]
+                and _restore_rows(entries, len(entries) - 1) == current):
+            continue
+        created.append(backup_sheet(sheet, revisions[sheet], root, now, current))
+        prune_backups(sheet, root, now)
+    return created
+
+
+def prune_backups(sheet: str, root: str = BACKUP_DIR, now: datetime = None) -> int:
+    """保持期間を過ぎたバックアップを削除（削除したファイル数を返す）
+
+    KEEP_DAYS 日以内と最新のものは差分を含めてすべて残し、それより古いものは
+    直近 KEEP_MONTHS か月の各月で最初の完全バックアップだけを残す
+    """
+    now = now or datetime.now()
+    entries = list_backups(sheet, root)
+    if not entries:
+        return 0
+
+    recent = now - timedelta(days=KEEP_DAYS)
+    # 最新の完全バックアップ以降は必ず残す（最新の状態の復元に必要）
+    fulls = [i for i, e in enumerate(entries) if e.kind == 'full']
+    latest_full = fulls[-1] if fulls else len(entries)
+    # 期間内のバックアップの元になる完全バックアップ以降も残す
+    first_recent = next((i for i, e in enumerate(entries) if e.time >= recent), len(entries))
+    keep_from = min(latest_full, max((i for i in fulls if i <= first_recent), default=first_recent))
+
+    months = set()
+    oldest_month = (now.year * 12 + now.month - 1) - KEEP_MONTHS
+    removed = 0
+    for i, entry in enumerate(entries[:keep_from]):
+        month = entry.time.year * 12 + entry.time.month - 1
+        if entry.kind == 'full' and month > oldest_month and month not in months:
+            months.add(month)
+            continue
+        os.remove(entry.path)
+        removed += 1
+    return removed
+
+
+# ======================
+# 復元
+# ======================
+
+def backup_state(sheet: str, at: datetime = None, root: str = BACKUP_DIR):
+    """at（省略すると最新）の時点のバックアップの (エントリ, 内容のDataFrame)"""
+    entries = list_backups(sheet, root)
+    if at is not None:
+        entries = [e for e in entries if e.time <= at]
+    if not entries:
+        raise ValueError(f"シート '{sheet}' の{'指定した時点以前の' if at is not None else ''}バックアップがありません")
+    header, rows = _restore_rows(entries, len(entries) - 1)
+    return entries[-1], pd.DataFrame(rows, columns=header)
+
+
+def restore_sheet(sheet: str, at: datetime = None, root: str = BACKUP_DIR):
+    """シートを at の時点のバックアップの内容に戻す（戻す前の内容もバックアップしておく）
+
+    取引履歴はバックアップの行IDのままスナップショットとして書き込み、それまでのジャーナルはアーカイブに残す
+    """
+    entry, df = backup_state(sheet, at, root)
+    backup_sheet(sheet, get_sheet_revisions(sheet)[sheet], root)
+    ok = replace_database(df) if sheet == SHEET_DATABASE else save_dataframe_to_sheet(df, sheet)
+    return ok, entry, df
@@ -0,0 +1,67 @@
+"""
+予算管理
+会計年度 × 科目ごとの支出実績を集計キューブから1回だけ作成し、
+以降は取引の追加・削除ごとに該当する1件のカウンタだけを更新する
+"""
+import pandas as pd
+
+from .export import FISCAL_YEAR_START_MONTH, fiscal_year_of
+
+BUDGET_COLUMNS = ['年度', '科目', '予算']
+
+# 予算の消化率がこの割合を超えたら注意を表示
+WARNING_RATIO = 0.8
+
+
+class BudgetTracker:
+    """会計年度 × 科目ごとの支出実績カウンタ"""
+
+    def __init__(self):
+        # {(年度, 科目): 支出合計}
+        self.actual = {}
+
+    @classmethod
+    def from_cube(cls, cube) -> 'BudgetTracker':
+        """集計キューブから作成（取引履歴は走査しない）"""
+        tracker = cls()
+        for (year, month, kind, category, _method), (total, _count) in cube.cells.items():
+            if kind == '支出' and year > 0:
+                key = (year if month >= FISCAL_YEAR_START_MONTH else year - 1, category)
+                tracker.actual[key] = tracker.actual.get(key, 0) + total
+        return tracker
+
+    def add(self, df: pd.DataFrame, sign: int = 1):
+        """行ごとに該当するカウンタを更新（sign=-1で削除）"""
+        if len(df) == 0:
+            return
+        for date, kind, category, amount in zip(df['日付'], df['種別'], df['科目'], df['金額']):
+            if kind != '支出' or pd.isna(date):
+                continue
+            key = (fiscal_year_of(date), category)
+            self.actual[key] = self.actual.get(key, 0) + sign * amount
+
+    def apply(self, removed: pd.DataFrame, added: pd.DataFrame):
+        """変更（削除された行・追加された行）を反映"""
+        self.add(removed, sign=-1)
+        self.add(added)
+
+    def spent(self, fiscal_year: int, category: str) -> float:
+        """年度・科目の支出実績"""
+        return self.actual.get((fiscal_year, category), 0)
+
+    def report(self, budget: pd.DataFrame, fiscal_year: int, categories: list) -> pd.DataFrame:
+        """予算と実績の対比表（科目, 予算, 実績, 残り, 消化率）"""
+        budget = budget[budget['年度'] == fiscal_year] if len(budget) > 0 else budget
+        amounts = dict(zip(budget['科目'], budget['予算'])) if len(budget) > 0 else {}
+        rows = []
+        for category in categories:
+            planned = float(amounts.get(category, 0) or 0)
+            spent = self.spent(fiscal_year, category)
+            rows.append({
+                '科目': category,
+                '予算': planned,
+                '実績': spent,
+                '残り': planned - spent,
+                '消化率': spent / planned if planned > 0 else None,
+            })
+        return pd.DataFrame(rows)
@@ -0,0 +1,216 @@
+"""
+遠征の配車（ドライバーの選択と同乗者の割り当て）
+ガソリン代 + ETC の合計が小さくなるように、貪欲法で車を選んで乗車地ごとに同乗者を割り当て、
+寄り道だけのために回っている乗車地を他の車に移して改善する（60人・15台でも数ミリ秒）
+
+道路の距離は持っていないため、1台の走行距離は
+    遠征の往復距離 + 寄り道距離 × (ドライバーの乗車地以外に寄る乗車地の数)
+で見積もる
+"""
+from typing import NamedTuple
+
+import pandas as pd
+
+# ドライバーを含む乗車定員（シートに未入力の場合）
+DEFAULT_SEATS = 5
+
+
+class Car(NamedTuple):
+    """配車の候補の車"""
+    name: str
+    fuel: str
+    efficiency: float
+    seats: int
+    location: str
+    # ドライバー自身が参加者か（選ばれなければ同乗者になる）
+    participant: bool
+    # 1kmあたりのガソリン代
+    cost_per_km: float
+
+
+class CarpoolPlan(NamedTuple):
+    """配車の結果"""
+    # {ドライバー: [同乗者]}（選んだ順）
+    riders: dict
+    # {ドライバー: 寄る乗車地のリスト}
+    stops: dict
+    # {ドライバー: 走行距離(km)}
+    distances: dict
+    # ガソリン代 + ETC の合計
+    total_cost: float
+    # 席が足りず割り当てられなかった参加者
+    unassigned: list
+
+
+def build_cars(drivers: pd.DataFrame, participants: list, prices: dict) -> list:
+    """ドライバーの表から候補の車を作成
+
+    prices: {燃料タイプ: 円/L}（未知の燃料タイプはレギュラーの単価）
+    """
+    cars = []
+    names = set(participants)
+    for row in drivers.itertuples(index=False):
+        row = row._asdict()
+        # 表で空欄にした数値は NaN になるため、未入力として扱う
+        efficiency = pd.to_numeric(row.get('燃費'), errors='coerce')
+        efficiency = 0.0 if pd.isna(efficiency) else float(efficiency)
+        seats = pd.to_numeric(row.get('定員'), errors='coerce')
+        seats = DEFAULT_SEATS if pd.isna(seats) else int(seats)
+        if efficiency <= 0 or seats < 1:
+            continue
+        fuel = row.get('燃料タイプ', 'レギュラー')
+        price = prices.get(fuel, prices.get('レギュラー', 0))
+        cars.append(Car(
+            name=row['名前'],
+            fuel=fuel,
+            efficiency=efficiency,
+            seats=seats,
+            location=str(row.get('乗車地') or ''),
+            participant=row['名前'] in names,
+            cost_per_km=price / efficiency,
+        ))
+    return cars
+
+
+def _fixed_cost(car: Car, distance: float, etc: float) -> float:
+    """寄り道を除いた1台の費用"""
+    return distance * car.cost_per_km + etc
+
+
+def _select_cars(cars: list, people: int, distance: float, etc: float) -> list:
+    """席が足りるまで、増える席1つあたりの費用が安い車から選ぶ
+
+    people: 運ぶ参加者の人数（参加者のドライバーを選ぶと運転する分だけ減る）
+    """
+    def gain(car):
+        # 運べる同乗者の数 + ドライバー自身が参加者なら乗せる必要がなくなる1人
+        return car.seats - 1 + (1 if car.participant else 0)
+
+    candidates = sorted(
+        (car for car in cars if gain(car) > 0),
+        key=lambda car: (_fixed_cost(car, distance, etc) / gain(car), -car.seats)
+    )
+    chosen = []
+    capacity = 0
+    need = people
+    for car in candidates:
+        if capacity >= need:
+            break
+        chosen.append(car)
+        capacity += car.seats - 1
+        need -= 1 if car.participant else 0
+
+    # 他の車だけで席が足りる場合は、費用の高い車から外す
+    for car in sorted(chosen, key=lambda c: -_fixed_cost(c, distance, etc)):
+        rest_capacity = capacity - (car.seats - 1)
+        rest_need = need + (1 if car.participant else 0)
+        if len(chosen) > 1 and rest_capacity >= rest_need:
+            chosen.remove(car)
+            capacity, need = rest_capacity, rest_need
+    return chosen
+
+
+def _assign(cars: list, groups: dict, detour: float) -> tuple:
+    """乗車地ごとの同乗者を、寄り道が増えない車から順に割り当てる
+
+    groups: {乗車地: [同乗者]}
+    """
+    riders = {car.name: [] for car in cars}
+    stops = {car.name: [] for car in cars}
+    free = {car.name: car.seats - 1 for car in cars}
+    unassigned = []
+
+    def extra(car, location):
+        if not location or location == car.location or location in stops[car.name]:
+            return 0.0
+        return detour * car.cost_per_km
+
+    # 人数の多い乗車地から（まとめて1台に乗せやすい）
+    for location, names in sorted(groups.items(), key=lambda item: -len(item[1])):
+        remaining = list(names)
+        while remaining:
+            open_cars = [car for car in cars if free[car.name] > 0]
+            if not open_cars:
+                unassigned.extend(remaining)
+                break
+            car = min(open_cars, key=lambda c: (extra(c, location), -free[c.name]))
+            count = min(free[car.name], len(remaining))
+            riders[car.name].extend(remaining[:count])
+            if extra(car, location) > 0:
+                stops[car.name].append(location)
+            free[car.name] -= count
+            remaining = remaining[count:]
+    return riders, stops, free, unassigned
+
+
+def _improve(cars: list, riders: dict, stops: dict, free: dict, locations: dict):
+    """寄り道先の同乗者を、その乗車地に既に寄る車（またはドライバーの乗車地の車）に移す"""
+    improved = True
+    while improved:
+        improved = False
+        for car in cars:
+            for location in list(stops[car.name]):
+                moving = [name for name in riders[car.name] if locations[name] == location]
+                targets = [
+                    other for other in cars
+                    if other.name != car.name
+                    and (other.location == location or location in stops[other.name])
+                ]
+                if sum(free[other.name] for other in targets) < len(moving):
+                    continue
+                for other in targets:
+                    count = min(free[other.name], len(moving))
+                    riders[other.name].extend(moving[:count])
+                    free[other.name] -= count
+                    moving = moving[count:]
+                riders[car.name] = [name for name in riders[car.name] if locations[name] != location]
+                free[car.name] = car.seats - 1 - len(riders[car.name])
+                stops[car.name].remove(location)
+                improved = True
+
+
+def plan_carpool(participants: pd.DataFrame, drivers: pd.DataFrame, prices: dict,
+                 distance: float, detour: float = 0.0, etc: float = 0.0) -> CarpoolPlan:
+    """参加者とドライバーから費用の小さい配車を作成
+
+    participants: 名前・乗車地 の表
+    drivers: 名前・燃料タイプ・燃費・定員・乗車地 の表
+    distance: 遠征の往復距離(km)、detour: 乗車地1か所に寄るための追加距離(km)、etc: 1台あたりのETC
+    """
+    names = participants['名前'].tolist()
+    locations = dict(zip(names, participants['乗車地'].fillna('').astype(str)))
+    cars = build_cars(drivers, names, prices)
+
+    chosen = _select_cars(cars, len(names), distance, etc)
+    chosen_names = {car.name for car in chosen}
+
+    groups = {}
+    for name in names:
+        if name not in chosen_names:
+            groups.setdefault(locations[name], []).append(name)
+
+    riders, stops, free, unassigned = _assign(chosen, groups, detour)
+    _improve(chosen, riders, stops, free, locations)
+
+    # 同乗者のいない車は、ドライバーが参加者でなければ出さない
+    used = [car for car in chosen if riders[car.name] or car.participant]
+    distances = {car.name: distance + detour * len(stops[car.name]) for car in used}
+    total = sum(distances[car.name] * car.cost_per_km + etc for car in used)
+    return CarpoolPlan(
+        riders={car.name: riders[car.name] for car in used},
+        stops={car.name: stops[car.name] for car in used},
+        distances=distances,
+        total_cost=total,
+        unassigned=unassigned,
+    )
+
+
+def plan_table(plan: CarpoolPlan) -> pd.DataFrame:
+    """配車の結果を表示用の表に変換"""
+    return pd.DataFrame({
+        'ドライバー': list(plan.riders),
+        '同乗者': [', '.join(riders) for riders in plan.riders.values()],
+        '人数': [len(riders) + 1 for riders in plan.riders.values()],
+        '寄る乗車地': [', '.join(stops) for stops in plan.stops.values()],
+        '距離': [plan.distances[name] for name in plan.riders],
+    })
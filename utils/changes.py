@@ -0,0 +1,336 @@
+"""
+シートの変更の監視（開いている画面への自動反映）
+テナントごとに1つのスレッドがスプレッドシートの更新日時（Drive API）を確認し、変わっていればシートごとの
+リビジョンを読んで変更されたシートを調べる。リビジョンが変わっていないのに更新日時だけが変わった場合は
+シートの直接編集として、各シートの内容のハッシュを前回と比べる。
+各セッションは数秒ごとにメモリ上の結果だけを確認し（APIは呼ばない）、変更されたシートだけを読み込み直して
+そのシートを使う画面の部分（fragment）、または画面全体を再実行する
+
+設定（secrets.toml、省略可）:
+    [change_feed]
+    enabled = true
+    interval = 10      # 確認の間隔（秒）。クォータから決まる間隔より短くはならない
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import NamedTuple
+
+import streamlit as st
+
+from .runtime import get_secrets
+from .sheets import (
+    SHEET_BUDGET, SHEET_COLLECTION, SHEET_DATABASE, SHEET_DRIVERS, SHEET_JOURNAL, SHEET_MEMBERS,
+    SHEET_TRANSPORT_BALANCE, WRITTEN_REVISIONS_KEY, get_cached_revisions, get_spreadsheet
+)
+from .tenants import current_tenant, tenant_scope
+
+logger = logging.getLogger('club_accounting')
+
+# 監視するシート {シート: 内容を確認するワークシート}（取引履歴はスナップショットとジャーナル）
+WATCHED_SHEETS = {
+    SHEET_DATABASE: [SHEET_DATABASE, SHEET_JOURNAL],
+    SHEET_MEMBERS: [SHEET_MEMBERS],
+    SHEET_DRIVERS: [SHEET_DRIVERS],
+    SHEET_COLLECTION: [SHEET_COLLECTION],
+    SHEET_TRANSPORT_BALANCE: [SHEET_TRANSPORT_BALANCE],
+    SHEET_BUDGET: [SHEET_BUDGET],
+}
+
+# 画面に表示するシートの名前
+SHEET_LABELS = {
+    SHEET_DATABASE: '取引履歴',
+    SHEET_MEMBERS: '部員',
+    SHEET_DRIVERS: '運転手',
+    SHEET_COLLECTION: '徴収状況',
+    SHEET_TRANSPORT_BALANCE: '交通費会計',
+    SHEET_BUDGET: '予算',
+}
+
+DEFAULT_INTERVAL = 10.0
+
+# Sheets APIの読み取りクォータ（1分・サービスアカウントあたり）のうち、変更の確認に使ってよい割合
+# 1回の確認で読むのは最大 READS_PER_POLL 回（リビジョン + シートの一覧 + 内容）。残りは画面の読み込み・保存に使う
+READ_QUOTA_PER_MINUTE = 60
+FEED_QUOTA_SHARE = 0.1
+READS_PER_POLL = 3
+
+# エラー（クォータ超過など）が続いたときの間隔の上限（秒）。成功するまで間隔を2倍ずつ延ばす
+MAX_BACKOFF = 300.0
+
+# この秒数どのセッションからも確認されなければスレッドを止める（次に確認されたときに再開）
+IDLE_TIMEOUT = 120.0
+
+# セッションがメモリ上の結果を確認する間隔（秒）
+SESSION_CHECK_EVERY = 5.0
+
+
+class Change(NamedTuple):
+    """シートの変更"""
+    # 変更を検知するたびに1つ進む番号（セッションは最後に反映した番号を覚えておく）
+    version: int
+    # 検知した時点のリビジョン
+    revision: int
+    # リビジョンが変わらない変更（シートの直接編集）
+    external: bool = False
+
+
+def _config() -> dict:
+    try:
+        return dict(get_secrets().get('change_feed', {}))
+    except Exception:
+        return {}
+
+
+def quota_interval(tenants: int) -> float:
+    """動いている監視スレッドの数（テナント数）で読み取りクォータを分けたときの最短の間隔（秒）"""
+    polls_per_minute = READ_QUOTA_PER_MINUTE * FEED_QUOTA_SHARE / (READS_PER_POLL * max(tenants, 1))
+    return 60.0 / polls_per_minute
+
+
+def _content_hash(values: list) -> str:
+    return hashlib.sha256(json.dumps(values, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+
+class ChangeFeed:
+    """テナントのシートの変更を確認するスレッドと、その結果"""
+
+    def __init__(self, tenant: str, interval: float = DEFAULT_INTERVAL):
+        self.tenant = tenant
+        self.interval = interval
+        self.changes = {sheet: Change(0, 0) for sheet in WATCHED_SHEETS}
+        self.revisions = None
+        self.modified = None
+        # {ワークシート: 内容のハッシュ}（前回の内容の確認の結果。アプリが書き込んだシートはその時点で取り直す）
+        self.contents = {}
+        # 更新日時を取得できない環境（Drive APIの権限がないなど）では毎回リビジョンを読む
+        self.use_modified_time = True
+        self.failures = 0
+        self.last_touch = time.monotonic()
+        self.lock = threading.Lock()
+        self._thread = None
+
+    def touch(self):
+        """セッションから確認されたことを記録し、止まっていればスレッドを開始"""
+        with self.lock:
+            self.last_touch = time.monotonic()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f'change-feed-{self.tenant}', daemon=True)
+                self._thread.start()
+
+    def current(self) -> dict:
+        with self.lock:
+            return dict(self.changes)
+
+    def wait_time(self) -> float:
+        base = max(self.interval, quota_interval(active_feeds()))
+        return min(base * (2 ** self.failures), max(base, MAX_BACKOFF))
+
+    def _run(self):
+        while time.monotonic() - self.last_touch < IDLE_TIMEOUT:
+            try:
+                with tenant_scope(self.tenant):
+                    self.poll()
+                self.failures = 0
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"変更の確認エラー（{self.tenant}）: {e}")
+            time.sleep(self.wait_time())
+        # 止まっている間の変更は、再開時の最初の確認を基準にするため検知しない
+        with self.lock:
+            self.revisions = None
+            self.modified = None
+            self.contents = {}
+
+    # ======================
+    # 確認
+    # ======================
+
+    def _modified_time(self, spreadsheet):
+        from gspread.exceptions import APIError
+
+        if not self.use_modified_time:
+            return None
+        try:
+            return spreadsheet.get_lastUpdateTime()
+        except AttributeError:
+            self.use_modified_time = False
+            return None
+        except APIError as e:
+            # Drive APIが無効・権限がない場合はリビジョンだけで確認する（それ以外のエラーは次の確認で再試行）
+            if e.response.status_code not in (403, 404):
+                raise
+            logger.info(f"更新日時を取得できないため、リビジョンだけで変更を確認します（{self.tenant}）: {e}")
+            self.use_modified_time = False
+            return None
+
+    def _probe(self, spreadsheet, sheets: list) -> dict:
+        """ワークシートの内容のハッシュ（1回の読み込みでまとめて取得。存在しないシートは除く）"""
+        titles = {worksheet.title for worksheet in spreadsheet.worksheets()}
+        names = [name for sheet in sheets for name in WATCHED_SHEETS[sheet] if name in titles]
+        if not names:
+            return {}
+        response = spreadsheet.values_batch_get([f"'{name}'" for name in names])
+        return {
+            name: _content_hash(value_range.get('values', []))
+            for name, value_range in zip(names, response.get('valueRanges', []))
+        }
+
+    def poll(self) -> list:
+        """変更されたシートを調べて結果を更新（変更されたシートのリストを返す）"""
+        spreadsheet = get_spreadsheet()
+        if spreadsheet is None:
+            raise RuntimeError("スプレッドシートを開けません")
+        modified = self._modified_time(spreadsheet)
+        if modified is not None and modified == self.modified:
+            return []
+
+        # 閲覧用のリビジョンのキャッシュもここで更新する（ゲスト画面・APIがすぐに新しい内容を使う）
+        revisions = get_cached_revisions(ttl=0)
+        first = self.revisions is None
+        # リビジョンは消えないため、前回あったものが読めなければ読み込みの失敗
+        if not revisions and self.revisions:
+            raise RuntimeError("リビジョンを読み込めません")
+        changed = [] if first else [
+            sheet for sheet in WATCHED_SHEETS if revisions.get(sheet, 0) != self.revisions.get(sheet, 0)
+        ]
+        external = []
+        if modified is not None:
+            if first:
+                self.contents = self._probe(spreadsheet, list(WATCHED_SHEETS))
+            elif not changed:
+                contents = self._probe(spreadsheet, list(WATCHED_SHEETS))
+                external = [
+                    sheet for sheet in WATCHED_SHEETS
+                    if any(name in self.contents and self.contents[name] != contents.get(name)
+                           for name in WATCHED_SHEETS[sheet])
+                ]
+                self.contents = contents
+            else:
+                # アプリが書き込んだシートは書き込み後の内容を基準にする（次の確認で直接編集を検知できるように）
+                self.contents.update(self._probe(spreadsheet, changed))
+
+        with self.lock:
+            for sheet in changed + external:
+                self.changes[sheet] = Change(
+                    self.changes[sheet].version + 1, revisions.get(sheet, 0), sheet in external
+                )
+        self.revisions = revisions
+        self.modified = modified
+        if changed or external:
+            logger.info(f"シートの変更を検知（{self.tenant}）: {', '.join(changed + external)}")
+        return changed + external
+
+
+# テナントごとの監視 {テナント: ChangeFeed}
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+
+def get_feed(tenant: str = None) -> ChangeFeed:
+    """テナントの変更の監視（なければ作成。スレッドは touch() で開始）"""
+    tenant = tenant or current_tenant()
+    with _feeds_lock:
+        feed = _feeds.get(tenant)
+        if feed is None:
+            interval = float(_config().get('interval', DEFAULT_INTERVAL))
+            feed = _feeds[tenant] = ChangeFeed(tenant, interval)
+        return feed
+
+
+def active_feeds() -> int:
+    """スレッドが動いている監視の数"""
+    with _feeds_lock:
+        return sum(1 for feed in _feeds.values() if feed._thread is not None and feed._thread.is_alive())
+
+
+def sheet_version(sheet: str, tenant: str = None) -> int:
+    """シートの変更の番号（キャッシュのキーに使う。監視していなければ0）"""
+    with _feeds_lock:
+        feed = _feeds.get(tenant or current_tenant())
+    return feed.current()[sheet].version if feed is not None else 0
+
+
+# ======================
+# 画面
+# ======================
+
+def _session_seen(feed: ChangeFeed) -> dict:
+    """このセッションが反映済みの変更の番号 {シート: 番号}（初回は現在の番号を反映済みとする）"""
+    seen = st.session_state.setdefault('change_feed_seen', {})
+    for sheet, change in feed.current().items():
+        seen.setdefault(sheet, change.version)
+    return seen
+
+
+def _reload_changes(feed: ChangeFeed, reloaders: dict) -> list:
+    """まだ反映していない他の人の変更があるシートを読み込み直す（読み込み直したシートの名前のリストを返す）
+
+    このセッション自身の保存（リビジョンが WRITTEN_REVISIONS_KEY と同じ変更）は読み込み直さない
+    """
+    seen = _session_seen(feed)
+    written = st.session_state.setdefault(WRITTEN_REVISIONS_KEY, {})
+    reloaded = []
+    for sheet, change in feed.current().items():
+        if sheet not in reloaders or change.version == seen.get(sheet):
+            continue
+        seen[sheet] = change.version
+        if not change.external and change.revision == written.get(sheet):
+            continue
+        reloaders[sheet]()
+        reloaded.append(SHEET_LABELS[sheet])
+    return reloaded
+
+
+def _notice(reloaded: list) -> str:
+    return f"🔄 他の人の変更を反映しました（{'・'.join(reloaded)}）"
+
+
+def watch_changes(reloaders: dict):
+    """他の人の変更を監視し、変更されたシートだけを読み込み直して画面全体を再実行
+
+    reloaders: {シート: reload()}（session_stateのそのシートの内容を読み込み直す）。
+    画面の一部だけが使うシートは sheet_fragment() でその部分だけを再実行する
+    """
+    if not _config().get('enabled', True):
+        return
+    feed = get_feed()
+    feed.touch()
+    _session_seen(feed)
+
+    @st.fragment(run_every=SESSION_CHECK_EVERY)
+    def _check():
+        feed.touch()
+        reloaded = _reload_changes(feed, reloaders)
+        if reloaded:
+            st.session_state.change_notice = _notice(reloaded)
+            st.rerun()
+
+    _check()
+    if 'change_notice' in st.session_state:
+        st.toast(st.session_state.pop('change_notice'))
+
+
+def sheet_fragment(reloaders: dict):
+    """reloaders のシートだけに依存する画面の部分を、数秒ごとに変更を確認する fragment にするデコレータ
+
+    変更されていれば読み込み直してから描画する（画面の他の部分は再実行しない）。
+    監視が無効でも fragment にする（中の操作や st.rerun(scope="fragment") はその部分だけを再実行）
+    """
+    def decorator(render):
+        if not _config().get('enabled', True):
+            return st.fragment(render)
+
+        @st.fragment(run_every=SESSION_CHECK_EVERY)
+        def fragment():
+            feed = get_feed()
+            feed.touch()
+            reloaded = _reload_changes(feed, reloaders)
+            if reloaded:
+                st.toast(_notice(reloaded))
+            render()
+
+        return fragment
+    return decorator
@@ -0,0 +1,163 @@
+"""
+分析セクションのグラフ
+集計キューブからPlotlyの図を作成する（データがなければNone）
+plotlyは読み込みが重いため、このモジュールは分析セクションを描画する時点でimportする
+"""
+import plotly.express as px
+import plotly.graph_objects as go
+
+ENJI_PALETTE = [
+    '#670317', '#8B1538', '#A52A4A', '#C04060',
+    '#D85A7A', '#E87A9A', '#F5A0B8', '#FFD0DD',
+    '#4A0210', '#7D1A3D'
+]
+
+INCOME_COLOR = '#2E7D32'
+EXPENSE_COLOR = '#670317'
+
+# 残高の推移に表示する決済方法と色（総資産は太線）
+TIMELINE_METHODS = ['現金 (財布)', '銀行口座']
+TIMELINE_COLORS = {'現金 (財布)': '#D85A7A', '銀行口座': '#8B1538', '総資産': '#670317'}
+
+
+def expense_pie(cube):
+    """支出の内訳（科目別の円グラフ）"""
+    expense_by_category = cube.rollup(['科目'], 種別='支出')
+    if len(expense_by_category) == 0:
+        return None
+
+    fig = px.pie(
+        expense_by_category,
+        values='金額',
+        names='科目',
+        color_discrete_sequence=ENJI_PALETTE,
+        hole=0.45
+    )
+    fig.update_layout(
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#262730', size=14),
+        showlegend=True,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=-0.15,
+            xanchor="center",
+            x=0.5,
+            font=dict(size=12)
+        ),
+        margin=dict(t=30, b=30, l=30, r=30),
+        height=400
+    )
+    fig.update_traces(
+        textinfo='percent+value',
+        texttemplate='%{percent}<br>¥%{value:,.0f}',
+        textfont_size=13,
+        hovertemplate='<b>%{label}</b><br>金額: ¥%{value:,.0f}<br>割合: %{percent}<extra></extra>'
+    )
+    return fig
+
+
+def _income_expense_bars(data, x: str, height: int, **layout):
+    """収入・支出を並べた棒グラフ"""
+    fig = go.Figure()
+
+    fig.add_trace(go.Bar(
+        name='収入',
+        x=data[x],
+        y=data['収入'],
+        marker_color=INCOME_COLOR,
+        hovertemplate='<b>%{x}</b><br>収入: ¥%{y:,.0f}<extra></extra>'
+    ))
+
+    fig.add_trace(go.Bar(
+        name='支出',
+        x=data[x],
+        y=data['支出'],
+        marker_color=EXPENSE_COLOR,
+        hovertemplate='<b>%{x}</b><br>支出: ¥%{y:,.0f}<extra></extra>'
+    ))
+
+    fig.update_layout(
+        barmode='group',
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#262730', size=12),
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        ),
+        margin=dict(t=50, b=50, l=50, r=30),
+        height=height,
+        **layout
+    )
+    return fig
+
+
+def monthly_bars(cube):
+    """月別収支推移"""
+    monthly_data = cube.monthly()
+    if len(monthly_data) == 0:
+        return None
+    return _income_expense_bars(
+        monthly_data, '年月', 400,
+        xaxis=dict(showgrid=False, title="月"),
+        yaxis=dict(showgrid=True, gridcolor='rgba(0,0,0,0.1)', title="金額 (円)")
+    )
+
+
+def method_bars(cube):
+    """決済方法別の収入・支出"""
+    method_data = cube.pivot('決済方法')
+    if len(method_data) == 0:
+        return None
+    return _income_expense_bars(method_data, '決済方法', 350)
+
+
+def balance_timeline(timeline):
+    """財布・銀行口座・総資産の残高の推移（間引いた系列をWebGLで描画）"""
+    from .timeline import TOTAL_LABEL
+
+    if len(timeline.days) == 0:
+        return None
+    fig = go.Figure()
+    for name, (dates, values) in timeline.series(TIMELINE_METHODS).items():
+        fig.add_trace(go.Scattergl(
+            name=name,
+            x=dates,
+            y=values,
+            mode='lines',
+            line=dict(shape='hv', color=TIMELINE_COLORS.get(name), width=3 if name == TOTAL_LABEL else 2),
+            hovertemplate=f'<b>%{{x|%Y-%m-%d}}</b><br>{name}: ¥%{{y:,.0f}}<extra></extra>'
+        ))
+    fig.update_layout(
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#262730', size=12),
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        ),
+        hovermode='x unified',
+        margin=dict(t=50, b=50, l=50, r=30),
+        height=400,
+        xaxis=dict(showgrid=False, title="日付"),
+        yaxis=dict(showgrid=True, gridcolor='rgba(0,0,0,0.1)', title="残高 (円)")
+    )
+    return fig
+
+
+def build_figures(cube, timeline=None) -> dict:
+    """分析セクションの図（timelineを渡すと残高の推移も作成）"""
+    return {
+        'expense': expense_pie(cube),
+        'monthly': monthly_bars(cube),
+        'method': method_bars(cube),
+        'balance': balance_timeline(timeline) if timeline is not None else None,
+    }
@@ -0,0 +1,91 @@
+"""
+取引履歴・交通費会計の整合性チェック
+問題のある行を (チェック, 行, 内容) の表にまとめる
+"""
+import pandas as pd
+
+from .export import TRANSFER_PREFIX
+from .duplicates import DUPLICATE_KEY_COLUMNS, scan_duplicates
+from .integrity import SHEET_SEALS, describe
+
+ISSUE_COLUMNS = ['チェック', '行', '内容']
+
+TRANSACTION_KINDS = ['収入', '支出']
+
+# 重複の可能性として報告する行のキー（登録時のキー + 備考。備考だけが違う同じ日の会費などは別の取引）
+AUDIT_DUPLICATE_COLUMNS = DUPLICATE_KEY_COLUMNS + ['備考']
+
+
+def _issues(check: str, rows: pd.DataFrame, describe) -> list:
+    return [[check, label, describe(row)] for label, row in rows.iterrows()]
+
+
+def check_ledger(df: pd.DataFrame, methods: list) -> pd.DataFrame:
+    """取引履歴の整合性チェック"""
+    if len(df) == 0:
+        return pd.DataFrame(columns=ISSUE_COLUMNS)
+
+    dates = pd.to_datetime(df['日付'], errors='coerce')
+    amounts = pd.to_numeric(df['金額'], errors='coerce')
+    issues = []
+    issues += _issues('日付が読めない', df[dates.isna()], lambda r: f"日付={r['日付']!r}")
+    issues += _issues('金額が0以下・数値でない', df[~(amounts > 0)], lambda r: f"金額={r['金額']!r}")
+    issues += _issues('種別が不正', df[~df['種別'].isin(TRANSACTION_KINDS)], lambda r: f"種別={r['種別']!r}")
+    issues += _issues('決済方法が不正', df[~df['決済方法'].isin(methods)], lambda r: f"決済方法={r['決済方法']!r}")
+
+    # 日付・種別・科目・金額・決済方法・備考が同じ取引（各組の最初の1件は除く）
+    valid = df[dates.notna() & amounts.notna()]
+    duplicates = scan_duplicates(valid.assign(日付=dates[valid.index], 金額=amounts[valid.index]),
+                                 AUDIT_DUPLICATE_COLUMNS)
+    duplicated = df.loc[duplicates.index[duplicates['グループ'].duplicated()]]
+    issues += _issues('重複の可能性', duplicated, lambda r: f"{r['日付']} {r['科目']} ¥{r['金額']} {r['備考']}")
+
+    is_transfer = df['科目'].astype(str).str.startswith(TRANSFER_PREFIX)
+
+    # 資金移動は移動元の支出と移動先の収入が同じ日・同じ金額で対になる
+    transfers = df[is_transfer]
+    if len(transfers) > 0:
+        signed = amounts[transfers.index].where(transfers['種別'] == '収入', -amounts[transfers.index])
+        net = signed.groupby(dates[transfers.index].dt.strftime('%Y-%m-%d')).sum()
+        for day, total in net[net != 0].items():
+            issues.append(['資金移動が対になっていない', '', f"{day} 差額 ¥{total:,.0f}"])
+
+    return pd.DataFrame(issues, columns=ISSUE_COLUMNS)
+
+
+def check_transport_balance(df: pd.DataFrame) -> pd.DataFrame:
+    """交通費会計の残高が収入・支出の累計と一致するか"""
+    if len(df) == 0:
+        return pd.DataFrame(columns=ISSUE_COLUMNS)
+
+    expected = (df['収入'] - df['支出']).cumsum()
+    mismatched = df[(df['残高'] - expected).abs() > 0.5]
+    return pd.DataFrame(
+        [['交通費会計の残高が不一致', label, f"残高 ¥{row['残高']:,.0f} / 累計 ¥{expected[label]:,.0f}"]
+         for label, row in mismatched.iterrows()],
+        columns=ISSUE_COLUMNS
+    )
+
+
+def check_integrity(results: list) -> pd.DataFrame:
+    """行のハッシュの記録と一致しないシート（IntegrityResult のリスト。シートごとに最初に異なる行を報告）"""
+    issues = []
+    for result in results:
+        if result.sealed == 0 and result.rows > 0:
+            issues.append(['ハッシュが未記録', '', f"{result.sheet}: python cli.py seal で現在の内容を記録してください"])
+        elif not result.ok:
+            issues.append(['記録と異なる（改ざんの可能性）', result.first, describe(result)])
+    return pd.DataFrame(issues, columns=ISSUE_COLUMNS)
+
+
+def check_seal_log(log, anchor=None) -> pd.DataFrame:
+    """記録（SealLog）の連鎖と、控え（Anchor）の連鎖が記録にあるか"""
+    issues = []
+    if log.broken:
+        more = f"（ほかに{len(log.broken) - 1:,}件）" if len(log.broken) > 1 else ''
+        issues.append(['記録の連鎖が一致しない（記録の改ざんの可能性）', log.broken[0] + 2,
+                       f"{SHEET_SEALS} の {log.broken[0] + 2}行目{more}"])
+    if anchor is not None and bytes.fromhex(anchor.head) not in log.known:
+        issues.append(['控えの連鎖が記録にない（記録の削除の可能性）', '',
+                       f"{anchor.time} の控え（{anchor.rows:,}件）の連鎖が {SHEET_SEALS} にありません"])
+    return pd.DataFrame(issues, columns=ISSUE_COLUMNS)
@@ -0,0 +1,120 @@
+"""
+取引履歴の集計キューブ
+年 × 月 × 種別 × 科目 × 決済方法 ごとの金額合計を保持し、
+グラフやKPIは取引履歴を毎回集計し直す代わりにこの小さな集計表から計算する
+"""
+import pandas as pd
+
+CUBE_KEYS = ['年', '月', '種別', '科目', '決済方法']
+
+# 総資産に含める決済方法
+ASSET_METHODS = ['現金 (財布)', '銀行口座']
+
+
+def total_assets(balance):
+    """総資産（ASSET_METHODS の残高の合計）
+
+    balance(決済方法) は残高を返す関数（KPIは金額、残高の推移は日ごとの配列）。
+    KPIと残高の推移の総資産はどちらもこの関数で計算する
+    """
+    return sum(balance(method) for method in ASSET_METHODS)
+
+
+def _group_rows(df: pd.DataFrame) -> dict:
+    """取引の行を集計キーごとの (金額合計, 件数) にまとめる"""
+    if len(df) == 0:
+        return {}
+    dates = pd.to_datetime(df['日付'], errors='coerce')
+    keys = pd.DataFrame({
+        # 日付が読めない行は 年=0, 月=0 として集計する（合計には含める）
+        '年': dates.dt.year.fillna(0).astype(int),
+        '月': dates.dt.month.fillna(0).astype(int),
+        '種別': df['種別'].fillna('').astype(str),
+        '科目': df['科目'].fillna('').astype(str),
+        '決済方法': df['決済方法'].fillna('').astype(str) if '決済方法' in df.columns else '現金 (財布)',
+        '金額': pd.to_numeric(df['金額'], errors='coerce').fillna(0),
+    })
+    grouped = keys.groupby(CUBE_KEYS, sort=False)['金額'].agg(['sum', 'count'])
+    return {key: (total, count) for key, total, count in zip(grouped.index, grouped['sum'], grouped['count'])}
+
+
+class LedgerCube:
+    """集計キューブ（追加・削除された行だけで差分更新する）"""
+
+    def __init__(self, cells: dict = None):
+        # {(年, 月, 種別, 科目, 決済方法): [金額合計, 件数]}
+        self.cells = {key: [total, count] for key, (total, count) in (cells or {}).items()}
+        self._frame = None
+
+    @classmethod
+    def from_ledger(cls, df: pd.DataFrame) -> 'LedgerCube':
+        """取引履歴全体から作成（読み込み時に1回だけ）"""
+        return cls(_group_rows(df))
+
+    def add(self, df: pd.DataFrame, sign: int = 1):
+        """行を追加（sign=-1で削除）"""
+        for key, (total, count) in _group_rows(df).items():
+            cell = self.cells.setdefault(key, [0, 0])
+            cell[0] += sign * total
+            cell[1] += sign * count
+            if cell[1] <= 0:
+                del self.cells[key]
+        self._frame = None
+
+    def remove(self, df: pd.DataFrame):
+        """行を削除"""
+        self.add(df, sign=-1)
+
+    def apply(self, removed: pd.DataFrame, added: pd.DataFrame):
+        """変更（削除された行・追加された行）を反映"""
+        if len(removed) > 0:
+            self.remove(removed)
+        if len(added) > 0:
+            self.add(added)
+
+    def to_frame(self) -> pd.DataFrame:
+        """集計キューブをDataFrameとして取得（変更がなければ前回の結果を使う）"""
+        if self._frame is None:
+            rows = [key + (total, count) for key, (total, count) in self.cells.items()]
+            self._frame = pd.DataFrame(rows, columns=CUBE_KEYS + ['金額', '件数'])
+        return self._frame
+
+    def rollup(self, by: list, **filters) -> pd.DataFrame:
+        """任意の軸で金額を合計（filters: 列名=値 または 列名=[値, ...] で絞り込み）"""
+        frame = self.to_frame()
+        for column, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                frame = frame[frame[column].isin(value)]
+            else:
+                frame = frame[frame[column] == value]
+        if not by:
+            return pd.DataFrame({'金額': [frame['金額'].sum()], '件数': [frame['件数'].sum()]})
+        return frame.groupby(by, as_index=False)[['金額', '件数']].sum()
+
+    def total(self, **filters) -> float:
+        """条件に合う金額の合計"""
+        return self.rollup([], **filters)['金額'].iloc[0]
+
+    def pivot(self, index: str, **filters) -> pd.DataFrame:
+        """index × 種別（収入・支出）の集計表"""
+        table = self.rollup([index, '種別'], **filters).pivot(index=index, columns='種別', values='金額')
+        table = table.reindex(columns=['収入', '支出']).fillna(0)
+        table.columns.name = None
+        return table.reset_index()
+
+    def monthly(self) -> pd.DataFrame:
+        """年月 × 種別（収入・支出）の集計表（日付不明の行は除く）"""
+        frame = self.to_frame()
+        frame = frame[frame['年'] > 0]
+        if len(frame) == 0:
+            return pd.DataFrame(columns=['年月', '収入', '支出'])
+        frame = frame.assign(年月=frame['年'].astype(str) + '-' + frame['月'].map('{:02d}'.format))
+        table = frame.groupby(['年月', '種別'])['金額'].sum().unstack(fill_value=0)
+        table = table.reindex(columns=['収入', '支出']).fillna(0)
+        table.columns.name = None
+        return table.reset_index().sort_values('年月').reset_index(drop=True)
+
+    def balance(self, method: str = None) -> float:
+        """残高（収入 − 支出）。methodを指定すると決済方法ごと"""
+        filters = {} if method is None else {'決済方法': method}
+        return self.total(種別='収入', **filters) - self.total(種別='支出', **filters)
@@ -0,0 +1,70 @@
+"""
+取引の重複検出
+(日付, 種別, 科目, 金額, 決済方法) のハッシュインデックスを保持し、登録前の1件の確認を O(1) で行う
+（ダブルクリックや複数の担当者による同じ領収書の二重登録を、書き込む前に見つける）
+"""
+import pandas as pd
+
+from .merge import normalize_value
+
+DUPLICATE_KEY_COLUMNS = ['日付', '種別', '科目', '金額', '決済方法']
+
+
+def _keys(df: pd.DataFrame, columns: list = DUPLICATE_KEY_COLUMNS):
+    """行ラベルとキーの組（columns の値を正規化したタプル）"""
+    values = [df[col] if col in df.columns else pd.Series('', index=df.index) for col in columns]
+    return zip(df.index, (tuple(normalize_value(v) for v in row) for row in zip(*values)))
+
+
+class DuplicateIndex:
+    """{キー: {行ラベル}} のハッシュインデックス（追加・削除された行だけで差分更新）"""
+
+    def __init__(self):
+        self.labels = {}
+
+    @classmethod
+    def from_ledger(cls, df: pd.DataFrame) -> 'DuplicateIndex':
+        index = cls()
+        index.add(df)
+        return index
+
+    def add(self, df: pd.DataFrame):
+        for label, key in _keys(df):
+            self.labels.setdefault(key, set()).add(label)
+
+    def remove(self, df: pd.DataFrame):
+        for label, key in _keys(df):
+            labels = self.labels.get(key)
+            if labels is not None:
+                labels.discard(label)
+                if not labels:
+                    del self.labels[key]
+
+    def apply(self, removed: pd.DataFrame, added: pd.DataFrame):
+        """変更（削除された行・追加された行）を反映"""
+        self.remove(removed)
+        self.add(added)
+
+    def find(self, rows: pd.DataFrame) -> dict:
+        """登録しようとしている行と同じキーの既存の行 {新しい行のラベル: [既存の行ラベル]}"""
+        found = {}
+        for label, key in _keys(rows):
+            labels = self.labels.get(key)
+            if labels:
+                found[label] = sorted(labels)
+        return found
+
+
+def scan_duplicates(df: pd.DataFrame, columns: list = DUPLICATE_KEY_COLUMNS) -> pd.DataFrame:
+    """取引履歴を1回たどり、columns が同じ行が2件以上あるものを グループ列付きで返す（日付順）"""
+    groups = {}
+    for label, key in _keys(df, columns):
+        groups.setdefault(key, []).append(label)
+    duplicated = [labels for labels in groups.values() if len(labels) > 1]
+    if not duplicated:
+        return df.iloc[0:0].assign(グループ=pd.Series(dtype=int))
+
+    labels = [label for group in duplicated for label in group]
+    group_ids = [i for i, group in enumerate(duplicated, start=1) for _ in group]
+    result = df.loc[labels].assign(グループ=group_ids)
+    return result.sort_values(['日付', 'グループ'], kind='stable')
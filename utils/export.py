@@ -0,0 +1,229 @@
+"""
+取引履歴のエクスポートと収支報告書の作成
+全件の文字列変換コピーを作らず、チャンク単位でCSV / xlsxに書き出す
+"""
+import io
+
+import pandas as pd
+
+# 1回に書き出す行数
+EXPORT_CHUNK_SIZE = 5000
+
+# 会計年度の開始月（4月始まり）
+FISCAL_YEAR_START_MONTH = 4
+
+LEDGER_COLUMNS = ['日付', '種別', '科目', '金額', '備考', '決済方法']
+TRANSPORT_COLUMNS = ['日付', '項目', '収入', '支出', '残高']
+
+# 資金移動の科目は「資金移動 → 銀行口座」のように始まる
+TRANSFER_PREFIX = '資金移動'
+
+
+def select_columns(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+    """必要な列だけにする（既に同じ列構成ならコピーせずそのまま返す）"""
+    columns = [c for c in columns if c in df.columns]
+    if list(df.columns) == columns:
+        return df
+    return df[columns]
+
+
+def iter_chunks(df: pd.DataFrame, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """DataFrameを行方向のスライスで順に返す（コピーは作らない）"""
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def write_csv(df: pd.DataFrame, buffer, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """DataFrameをチャンク単位でCSVとしてbufferに書き出す"""
+    buffer.write(','.join(str(c) for c in df.columns) + '\n')
+    for chunk in iter_chunks(df, chunk_size):
+        chunk.to_csv(buffer, header=False, index=False, date_format='%Y-%m-%d')
+
+
+def to_csv_bytes(df: pd.DataFrame, chunk_size: int = EXPORT_CHUNK_SIZE) -> bytes:
+    """CSVのバイト列を作成（Excelで文字化けしないようBOM付きUTF-8）"""
+    buffer = io.StringIO()
+    write_csv(df, buffer, chunk_size)
+    return buffer.getvalue().encode('utf-8-sig')
+
+
+def _cell(value):
+    """xlsxのセルに書き込める値に変換"""
+    if value is None:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return None if pd.isna(value) else value.strftime('%Y-%m-%d')
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def to_xlsx_bytes(sheets: dict, chunk_size: int = EXPORT_CHUNK_SIZE) -> bytes:
+    """{シート名: DataFrame} を1つのxlsxに書き出す（書き込み専用モードで行単位に出力）"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for title, df in sheets.items():
+        worksheet = workbook.create_sheet(title=title[:31])
+        worksheet.append([str(c) for c in df.columns])
+        for chunk in iter_chunks(df, chunk_size):
+            for row in chunk.itertuples(index=False, name=None):
+                worksheet.append([_cell(v) for v in row])
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+# ======================
+# 収支報告書
+# ======================
+
+def fiscal_year_of(date) -> int:
+    """日付の会計年度（4月始まり、2024年4月〜2025年3月は2024年度）"""
+    date = pd.Timestamp(date)
+    return date.year if date.month >= FISCAL_YEAR_START_MONTH else date.year - 1
+
+
+def fiscal_year_range(fiscal_year: int):
+    """会計年度の開始日と翌年度の開始日"""
+    start = pd.Timestamp(year=fiscal_year, month=FISCAL_YEAR_START_MONTH, day=1)
+    return start, start + pd.DateOffset(years=1)
+
+
+def available_fiscal_years(df: pd.DataFrame) -> list:
+    """データに含まれる会計年度（新しい順）"""
+    dates = pd.to_datetime(df['日付'], errors='coerce').dropna() if len(df) > 0 else pd.Series(dtype='datetime64[ns]')
+    if len(dates) == 0:
+        return []
+    years = (dates.dt.year - (dates.dt.month < FISCAL_YEAR_START_MONTH).astype(int)).unique()
+    return sorted((int(y) for y in years), reverse=True)
+
+
+def _signed_amount(df: pd.DataFrame) -> pd.Series:
+    """収入をプラス、支出をマイナスにした金額"""
+    sign = df['種別'].map({'収入': 1, '支出': -1}).fillna(0)
+    return df['金額'] * sign
+
+
+def build_annual_report(df: pd.DataFrame, fiscal_year: int, methods: list):
+    """指定年度の収支報告書を作成
+
+    戻り値: (科目×決済方法の集計表, 決済方法ごとの残高サマリ)
+    """
+    dates = pd.to_datetime(df['日付'], errors='coerce')
+    amounts = pd.to_numeric(df['金額'], errors='coerce').fillna(0)
+    if amounts.dtype != df['金額'].dtype:
+        df = df.assign(金額=amounts)
+    start, end = fiscal_year_range(fiscal_year)
+    before = df[dates < start]
+    period = df[(dates >= start) & (dates < end)]
+
+    # 区分: 資金移動は収入・支出の合計に含めない
+    category = period['科目'].astype(str)
+    section = period['種別'].where(~category.str.startswith(TRANSFER_PREFIX), TRANSFER_PREFIX)
+    columns = ['区分', '科目'] + methods + ['合計']
+    if len(period) > 0:
+        table = pd.pivot_table(
+            period.assign(区分=section),
+            index=['区分', '科目'],
+            columns='決済方法',
+            values='金額',
+            aggfunc='sum',
+            fill_value=0,
+        )
+        table = table.reindex(columns=methods, fill_value=0)
+        table.columns.name = None
+        table['合計'] = table.sum(axis=1)
+        table = table.reset_index()
+        # 収入 → 支出 → 資金移動 の順、区分内は金額の大きい順
+        table['_order'] = table['区分'].map({'収入': 0, '支出': 1, TRANSFER_PREFIX: 2}).fillna(3)
+        table = table.sort_values(['_order', '合計'], ascending=[True, False])
+        table = table[columns].reset_index(drop=True)
+    else:
+        table = pd.DataFrame(columns=columns)
+
+    # 残高サマリ（決済方法ごとの前年度繰越・収入・支出・資金移動・次年度繰越）
+    summary_rows = []
+    for method in methods + ['合計']:
+        if method == '合計':
+            before_m, period_m = before, period
+            section_m = section
+        else:
+            before_m = before[before['決済方法'] == method]
+            period_m = period[period['決済方法'] == method]
+            section_m = section[period['決済方法'] == method]
+        opening = _signed_amount(before_m).sum()
+        income = period_m.loc[section_m == '収入', '金額'].sum()
+        expense = period_m.loc[section_m == '支出', '金額'].sum()
+        transfer = _signed_amount(period_m[section_m == TRANSFER_PREFIX]).sum()
+        summary_rows.append({
+            '決済方法': method,
+            '前年度繰越': opening,
+            '収入': income,
+            '支出': expense,
+            '資金移動': transfer,
+            '次年度繰越': opening + income - expense + transfer,
+        })
+    summary = pd.DataFrame(summary_rows)
+    return table, summary
+
+
+# 年度末の繰越に使う科目
+CARRY_OUT_CATEGORY = '次年度繰越金'
+CARRY_IN_CATEGORY = '前年度繰越金'
+
+
+def closing_entries(df: pd.DataFrame, fiscal_year: int, methods: list) -> pd.DataFrame:
+    """年度末の繰越の取引を作成
+
+    決済方法ごとの次年度繰越額を、年度末日に「次年度繰越金」（支出）、
+    翌年度の初日に「前年度繰越金」（収入）として計上する（残高がマイナスなら種別を入れ替える）
+    """
+    _, summary = build_annual_report(df, fiscal_year, methods)
+    _, end = fiscal_year_range(fiscal_year)
+    last_day = end - pd.Timedelta(days=1)
+    rows = []
+    for method, balance in zip(summary['決済方法'], summary['次年度繰越']):
+        if method == '合計' or balance == 0:
+            continue
+        out_kind, in_kind = ('支出', '収入') if balance > 0 else ('収入', '支出')
+        amount = abs(balance)
+        note = f'{fiscal_year}年度 決算'
+        rows.append([last_day, out_kind, CARRY_OUT_CATEGORY, amount, note, method])
+        rows.append([end, in_kind, CARRY_IN_CATEGORY, amount, note, method])
+    return pd.DataFrame(rows, columns=LEDGER_COLUMNS)
+
+
+def is_closed(df: pd.DataFrame, fiscal_year: int) -> bool:
+    """年度末の繰越が計上済みか"""
+    dates = pd.to_datetime(df['日付'], errors='coerce')
+    start, end = fiscal_year_range(fiscal_year)
+    period = df[(dates >= start) & (dates < end)]
+    return bool((period['科目'] == CARRY_OUT_CATEGORY).any())
+
+
+def annual_report_xlsx(df: pd.DataFrame, fiscal_year: int, methods: list) -> bytes:
+    """収支報告書（集計表・残高サマリ・当該年度の明細）をxlsxで作成"""
+    table, summary = build_annual_report(df, fiscal_year, methods)
+    dates = pd.to_datetime(df['日付'], errors='coerce')
+    start, end = fiscal_year_range(fiscal_year)
+    detail = df[(dates >= start) & (dates < end)]
+    return to_xlsx_bytes({
+        f'{fiscal_year}年度 収支報告書': table,
+        '残高サマリ': summary,
+        '明細': select_columns(detail, LEDGER_COLUMNS),
+    })
+
+
+def ledger_export_xlsx(ledger: pd.DataFrame, transport: pd.DataFrame) -> bytes:
+    """取引履歴と交通費会計をシート別に1つのxlsxで作成"""
+    return to_xlsx_bytes({
+        '取引履歴': select_columns(ledger, LEDGER_COLUMNS),
+        '交通費会計': select_columns(transport, TRANSPORT_COLUMNS),
+    })
@@ -0,0 +1,148 @@
+"""
+Sheets API用のHTTPセッション
+接続プール・Keep-Alive・gzip圧縮を有効にした認証済みセッションを作成し、
+アクセストークンを期限切れ前にバックグラウンドで更新する
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from google.auth.transport.requests import AuthorizedSession, Request
+
+# 接続プールの設定（並列読み込みの上限より大きめに確保）
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 10
+
+# 一時的なエラー（429 / 5xx）の再試行設定（冪等なメソッドのみ再試行）
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# トークンの有効期限のどれだけ前に更新するか
+REFRESH_MARGIN = timedelta(minutes=5)
+# 更新に失敗した場合の再試行間隔（秒）
+REFRESH_RETRY_SECONDS = 30
+
+# Google APIはUser-Agentに "gzip" を含む場合のみ圧縮レスポンスを返す
+USER_AGENT = "club-accounting (gzip)"
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """接続の再利用状況を集計できるHTTPAdapter"""
+
+    def connection_stats(self) -> dict:
+        """プール内の接続数とリクエスト数を集計"""
+        pools = self.poolmanager.pools
+        new_connections = 0
+        requests_sent = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            new_connections += pool.num_connections
+            requests_sent += pool.num_requests
+        return {
+            'pools': len(pools),
+            'requests': requests_sent,
+            'new_connections': new_connections,
+            'reused': max(requests_sent - new_connections, 0),
+        }
+
+
+class CredentialRefresher:
+    """アクセストークンを期限切れ前にバックグラウンドで更新するスレッド"""
+
+    def __init__(self, credentials, margin: timedelta = REFRESH_MARGIN):
+        self.credentials = credentials
+        self.margin = margin
+        self.refresh_count = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._request = Request(requests.Session())
+        self._thread = threading.Thread(
+            target=self._run, name="sheets-token-refresher", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh(self):
+        """トークンを更新（初回の取得とこのスレッドの更新が重ならないようロック）
+
+        AuthorizedSession も期限切れ・401のときは自分で更新するが、そちらはこのロックを使わない
+        （トークンの差し替えは属性の代入だけのため、両方が更新しても後の方が使われるだけ）
+        """
+        with self._lock:
+            self.credentials.refresh(self._request)
+            self.refresh_count += 1
+
+    def _seconds_until_refresh(self) -> float:
+        expiry = self.credentials.expiry
+        if expiry is None or not self.credentials.token:
+            return 0
+        # google-authのexpiryはタイムゾーンなしのUTC（タイムゾーン付きのUTCにそろえて比べる）
+        if expiry.tzinfo is None:
+            expiry = expiry.replace(tzinfo=timezone.utc)
+        remaining = expiry - self.margin - datetime.now(timezone.utc)
+        return max(remaining.total_seconds(), 0)
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self._seconds_until_refresh()
+            if wait > 0:
+                self._stop.wait(wait)
+                continue
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                self._stop.wait(REFRESH_RETRY_SECONDS)
+
+
+def build_authorized_session(credentials) -> AuthorizedSession:
+    """接続プール・Keep-Alive・gzip圧縮を有効にした認証済みセッションを作成"""
+    session = AuthorizedSession(credentials)
+
+    retry = Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUS,
+        raise_on_status=False,
+    )
+    adapter = CountingHTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session.mount("https://", adapter)
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+        'User-Agent': USER_AGENT,
+    })
+
+    # 初回のトークン取得もここで済ませ、最初のAPI呼び出しで待たないようにする
+    refresher = CredentialRefresher(credentials)
+    refresher.refresh()
+    session.refresher = refresher.start()
+    return session
+
+
+def get_connection_stats(session) -> dict:
+    """セッションの接続再利用状況とトークン更新状況を取得"""
+    adapter = session.get_adapter("https://")
+    stats = adapter.connection_stats() if isinstance(adapter, CountingHTTPAdapter) else {}
+    refresher = getattr(session, 'refresher', None)
+    if refresher is not None:
+        stats['token_refreshes'] = refresher.refresh_count
+        stats['token_expiry'] = refresher.credentials.expiry
+        stats['refresh_error'] = str(refresher.last_error) if refresher.last_error else None
+    return stats
@@ -0,0 +1,259 @@
+"""
+取引履歴の一括インポート
+CSV / Excel（xlsx）ファイルをチャンク単位で読み込み、列をマッピングして
+既存データとの重複を除外しながら database シートへまとめて追記する
+"""
+import codecs
+from collections import Counter
+from typing import Callable, Iterator, NamedTuple
+
+import pandas as pd
+
+from .merge import normalize_value
+
+# 1回の読み込み・追記で扱う行数
+CHUNK_SIZE = 1000
+
+LEDGER_COLUMNS = ['日付', '種別', '科目', '金額', '備考', '決済方法']
+
+# 列マッピングの既定ルール（取込先の列: 取込元の列名の候補、先頭から優先）
+DEFAULT_IMPORT_RULES = {
+    'columns': {
+        '日付': ['日付', '取引日', '年月日', '取扱日', 'Date'],
+        '種別': ['種別', '区分', '入出金区分'],
+        '科目': ['科目', '勘定科目', 'Category'],
+        '金額': ['金額', '取引金額', 'Amount'],
+        '備考': ['備考', '摘要', 'メモ', '内容', 'Description'],
+        '決済方法': ['決済方法', '口座'],
+    },
+    # 通帳形式（入金・出金が別列）の場合の列名の候補
+    'income_columns': ['入金', '入金額', 'お預り金額', '預入金額'],
+    'expense_columns': ['出金', '出金額', 'お引出金額', '支払金額'],
+    # 種別の列の値の読み替え（金額が1列で、種別が入出金区分の場合）
+    'type_values': {'入金': '収入', '出金': '支出'},
+    # ファイルに値がない場合の既定値
+    'default_method': '銀行口座',
+    'default_income_category': 'その他',
+    'default_expense_category': 'その他',
+}
+
+# CSVの文字コード（銀行のCSVはShift_JISが多い）
+CSV_ENCODINGS = ['utf-8-sig', 'cp932']
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+
+class ImportResult(NamedTuple):
+    """インポート結果の集計"""
+    read: int
+    imported: int
+    duplicates: int
+    invalid: int
+
+
+def build_rules(overrides: dict = None) -> dict:
+    """既定ルールに上書き設定を反映"""
+    rules = {key: (dict(value) if isinstance(value, dict) else value)
+             for key, value in DEFAULT_IMPORT_RULES.items()}
+    for key, value in (overrides or {}).items():
+        if key in ('columns', 'type_values'):
+            rules[key].update(value)
+        else:
+            rules[key] = value
+    return rules
+
+
+def dedupe_key(date, amount, note) -> tuple:
+    """重複判定用のキー（日付, 金額, 備考）"""
+    return (normalize_value(date), normalize_value(amount), normalize_value(note))
+
+
+def build_dedupe_index(df: pd.DataFrame) -> Counter:
+    """既存の取引履歴から重複判定用のハッシュインデックス {キー: 件数} を作成"""
+    if len(df) == 0:
+        return Counter()
+    return Counter(
+        dedupe_key(d, a, n)
+        for d, a, n in zip(df['日付'], df['金額'], df['備考'])
+    )
+
+
+def detect_csv_encoding(file) -> str:
+    """先頭部分からCSVの文字コードを判定"""
+    sample = file.read(ENCODING_SAMPLE_BYTES)
+    file.seek(0)
+    for encoding in CSV_ENCODINGS:
+        try:
+            # 途中で切れたマルチバイト文字はエラーにしない
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("CSVの文字コードを判定できませんでした（UTF-8 / Shift_JIS に対応）")
+
+
+def iter_csv_chunks(file, chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """CSVをチャンク単位で読み込み（文字コードは自動判定）"""
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            yield from iter_csv_chunks(f, chunk_size)
+        return
+    
+    encoding = detect_csv_encoding(file)
+    reader = pd.read_csv(
+        file, encoding=encoding, dtype=str,
+        keep_default_na=False, chunksize=chunk_size
+    )
+    with reader:
+        yield from reader
+
+
+def iter_excel_chunks(file, chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """xlsxを先頭シートから1行ずつ読み、チャンク単位でDataFrameにする"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        headers = next(rows, None)
+        if headers is None:
+            return
+        headers = [str(h).strip() if h is not None else '' for h in headers]
+        chunk = []
+        for row in rows:
+            if row is None or all(v is None or v == '' for v in row):
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk, columns=headers)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=headers)
+    finally:
+        workbook.close()
+
+
+def iter_file_chunks(file, filename: str, chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """ファイル名の拡張子に応じてチャンク単位で読み込み"""
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        return iter_excel_chunks(file, chunk_size)
+    return iter_csv_chunks(file, chunk_size)
+
+
+def _find_column(chunk: pd.DataFrame, candidates: list):
+    columns = {str(c).strip(): c for c in chunk.columns}
+    for name in candidates:
+        if name in columns:
+            return columns[name]
+    return None
+
+
+def _to_amount(series: pd.Series) -> pd.Series:
+    """'¥1,000' や '1,000円' などを数値に変換"""
+    text = series.astype(str).str.replace(r'[¥￥,円\s]', '', regex=True)
+    return pd.to_numeric(text, errors='coerce')
+
+
+def map_columns(chunk: pd.DataFrame, rules: dict) -> pd.DataFrame:
+    """取込元の列を取引履歴の列（日付/種別/科目/金額/備考/決済方法）にマッピング"""
+    column_rules = rules['columns']
+    mapped = pd.DataFrame(index=chunk.index)
+
+    date_col = _find_column(chunk, column_rules['日付'])
+    mapped['日付'] = pd.to_datetime(chunk[date_col], errors='coerce') if date_col is not None else pd.NaT
+
+    # 金額: 単一の金額列、または入金・出金の2列
+    amount_col = _find_column(chunk, column_rules['金額'])
+    income_col = _find_column(chunk, rules['income_columns'])
+    expense_col = _find_column(chunk, rules['expense_columns'])
+    type_col = _find_column(chunk, column_rules['種別'])
+    if amount_col is not None:
+        amount = _to_amount(chunk[amount_col])
+        if type_col is not None:
+            kind = chunk[type_col].fillna('').astype(str).str.strip().replace(rules['type_values'])
+        else:
+            # 種別の列がなければ符号で判定（マイナスは支出）
+            kind = pd.Series('収入', index=chunk.index).where(amount >= 0, '支出')
+        mapped['金額'] = amount.abs()
+        mapped['種別'] = kind
+    elif income_col is not None or expense_col is not None:
+        income = _to_amount(chunk[income_col]).fillna(0) if income_col is not None else 0
+        expense = _to_amount(chunk[expense_col]).fillna(0) if expense_col is not None else 0
+        income = pd.Series(income, index=chunk.index)
+        expense = pd.Series(expense, index=chunk.index)
+        mapped['金額'] = income.where(income > 0, expense)
+        mapped['種別'] = pd.Series('収入', index=chunk.index).where(income > 0, '支出')
+    else:
+        mapped['金額'] = float('nan')
+        mapped['種別'] = ''
+
+    category_col = _find_column(chunk, column_rules['科目'])
+    default_category = mapped['種別'].map({
+        '収入': rules['default_income_category'],
+        '支出': rules['default_expense_category'],
+    }).fillna(rules['default_expense_category'])
+    if category_col is not None:
+        category = chunk[category_col].fillna('').astype(str).str.strip()
+        mapped['科目'] = category.where(category != '', default_category)
+    else:
+        mapped['科目'] = default_category
+
+    note_col = _find_column(chunk, column_rules['備考'])
+    mapped['備考'] = chunk[note_col].fillna('').astype(str).str.strip() if note_col is not None else ''
+
+    method_col = _find_column(chunk, column_rules['決済方法'])
+    if method_col is not None:
+        method = chunk[method_col].fillna('').astype(str).str.strip()
+        mapped['決済方法'] = method.where(method != '', rules['default_method'])
+    else:
+        mapped['決済方法'] = rules['default_method']
+
+    return mapped[LEDGER_COLUMNS]
+
+
+def import_ledger_file(
+    file,
+    filename: str,
+    existing_df: pd.DataFrame,
+    append_rows: Callable[[list], bool],
+    rules: dict = None,
+    chunk_size: int = CHUNK_SIZE,
+    progress: Callable[[int], None] = None,
+) -> ImportResult:
+    """ファイルをチャンク単位で取り込み、重複を除いてまとめて追記
+
+    既存の取引履歴と同じキーの行は、既存の件数まで重複として除く
+    （ファイル内の同じ内容の行は別々の取引として取り込み、同じファイルを2回取り込んでも増えない）。
+    append_rows: 取引履歴の列順の行リストを受け取り追記する関数（チャンクごとに1回呼ぶ）
+    progress: 読み込んだ行数の累計を受け取るコールバック
+    """
+    rules = build_rules(rules)
+    index = build_dedupe_index(existing_df)
+    read = imported = duplicates = invalid = 0
+
+    for chunk in iter_file_chunks(file, filename, chunk_size):
+        read += len(chunk)
+        mapped = map_columns(chunk, rules)
+
+        valid = mapped['日付'].notna() & mapped['金額'].notna() & (mapped['金額'] > 0) \
+            & mapped['種別'].isin(['収入', '支出'])
+        invalid += int((~valid).sum())
+        mapped = mapped[valid]
+
+        rows = []
+        for date, kind, category, amount, note, method in mapped.itertuples(index=False):
+            key = dedupe_key(date, amount, note)
+            if index[key] > 0:
+                index[key] -= 1
+                duplicates += 1
+                continue
+            amount = int(amount) if float(amount).is_integer() else float(amount)
+            rows.append([date.strftime('%Y-%m-%d'), kind, category, amount, note, method])
+
+        if rows:
+            if not append_rows(rows):
+                raise RuntimeError(f"{imported + 1}行目以降の追記に失敗しました")
+            imported += len(rows)
+        if progress is not None:
+            progress(read)
+
+    return ImportResult(read, imported, duplicates, invalid)
@@ -0,0 +1,502 @@
+"""
+取引履歴・交通費会計の改ざん検知
+書き込みのたびに行ごとのハッシュを隠しシート（_seals）に追記しておき、シートの現在の内容から作った
+Merkle木と記録から作ったMerkle木を根から比べて、食い違う部分木だけをたどって最初に異なる行を見つける。
+アプリ以外（シートの直接編集など）で過去の行が書き換えられていれば、記録と一致しなくなる
+
+記録: (シート, 行, ハッシュ, 記録日時, 前, 連鎖) の追記のみ。同じ行の最後の記録が有効で、ハッシュが空なら削除された行。
+各記録の連鎖は、それより前の記録の連鎖（前 はその先頭16桁）と記録の内容から作るHMACで、secrets.toml の integrity_key を
+知らなければ作れない。記録の偽造・削除・並べ替え・古い記録の再利用は連鎖が一致しなくなり、一致しない記録は使わない。
+最新の連鎖（python cli.py check --anchor で控えに残す）がのちの記録にあれば、それまでの記録は書き換えられていない
+
+設定（secrets.toml）:
+    integrity_key = "十分に長いランダムな文字列"   # 未設定ならハッシュは鍵なし（記録の偽造を検知できない）
+"""
+import hashlib
+import hmac
+import threading
+from datetime import datetime
+from secrets import token_hex
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype
+
+from .runtime import get_secrets, notify
+from .sheets import (
+    DATABASE_COLUMNS, SHEET_DATABASE, SHEET_TRANSPORT_BALANCE,
+    append_rows_to_sheet, get_write_lock, load_sheet_as_dataframe, save_dataframe_to_sheet
+)
+from .tenants import current_tenant
+
+SHEET_SEALS = '_seals'
+SEAL_COLUMNS = ['シート', '行', 'ハッシュ', '記録日時', '前', '連鎖']
+
+# 記録の前 に残す、前の記録の連鎖の桁数（16進）
+PREVIOUS_DIGITS = 16
+
+# 記録する列 {シート: (列, 日付の列, 数値の列)}
+SEALED_SHEETS = {
+    SHEET_DATABASE: (DATABASE_COLUMNS, ['日付'], ['金額']),
+    SHEET_TRANSPORT_BALANCE: (['日付', '項目', '収入', '支出', '残高'], ['日付'], ['収入', '支出', '残高']),
+}
+
+# 記録の行数が有効な行の数のこの倍を超えたら、有効な記録だけに書き直す
+SEAL_COMPACT_RATIO = 2
+SEAL_COMPACT_MIN = 1000
+
+# 空き（削除された行・まだない行）の葉。空きだけの部分木も EMPTY になる
+EMPTY = bytes(32)
+
+# 最初の記録の前の連鎖
+GENESIS = bytes(32)
+
+
+def _key() -> bytes:
+    try:
+        return str(get_secrets().get('integrity_key', '')).encode('utf-8')
+    except Exception:
+        return b''
+
+
+def has_key() -> bool:
+    """secrets.toml に integrity_key があるか（なければ記録の偽造は検知できない）"""
+    return bool(_key())
+
+
+def _digest(key: bytes, data: bytes) -> bytes:
+    """鍵があればHMAC-SHA256、なければSHA-256"""
+    return hmac.digest(key, data, 'sha256') if key else hashlib.sha256(data).digest()
+
+
+def _node(left: bytes, right: bytes) -> bytes:
+    if left == EMPTY and right == EMPTY:
+        return EMPTY
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+class MerkleTree:
+    """行ラベルの位置に行のハッシュを置いたMerkle木
+
+    葉を変えると印を付けておき、根が必要になったときに印の付いた経路だけをまとめて計算し直す
+    （末尾への追加は1件あたり償却O(1)、変更はO(log n)）
+    """
+
+    def __init__(self):
+        # levels[0] が葉、levels[-1] が [根]（葉の数は2のべき乗）
+        self.levels = [[EMPTY]]
+        self._dirty = set()
+
+    @classmethod
+    def from_leaves(cls, leaves: dict) -> 'MerkleTree':
+        tree = cls()
+        size = max(leaves, default=-1) + 1
+        while len(tree.levels[0]) < size:
+            tree._grow()
+        for label, leaf in leaves.items():
+            tree.levels[0][label] = leaf
+        for h in range(len(tree.levels) - 1):
+            below = tree.levels[h]
+            tree.levels[h + 1] = [_node(below[i], below[i + 1]) for i in range(0, len(below), 2)]
+        tree._dirty = set()
+        return tree
+
+    @property
+    def leaves(self) -> list:
+        return self.levels[0]
+
+    def _grow(self):
+        """葉の数を2倍にする（増えた右半分は空き）"""
+        for level in self.levels:
+            level.extend([EMPTY] * len(level))
+        self.levels.append([EMPTY])
+        self._dirty.add(0)
+
+    def set(self, label: int, leaf: bytes):
+        while label >= len(self.levels[0]):
+            self._grow()
+        if self.levels[0][label] != leaf:
+            self.levels[0][label] = leaf
+            self._dirty.add(label)
+
+    def assign(self, leaves: dict):
+        """葉を leaves（{行ラベル: ハッシュ}）に合わせる（変わった葉の経路だけを計算し直す）"""
+        while max(leaves, default=-1) >= len(self.levels[0]):
+            self._grow()
+        target = [EMPTY] * len(self.levels[0])
+        for label, leaf in leaves.items():
+            target[label] = leaf
+        current = self.levels[0]
+        changed = [label for label, (a, b) in enumerate(zip(current, target)) if a != b]
+        for label in changed:
+            current[label] = target[label]
+        self._dirty.update(changed)
+
+    def _flush(self):
+        dirty = self._dirty
+        for h in range(len(self.levels) - 1):
+            if not dirty:
+                break
+            below, above = self.levels[h], self.levels[h + 1]
+            dirty = {i >> 1 for i in dirty}
+            for i in dirty:
+                above[i] = _node(below[2 * i], below[2 * i + 1])
+        self._dirty = set()
+
+    @property
+    def root(self) -> bytes:
+        self._flush()
+        return self.levels[-1][0]
+
+    def differences(self, other: 'MerkleTree'):
+        """葉が異なる行ラベルを昇順に返す（根から、ハッシュが一致する部分木は読み飛ばす）"""
+        for tree, target in ((self, other), (other, self)):
+            while len(tree.levels) < len(target.levels):
+                tree._grow()
+        self._flush()
+        other._flush()
+        stack = [(len(self.levels) - 1, 0)]
+        while stack:
+            h, i = stack.pop()
+            if self.levels[h][i] == other.levels[h][i]:
+                continue
+            if h == 0:
+                yield i
+                continue
+            stack += [(h - 1, 2 * i + 1), (h - 1, 2 * i)]
+
+
+# ======================
+# 行のハッシュ
+# ======================
+
+def _canonical_column(values: pd.Series, kind: str) -> pd.Series:
+    """比較用の文字列（日付は YYYY-MM-DD、整数値の数値は整数表記。読めない値は元の文字列のまま）"""
+    if kind == 'text':
+        return values.fillna('').astype(str).str.strip()
+    text = np.full(len(values), None, dtype=object)
+    if kind == 'date':
+        dates = values if is_datetime64_any_dtype(values) else pd.to_datetime(values, errors='coerce')
+        days = dates.to_numpy().astype('datetime64[D]')
+        valid = ~np.isnat(days)
+        text[valid] = np.datetime_as_string(days[valid])
+    else:
+        numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        valid = np.isfinite(numbers)
+        integral = valid & (numbers == np.floor(numbers))
+        text[integral] = numbers[integral].astype(np.int64).astype(str)
+        text[valid & ~integral] = [repr(v) for v in numbers[valid & ~integral].tolist()]
+    text = pd.Series(text, index=values.index, dtype=object)
+    if not valid.all():
+        text[~valid] = values[~valid].fillna('').astype(str).str.strip()
+    return text
+
+
+def row_hashes(sheet: str, df: pd.DataFrame) -> dict:
+    """行ごとのハッシュ {行ラベル: ハッシュ}（列を区切り文字でつないだ文字列のHMAC-SHA256）"""
+    if len(df) == 0:
+        return {}
+    columns, dates, numbers = SEALED_SHEETS[sheet]
+    texts = [
+        _canonical_column(df[col] if col in df.columns else pd.Series('', index=df.index),
+                          'date' if col in dates else 'number' if col in numbers else 'text')
+        for col in columns
+    ]
+    key = _key()
+    return {
+        int(label): _digest(key, b'\x00' + '\x1f'.join(values).encode('utf-8'))
+        for label, values in zip(df.index.tolist(), zip(*(text.tolist() for text in texts)))
+    }
+
+
+# ======================
+# 記録
+# ======================
+
+class SealLog(NamedTuple):
+    """読み込んだ記録"""
+    # {シート: {行ラベル: ハッシュ}}（連鎖が一致する記録だけ。削除された行は含まない）
+    seals: dict
+    # 記録の行数
+    rows: int
+    # 連鎖が一致する最後の記録の連鎖（次の記録の前）
+    head: bytes
+    # 連鎖が一致しない記録の位置（0始まり。シートでは +2 行目）
+    broken: list
+    # 記録にある連鎖と、書き直す前の最後の連鎖（控えと照合する）
+    known: set
+    # 書き直した記録（シート=_seals, 行=書き直す前の行数, ハッシュ=書き直す前の最後の連鎖）
+    markers: list
+
+
+# プロセス内の最後に書き込んだ連鎖 {テナント: 連鎖}（記録を追記するたびにシートを読み直さない）
+# 別のプロセスが追記していても、前の記録が記録にあれば連鎖は一致する
+_heads = {}
+
+
+def _link(key: bytes, previous: bytes, record: list) -> bytes:
+    """記録の連鎖（記録日時は表示形式で変わりうるため含めない）"""
+    sheet, label, digest = record[:3]
+    return _digest(key, previous + '\x1f'.join([str(sheet), str(label), str(digest)]).encode('utf-8'))
+
+
+def _chain(records: list, head: bytes) -> list:
+    """(シート, 行, ハッシュ, 記録日時) の記録に前・連鎖を付ける"""
+    key = _key()
+    chained = []
+    for record in records:
+        link = _link(key, head, record)
+        chained.append(list(record) + [head.hex()[:PREVIOUS_DIGITS], link.hex()])
+        head = link
+    return chained
+
+
+def load_seals() -> SealLog:
+    """記録を読み込み、連鎖をたどって一致する記録だけを集める"""
+    log = load_sheet_as_dataframe(SHEET_SEALS, SEAL_COLUMNS)
+    seals = {sheet: {} for sheet in SEALED_SHEETS}
+    head, broken, markers = GENESIS, [], []
+    known = {GENESIS}
+    # 前（連鎖の先頭16桁）→ それまでに現れた連鎖
+    links = {GENESIS.hex()[:PREVIOUS_DIGITS]: [GENESIS]}
+    key = _key()
+    if len(log) > 0:
+        labels = pd.to_numeric(log['行'], errors='coerce')
+        columns = [
+            log['シート'].astype(str).tolist(), labels.tolist(), log['ハッシュ'].astype(str).tolist(),
+            log['記録日時'].astype(str).tolist(),
+            (log['前'] if '前' in log.columns else pd.Series('', index=log.index)).astype(str).tolist(),
+            (log['連鎖'] if '連鎖' in log.columns else pd.Series('', index=log.index)).astype(str).tolist(),
+        ]
+        for position, (sheet, label, digest, stamp, previous, link) in enumerate(zip(*columns)):
+            try:
+                link = bytes.fromhex(link)
+            except ValueError:
+                link = b''
+            valid = label == label and link not in known and any(
+                hmac.compare_digest(_link(key, candidate, [sheet, int(label), digest]), link)
+                for candidate in links.get(previous, [])
+            )
+            if not valid:
+                broken.append(position)
+                continue
+            known.add(link)
+            links.setdefault(link.hex()[:PREVIOUS_DIGITS], []).append(link)
+            head = link
+            if sheet == SHEET_SEALS:
+                markers.append([sheet, int(label), digest, stamp])
+                known.add(bytes.fromhex(digest))
+            elif sheet in seals:
+                if digest:
+                    seals[sheet][int(label)] = bytes.fromhex(digest)
+                else:
+                    seals[sheet].pop(int(label), None)
+    _heads[current_tenant()] = head
+    return SealLog(seals, len(log), head, broken, known, markers)
+
+
+def _records(sheet: str, hashes: dict, deleted=()) -> list:
+    stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return [[sheet, int(label), '', stamp] for label in deleted] + \
+        [[sheet, label, digest.hex(), stamp] for label, digest in hashes.items()]
+
+
+def _append(records: list, head: bytes) -> bool:
+    """記録を head の続きに追記（get_write_lock(SHEET_SEALS) の中で呼ぶ）"""
+    chained = _chain(records, head)
+    ok = append_rows_to_sheet(chained, SEAL_COLUMNS, SHEET_SEALS, bump_revision=False)
+    if ok:
+        _heads[current_tenant()] = bytes.fromhex(chained[-1][-1])
+    return ok
+
+
+def _rewrite(log: SealLog, seals: dict) -> bool:
+    """有効な記録だけに書き直す（書き直す前の最後の連鎖を先頭に残し、控えと照合できるようにする）"""
+    markers = log.markers + ([[SHEET_SEALS, log.rows, log.head.hex(), datetime.now().strftime('%Y-%m-%d %H:%M:%S')]]
+                             if log.rows > 0 else [])
+    records = markers + [record for name, leaves in seals.items() for record in _records(name, leaves)]
+    chained = _chain(records, GENESIS)
+    ok = save_dataframe_to_sheet(pd.DataFrame(chained, columns=SEAL_COLUMNS), SHEET_SEALS)
+    if ok:
+        _heads[current_tenant()] = bytes.fromhex(chained[-1][-1]) if chained else GENESIS
+    return ok
+
+
+def seal_rows(sheet: str, df: pd.DataFrame, deleted=()) -> bool:
+    """書き込んだ行（と削除した行ラベル）のハッシュを記録に追記（追加・変更した行の数だけ）"""
+    records = _records(sheet, row_hashes(sheet, df), deleted)
+    if not records:
+        return True
+    with get_write_lock(SHEET_SEALS):
+        head = _heads.get(current_tenant())
+        if head is None:
+            head = load_seals().head
+        return _append(records, head)
+
+
+class SealResult(NamedTuple):
+    """シート全体の書き込み後の記録の結果"""
+    ok: bool
+    # 追記した記録の数
+    records: int
+    # アプリが変更していないのに記録と異なる行ラベル（記録し直さない。check で改ざんとして報告される）
+    mismatched: list
+
+
+def seal_frame(sheet: str, df: pd.DataFrame, changed=None) -> SealResult:
+    """シート全体を書き込んだ後に、アプリが変更した行 changed（行ラベル）のハッシュだけを追記
+
+    変更していない行は記録と照合し、異なる行（シートの直接編集など）は記録し直さずに警告する。
+    changed=None はシートの現在の内容をすべて正しいものとして、記録を書き直す（python cli.py seal・バックアップからの復元）。
+    まだ記録のないシートは python cli.py seal で記録するまで何もしない。
+    記録が有効な行の数に比べて長くなっていれば、有効な記録だけに書き直す
+    """
+    with get_write_lock(SHEET_SEALS):
+        log = load_seals()
+        sealed = log.seals[sheet]
+        if changed is not None and not sealed:
+            return SealResult(True, 0, [])
+        hashes = row_hashes(sheet, df)
+        if changed is None:
+            seals = dict(log.seals, **{sheet: hashes})
+            ok = _rewrite(log, seals)
+            return SealResult(ok, len(hashes), [])
+
+        accepted = set(changed) & set(hashes)
+        updates = {label: hashes[label] for label in sorted(accepted) if sealed.get(label) != hashes[label]}
+        mismatched = sorted(
+            label for label in set(hashes) | set(sealed)
+            if label not in accepted and sealed.get(label) != hashes.get(label)
+        )
+        if mismatched:
+            more = f"ほか{len(mismatched) - 1:,}行、" if len(mismatched) > 1 else ''
+            notify('warning', f"⚠️ {sheet} の行 {mismatched[0]} が記録と異なります"
+                              f"（{more}python cli.py check で確認してください）")
+        records = _records(sheet, updates)
+        if not records:
+            return SealResult(True, 0, mismatched)
+
+        seals = dict(log.seals, **{sheet: {**sealed, **updates}})
+        live = sum(len(leaves) for leaves in seals.values())
+        if log.rows + len(records) > max(SEAL_COMPACT_RATIO * live, SEAL_COMPACT_MIN):
+            ok = _rewrite(log, seals)
+        else:
+            ok = _append(records, log.head)
+        return SealResult(ok, len(records), mismatched)
+
+
+# ======================
+# 控え
+# ======================
+
+class Anchor(NamedTuple):
+    """記録の外に残した最新の連鎖"""
+    time: str
+    tenant: str
+    rows: int
+    head: str
+
+
+def read_anchor(path: str):
+    """控えのファイルから現在のテナントの最後の控えを読む（なければNone）"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            lines = [line.rstrip('\n').split('\t') for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+    anchors = [Anchor(t, tenant, int(rows), head) for t, tenant, rows, head in lines if tenant == current_tenant()]
+    return anchors[-1] if anchors else None
+
+
+def write_anchor(path: str, log: SealLog) -> Anchor:
+    """最新の連鎖を控えのファイルに追記（リポジトリ・メールなどスプレッドシートの外に保管する）"""
+    anchor = Anchor(datetime.now().strftime('%Y-%m-%d %H:%M:%S'), current_tenant(), log.rows, log.head.hex())
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('\t'.join(map(str, anchor)) + '\n')
+    return anchor
+
+
+# ======================
+# 検証
+# ======================
+
+class IntegrityResult(NamedTuple):
+    """シートの内容と記録の比較結果"""
+    sheet: str
+    rows: int
+    # 記録されている行の数（0なら未記録）
+    sealed: int
+    # シートの現在の内容のMerkle木の根（16進）
+    root: str
+    # 記録と異なる行ラベル（昇順）
+    diverged: list
+    # 最初に異なる行の現在の内容と記録のハッシュ（なければEMPTY）
+    current: bytes = EMPTY
+    recorded: bytes = EMPTY
+
+    @property
+    def ok(self) -> bool:
+        return not self.diverged
+
+    @property
+    def first(self):
+        return self.diverged[0] if self.diverged else None
+
+
+# テナント・シートごとの前回の検証の木 {(テナント, シート): (行の指紋, 現在の内容の木, 記録の木)}
+# 検証のたびに作り直さず、前回から変わった葉の経路だけを計算し直す
+_trees = {}
+_trees_lock = threading.Lock()
+
+# 行の指紋（hash_pandas_object）のキー。指紋は前回から変わっていない行のSHA-256を省くためだけに使い、
+# 指紋をそろえた書き換えで検知を逃れられないよう、キーはプロセスごとに変える
+_FINGERPRINT_KEY = token_hex(8)
+
+
+def _fingerprints(sheet: str, df: pd.DataFrame) -> pd.Series:
+    columns = [col for col in SEALED_SHEETS[sheet][0] if col in df.columns]
+    return pd.util.hash_pandas_object(df[columns], index=False, hash_key=_FINGERPRINT_KEY)
+
+
+def _trees_for(sheet: str, df: pd.DataFrame, sealed: dict):
+    """(現在の内容の木, 記録の木)（前回の検証から変わった行のハッシュだけを計算し直す）"""
+    key = (current_tenant(), sheet)
+    fingerprints = _fingerprints(sheet, df)
+    previous = _trees.get(key)
+    if previous is None:
+        current = MerkleTree.from_leaves(row_hashes(sheet, df))
+        recorded = MerkleTree.from_leaves(sealed)
+    else:
+        last, current, recorded = previous
+        changed = last.reindex(fingerprints.index, fill_value=0).to_numpy() != fingerprints.to_numpy()
+        for label in last.index.difference(fingerprints.index):
+            current.set(int(label), EMPTY)
+        for label, leaf in row_hashes(sheet, df[changed]).items():
+            current.set(label, leaf)
+        recorded.assign(sealed)
+    _trees[key] = (fingerprints, current, recorded)
+    return current, recorded
+
+
+def verify_sheet(sheet: str, df: pd.DataFrame, sealed: dict) -> IntegrityResult:
+    """シートの内容（行ラベルは書き込み時と同じもの）を記録 sealed（load_seals().seals の値）と比較"""
+    with _trees_lock:
+        current, recorded = _trees_for(sheet, df, sealed)
+        diverged = list(current.differences(recorded))
+        root = current.root.hex()
+        first = diverged[0] if diverged else None
+        leaves = (current.leaves[first], recorded.leaves[first]) if diverged else (EMPTY, EMPTY)
+    return IntegrityResult(sheet, len(df), len(sealed), root, diverged, *leaves)
+
+
+def describe(result: IntegrityResult) -> str:
+    """最初に異なる行の説明"""
+    if result.current == EMPTY:
+        kind = '記録にある行がありません'
+    elif result.recorded == EMPTY:
+        kind = '記録にない行です'
+    else:
+        kind = '内容が記録と異なります'
+    more = f"（ほかに{len(result.diverged) - 1:,}行）" if len(result.diverged) > 1 else ''
+    return f"{result.sheet} の行 {result.first}: {kind}{more}"
@@ -0,0 +1,181 @@
+"""
+取引履歴のジャーナル（追記専用の変更履歴）
+取引の追加・変更・削除をイベントとして追記し、
+現在の内容はスナップショット（databaseシート）に最新のジャーナルを再生して作る
+"""
+from datetime import datetime
+
+import pandas as pd
+
+from .merge import normalize_frame
+
+LEDGER_COLUMNS = ['日付', '種別', '科目', '金額', '備考', '決済方法']
+
+# リビジョン: イベントを書き込んだ保存のリビジョン番号（同じ保存のイベントは同じ番号）
+# 行ID: 取引を追加したときに振った番号（圧縮後も変わらない）
+JOURNAL_COLUMNS = ['リビジョン', '日時', '担当', '操作', '行ID'] + LEDGER_COLUMNS
+
+# スナップショット（databaseシート）も行IDの列を持ち、シートで行を並べ替え・挿入・削除しても
+# イベントは同じ取引に反映される
+SNAPSHOT_COLUMNS = LEDGER_COLUMNS + ['行ID']
+
+OP_INSERT = '追加'
+OP_UPDATE = '変更'
+OP_DELETE = '削除'
+
+# この回数の保存ごとにジャーナルをスナップショットへ圧縮する
+COMPACT_EVERY = 100
+
+
+def _row_values(df: pd.DataFrame) -> list:
+    """取引の行をシートに書き込む値のリストにする（日付は YYYY-MM-DD、金額は数値）"""
+    normalized = normalize_frame(df, LEDGER_COLUMNS)
+    amounts = [int(v) if float(v).is_integer() else float(v) for v in normalized['金額'].tolist()]
+    return [row[:3] + [amount] + row[4:] for row, amount in zip(normalized.values.tolist(), amounts)]
+
+
+def build_events(removed: pd.DataFrame, added: pd.DataFrame, revision: int, user: str,
+                 timestamp: datetime = None) -> list:
+    """変更（削除・変更前の行, 追加・変更後の行）をジャーナルの行のリストにする
+
+    同じ行IDが両方にあれば変更、removedだけなら削除、addedだけなら追加。
+    削除イベントには削除した行の内容を残す（監査用）
+    """
+    stamp = (timestamp or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+    user = user or ''
+    updated = set(removed.index) & set(added.index)
+    deleted = removed[~removed.index.isin(updated)]
+
+    events = []
+    for label, values in zip(deleted.index, _row_values(deleted)):
+        events.append([revision, stamp, user, OP_DELETE, int(label)] + values)
+    for label, values in zip(added.index, _row_values(added)):
+        op = OP_UPDATE if label in updated else OP_INSERT
+        events.append([revision, stamp, user, op, int(label)] + values)
+    return events
+
+
+def typed_journal(df: pd.DataFrame) -> pd.DataFrame:
+    """ジャーナルのリビジョン・行IDを整数にする"""
+    if len(df) == 0:
+        return pd.DataFrame(columns=JOURNAL_COLUMNS)
+    return df.assign(
+        リビジョン=pd.to_numeric(df['リビジョン'], errors='coerce').fillna(0).astype(int),
+        行ID=pd.to_numeric(df['行ID'], errors='coerce').fillna(-1).astype(int),
+    )
+
+
+def snapshot_rows(snapshot: pd.DataFrame, journal: pd.DataFrame) -> pd.DataFrame:
+    """スナップショットの行IDの列を行ラベルにした内容（行IDの列は除く）
+
+    シートに直接追加された行（行IDが空・他の行と重複）には、スナップショットの行IDの続きで
+    ジャーナルが使っていない番号を振る（アプリは常に内容全体の続きの番号で追加するため、
+    ジャーナルが伸びても読み込み直したときに同じ番号になる）。
+    行IDの列がない古いスナップショットは行の位置を行IDとする
+    """
+    if '行ID' not in snapshot.columns:
+        return snapshot
+    ids = pd.to_numeric(snapshot['行ID'], errors='coerce')
+    valid = ids.notna() & (ids >= 0) & (ids == ids.round())
+    valid &= ~ids.where(valid).duplicated()
+    labels = ids.where(valid).astype('Int64')
+    missing = int((~valid).sum())
+    if missing:
+        used = set(journal['行ID'].tolist()) if len(journal) > 0 else set()
+        candidate = int(labels.max()) + 1 if valid.any() else 0
+        fresh = []
+        while len(fresh) < missing:
+            if candidate not in used:
+                fresh.append(candidate)
+            candidate += 1
+        labels[~valid] = fresh
+    return snapshot.drop(columns='行ID').set_axis(pd.Index(labels.to_numpy(dtype='int64')))
+
+
+def replay(snapshot: pd.DataFrame, journal: pd.DataFrame, after_revision: int) -> pd.DataFrame:
+    """スナップショットに after_revision より後のイベントを再生した内容
+
+    行IDごとに最後のイベントだけを反映する（各イベントは行の内容をすべて持つため）
+    """
+    tail = journal[journal['リビジョン'] > after_revision] if len(journal) > 0 else journal
+    if len(tail) == 0:
+        return snapshot
+
+    last = tail.drop_duplicates('行ID', keep='last')
+    upserts = last[last['操作'] != OP_DELETE]
+
+    touched = snapshot.index.intersection(pd.Index(last['行ID']))
+    kept = snapshot.drop(index=touched)
+    if len(upserts) == 0:
+        return kept
+    rows = upserts[LEDGER_COLUMNS].set_axis(pd.Index(upserts['行ID'].to_numpy()))
+    rows = rows.assign(
+        日付=pd.to_datetime(rows['日付'], errors='coerce'),
+        金額=pd.to_numeric(rows['金額'], errors='coerce').fillna(0),
+    )
+    return pd.concat([kept, rows]) if len(kept) > 0 else rows
+
+
+def apply_changes(frame: pd.DataFrame, removed: pd.DataFrame, added: pd.DataFrame) -> pd.DataFrame:
+    """変更を反映した内容（変更された行は同じ行IDで置き換える）"""
+    kept = frame.drop(index=removed.index.intersection(frame.index))
+    return pd.concat([kept, added]) if len(added) > 0 else kept
+
+
+def next_label(frame: pd.DataFrame, *journals: pd.DataFrame, floor: int = 0) -> int:
+    """新しい行に振る行ID
+
+    内容・ジャーナル（アーカイブ）で使われた行IDと floor のうち最大のものの次
+    （削除された最新の行の行IDを新しい行に使い直さない）
+    """
+    labels = [int(frame.index.max()) + 1 if len(frame) > 0 else 0, floor]
+    labels += [int(journal['行ID'].max()) + 1 for journal in journals if len(journal) > 0]
+    return max(labels)
+
+
+def renumber_inserts(removed: pd.DataFrame, added: pd.DataFrame, start: int) -> pd.DataFrame:
+    """追加の行（removedにない行ID）が start より前の行IDなら start からの行IDを振り直す"""
+    inserted = ~added.index.isin(removed.index)
+    if not inserted.any() or added.index[inserted].min() >= start:
+        return added
+    labels = added.index.to_numpy().copy()
+    labels[inserted] = range(start, start + int(inserted.sum()))
+    return added.set_axis(pd.Index(labels))
+
+
+def rebase_changes(removed: pd.DataFrame, added: pd.DataFrame, theirs: pd.DataFrame):
+    """他の人の保存後の内容（theirs）に合わせて変更の行IDを付け直す
+
+    変更・削除は変更前の行と同じ内容の行をtheirsから探して対象にする（同じ内容の行が複数あれば
+    同じ行IDの行を優先する。他の人が既に変更・削除していれば競合として除外）。追加はtheirsの続きの行IDを振る。
+    戻り値: (削除・変更前の行, 追加・変更後の行, 競合した自分の変更後の行)
+    """
+    positions = {}
+    for label, key in zip(theirs.index, normalize_frame(theirs, LEDGER_COLUMNS).itertuples(index=False, name=None)):
+        positions.setdefault(key, []).append(label)
+
+    targets = {}
+    conflicts = []
+    removed_keys = normalize_frame(removed, LEDGER_COLUMNS).itertuples(index=False, name=None)
+    for label, key in zip(removed.index, removed_keys):
+        candidates = positions.get(key)
+        if candidates:
+            target = label if label in candidates else candidates[0]
+            candidates.remove(target)
+            targets[label] = target
+        else:
+            conflicts.append(added.loc[label] if label in added.index else removed.loc[label])
+
+    rebased_removed = theirs.loc[list(targets.values())]
+    updated = added[added.index.isin(list(targets))]
+    updated = updated.set_axis(pd.Index([targets[label] for label in updated.index]))
+    inserted = added[~added.index.isin(removed.index)]
+    start = next_label(theirs)
+    inserted = inserted.set_axis(pd.RangeIndex(start, start + len(inserted)))
+    if len(inserted) == 0:
+        rebased_added = updated
+    else:
+        rebased_added = pd.concat([updated, inserted]) if len(updated) > 0 else inserted
+
+    conflict_df = pd.DataFrame(conflicts, columns=LEDGER_COLUMNS).reset_index(drop=True)
+    return rebased_removed, rebased_added, conflict_df
@@ -0,0 +1,216 @@
+"""
+型付きの取引履歴（台帳）
+日付・金額は読み込み時に1回だけ変換して保持し、表示・編集・保存ではコピーを作らずに使い回す。
+日付の文字列化や表示順などの派生データは台帳のバージョンごとにキャッシュする
+"""
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype
+
+from .budget import BudgetTracker
+from .cube import LedgerCube
+from .duplicates import DuplicateIndex
+from .merge import normalize_frame
+from .search import LedgerIndex
+from .timeline import BalanceTimeline
+
+LEDGER_COLUMNS = ['日付', '種別', '科目', '金額', '備考', '決済方法']
+DEFAULT_METHOD = '現金 (財布)'
+
+# 履歴エディタの削除チェック用の列
+DELETE_COLUMN = '削除'
+
+
+def typed_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """日付・金額・文字列の列を台帳の型にそろえる（既に正しい型の列は変換しない）"""
+    changes = {}
+    if '日付' in df.columns and not is_datetime64_any_dtype(df['日付']):
+        changes['日付'] = pd.to_datetime(df['日付'], errors='coerce')
+    if '金額' in df.columns and not is_numeric_dtype(df['金額']):
+        changes['金額'] = pd.to_numeric(df['金額'], errors='coerce').fillna(0)
+    if '決済方法' not in df.columns:
+        changes['決済方法'] = DEFAULT_METHOD
+    if '備考' in df.columns and df['備考'].isna().any():
+        changes['備考'] = df['備考'].fillna('').astype(str)
+    return df.assign(**changes) if changes else df
+
+
+class Ledger:
+    """型付きの取引履歴と、バージョンごとにキャッシュする派生データ"""
+
+    def __init__(self, frame: pd.DataFrame, revision: int):
+        self.frame = typed_frame(frame)
+        self.revision = revision
+        self.cube = LedgerCube.from_ledger(self.frame)
+        self.budget = BudgetTracker.from_cube(self.cube)
+        self._search_index = None
+        self._duplicate_index = None
+        self._timeline = None
+        self._clear_cache()
+
+    def _clear_cache(self):
+        self._date_text = None
+        self._order = None
+        self._frames = {}
+
+    @property
+    def version(self) -> tuple:
+        """キャッシュのキーに使うバージョン"""
+        return (self.revision, len(self.frame))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def update(self, frame: pd.DataFrame, revision: int, removed: pd.DataFrame, added: pd.DataFrame):
+        """保存後の内容を反映し、集計キューブ・予算実績を変更分だけ更新"""
+        self.frame = typed_frame(frame)
+        self.revision = revision
+        self.cube.apply(removed, added)
+        self.budget.apply(removed, added)
+        if self._search_index is not None:
+            self._search_index.apply(removed, added)
+        if self._duplicate_index is not None:
+            self._duplicate_index.apply(removed, added)
+        if self._timeline is not None:
+            self._timeline.apply(removed, added)
+        self._clear_cache()
+
+    @property
+    def search_index(self) -> LedgerIndex:
+        """検索インデックス（初回の検索時に作成し、以降は書き込みごとに差分更新）"""
+        if self._search_index is None:
+            self._search_index = LedgerIndex.from_ledger(self.frame)
+        return self._search_index
+
+    def search(self, **conditions) -> pd.DataFrame:
+        """検索インデックスで条件に合う行を新しい順に取得"""
+        return self.frame.loc[self.search_index.search(**conditions)]
+
+    @property
+    def duplicate_index(self) -> DuplicateIndex:
+        """重複検出のインデックス（初回の確認時に作成し、以降は書き込みごとに差分更新）"""
+        if self._duplicate_index is None:
+            self._duplicate_index = DuplicateIndex.from_ledger(self.frame)
+        return self._duplicate_index
+
+    @property
+    def timeline(self) -> BalanceTimeline:
+        """残高の推移（初回のグラフ作成時に作成し、以降は書き込みごとに差分更新）"""
+        if self._timeline is None:
+            self._timeline = BalanceTimeline.from_ledger(self.frame)
+        return self._timeline
+
+    def find_duplicates(self, rows: pd.DataFrame) -> pd.DataFrame:
+        """登録しようとしている行と日付・種別・科目・金額・決済方法が同じ既存の行"""
+        found = self.duplicate_index.find(typed_frame(rows))
+        labels = sorted({label for labels in found.values() for label in labels})
+        return self.frame.loc[labels]
+
+    # ----------------------
+    # 表示用の派生データ（バージョンごとに1回だけ作成）
+    # ----------------------
+
+    def date_text(self) -> pd.Series:
+        """日付の表示用文字列（YYYY-MM-DD）"""
+        if self._date_text is None:
+            self._date_text = self.frame['日付'].dt.strftime('%Y-%m-%d').fillna('')
+        return self._date_text
+
+    def display_order(self) -> pd.Index:
+        """新しい順に並べたときの行ラベル"""
+        if self._order is None:
+            self._order = self.frame['日付'].sort_values(ascending=False, kind='stable').index
+        return self._order
+
+    def display_frame(self, columns: list) -> pd.DataFrame:
+        """表示用の表（日付は文字列、新しい順）"""
+        key = ('display',) + tuple(columns)
+        if key not in self._frames:
+            order = self.display_order()
+            table = {}
+            for col in columns:
+                values = self.date_text() if col == '日付' else self.frame[col]
+                table[col] = values.reindex(order).to_numpy()
+            self._frames[key] = pd.DataFrame(table)
+        return self._frames[key]
+
+    def editor_frame(self, columns: list) -> pd.DataFrame:
+        """履歴エディタ用の表（先頭に削除チェック列）"""
+        key = ('editor',) + tuple(columns)
+        if key not in self._frames:
+            editor = self.display_frame(columns).copy(deep=False)
+            editor.insert(0, DELETE_COLUMN, False)
+            self._frames[key] = editor
+        return self._frames[key]
+
+    # ----------------------
+    # 履歴エディタの変更
+    # ----------------------
+
+    def _typed_rows(self, rows: list, index: list) -> pd.DataFrame:
+        if not rows:
+            return self.frame.iloc[0:0]
+        return typed_frame(pd.DataFrame(rows, index=index, columns=list(self.frame.columns)))
+
+    def editor_changes(self, state: dict):
+        """data_editorの編集状態から (削除・変更前の行, 追加・変更後の行) を作成
+
+        state は st.session_state[key] の {'edited_rows', 'added_rows', 'deleted_rows'}。
+        行番号は editor_frame の表示順。変更後の行は元の行ラベルを引き継ぐ
+        """
+        empty = self.frame.iloc[0:0]
+        if not state:
+            return empty, empty
+
+        order = self.display_order()
+        removed_labels = [order[int(pos)] for pos in state.get('deleted_rows', [])]
+        # 削除した行の編集は無視する（同じ行IDに削除と変更のイベントを両方作らない）
+        deleted = set(removed_labels)
+        updated_rows, updated_labels = [], []
+        for pos, changes in state.get('edited_rows', {}).items():
+            label = order[int(pos)]
+            if label in deleted:
+                continue
+            if changes.get(DELETE_COLUMN):
+                removed_labels.append(label)
+                continue
+            values = {col: value for col, value in changes.items() if col in self.frame.columns}
+            if not values:
+                continue
+            row = self.frame.loc[label].to_dict()
+            row.update(values)
+            updated_rows.append(row)
+            updated_labels.append(label)
+
+        updated = self._typed_rows(updated_rows, updated_labels)
+        if len(updated) > 0:
+            # 値が元に戻されただけの行は変更なしとして扱う
+            original = self.frame.loc[updated.index]
+            same = (normalize_frame(original, LEDGER_COLUMNS) == normalize_frame(updated, LEDGER_COLUMNS)).all(axis=1)
+            updated = updated[~same]
+
+        new_rows = [
+            {col: row.get(col, '') for col in self.frame.columns}
+            for row in state.get('added_rows', [])
+            if not row.get(DELETE_COLUMN) and any(row.get(col) not in (None, '') for col in LEDGER_COLUMNS)
+        ]
+        start = self._next_label()
+        inserted = self._typed_rows(new_rows, list(range(start, start + len(new_rows))))
+
+        removed = self.frame.loc[list(dict.fromkeys(removed_labels)) + list(updated.index)]
+        added = pd.concat([updated, inserted]) if len(inserted) > 0 else updated
+        return removed, added
+
+    def _next_label(self) -> int:
+        """新しい行に付けるラベル"""
+        return int(self.frame.index.max()) + 1 if len(self.frame) > 0 else 0
+
+    def with_appended(self, rows: pd.DataFrame):
+        """行を末尾に追加した新しい取引履歴と、ラベルを付け直した追加行"""
+        start = self._next_label()
+        rows = typed_frame(rows.set_axis(range(start, start + len(rows))))
+        return pd.concat([self.frame, rows]), rows
+
+    def with_changes(self, removed: pd.DataFrame, added: pd.DataFrame) -> pd.DataFrame:
+        """変更を反映した新しい取引履歴（変更された行は同じラベルで置き換える）"""
+        kept = self.frame.drop(index=removed.index)
+        return pd.concat([kept, added]) if len(added) > 0 else kept
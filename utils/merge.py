@@ -0,0 +1,135 @@
+"""
+行単位の3-wayマージ
+同時編集時に、保存元（base）からの自分の変更を最新のシート内容（theirs）へ適用する
+"""
+from datetime import date, datetime
+
+import pandas as pd
+
+
+def normalize_value(value) -> str:
+    """比較用に値を正規化（日付は YYYY-MM-DD、整数値の数値は整数表記）"""
+    if value is None:
+        return ''
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        if pd.isna(value):
+            return ''
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float):
+        if pd.isna(value):
+            return ''
+        return str(int(value)) if value.is_integer() else str(value)
+    if isinstance(value, int):
+        return str(value)
+    try:
+        if pd.isna(value):
+            return ''
+    except (TypeError, ValueError):
+        pass
+    text = str(value).strip()
+    # 日時文字列は日付部分のみで比較する（'2024-04-01 00:00:00' → '2024-04-01'）
+    if len(text) > 10 and text[4:5] == '-' and text[7:8] == '-' and text[10] in ' T':
+        return text[:10]
+    return text
+
+
+def row_key(row, columns: list) -> tuple:
+    """行の内容から比較用キーを作成"""
+    return tuple(normalize_value(row.get(col, '')) for col in columns)
+
+
+def diff_rows(base: pd.DataFrame, mine: pd.DataFrame, columns: list) -> list:
+    """baseからmineへの行単位の変更を抽出
+
+    baseとmineは同じインデックスラベルで対応する行を表す前提
+    （編集で残った行はラベルを保持し、追加行は新しいラベル、削除行はラベルごと消える）
+    戻り値: (変更前の行 or None, 変更後の行 or None) のリスト
+    """
+    changes = []
+    for label in base.index:
+        old = base.loc[label]
+        if label not in mine.index:
+            changes.append((old, None))
+            continue
+        new = mine.loc[label]
+        if row_key(old, columns) != row_key(new, columns):
+            changes.append((old, new))
+    for label in mine.index:
+        if label not in base.index:
+            changes.append((None, mine.loc[label]))
+    return changes
+
+
+def normalize_frame(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+    """比較用に列をまとめて正規化（日付は YYYY-MM-DD 文字列、金額は数値）"""
+    normalized = {}
+    for col in columns:
+        values = df[col] if col in df.columns else pd.Series('', index=df.index)
+        if col == '日付':
+            normalized[col] = pd.to_datetime(values, errors='coerce').dt.strftime('%Y-%m-%d').fillna('')
+        elif col == '金額':
+            normalized[col] = pd.to_numeric(values, errors='coerce').fillna(0)
+        else:
+            normalized[col] = values.fillna('').astype(str).str.strip()
+    return pd.DataFrame(normalized, index=df.index)
+
+
+def diff_frames(base: pd.DataFrame, mine: pd.DataFrame, columns: list):
+    """baseからmineへの変更を (削除・変更前の行, 追加・変更後の行) のDataFrameで返す
+
+    diff_rows と同じくインデックスラベルで行を対応付ける（列単位でまとめて比較）
+    """
+    common = base.index.intersection(mine.index)
+    changed = (normalize_frame(base.loc[common], columns) != normalize_frame(mine.loc[common], columns)).any(axis=1)
+    changed_labels = common[changed.to_numpy()]
+    removed = pd.concat([base.loc[base.index.difference(mine.index)], base.loc[changed_labels]])
+    added = pd.concat([mine.loc[changed_labels], mine.loc[mine.index.difference(base.index)]])
+    return removed, added
+
+
+def merge_rows(base: pd.DataFrame, mine: pd.DataFrame, theirs: pd.DataFrame, columns: list):
+    """自分の変更を最新の内容にマージ
+
+    - 追加: そのまま末尾に追加
+    - 更新・削除: 変更前の行が最新の内容に残っていれば適用
+      （他の人が既に同じ行を変更・削除していれば競合として適用しない）
+    戻り値: (マージ後のDataFrame, 競合した自分の変更後の行のDataFrame)
+    """
+    merged = theirs.reset_index(drop=True).copy()
+    for col in columns:
+        if col not in merged.columns:
+            merged[col] = ''
+
+    # 最新の内容の行キー → 位置のリスト（同じ内容の行が複数ある場合に備える）
+    positions = {}
+    for pos, key in enumerate(row_key(row, columns) for _, row in merged.iterrows()):
+        positions.setdefault(key, []).append(pos)
+
+    updates = {}
+    deletes = set()
+    inserts = []
+    conflicts = []
+    for old, new in diff_rows(base, mine, columns):
+        if old is None:
+            inserts.append({col: new.get(col, '') for col in columns})
+            continue
+        candidates = positions.get(row_key(old, columns))
+        if not candidates:
+            conflicts.append(old if new is None else new)
+            continue
+        pos = candidates.pop(0)
+        if new is None:
+            deletes.add(pos)
+        else:
+            updates[pos] = {col: new.get(col, '') for col in columns}
+
+    for pos, values in updates.items():
+        for col, value in values.items():
+            merged.at[pos, col] = value
+    if deletes:
+        merged = merged.drop(index=list(deletes))
+    if inserts:
+        merged = pd.concat([merged, pd.DataFrame(inserts)], ignore_index=True)
+
+    conflict_df = pd.DataFrame(conflicts, columns=columns).reset_index(drop=True)
+    return merged[columns].reset_index(drop=True), conflict_df
@@ -0,0 +1,240 @@
+"""
+画面の1回の実行のプロファイル（管理者のみ）
+URLに ?profile=1 を付けると、次の1回の実行の間だけ別スレッドでスクリプトのスタックを一定間隔で記録し、
+関数ごとの時間の表と、フレームグラフ用のファイル（folded形式: "関数;関数;関数 マイクロ秒"）を保存する
+
+保存先: <PROFILE_DIR>/<テナント>/<ID>.folded と <ID>.json
+folded形式は speedscope（https://www.speedscope.app）や flamegraph.pl でそのまま開ける
+"""
+import json
+import os
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from secrets import token_hex
+
+import pandas as pd
+import streamlit as st
+
+from .tenants import current_tenant
+
+PROFILE_DIR = 'profiles'
+
+# プロファイルを取るURLのパラメータ（?profile=1）
+PROFILE_PARAM = 'profile'
+
+# スタックを記録する間隔（秒）。実際の間隔はGILの切り替え（既定5ミリ秒）で長くなることがあるため、
+# 各サンプルの重みは前回からの実際の経過時間にする
+SAMPLE_INTERVAL = 0.005
+
+# 表に表示する関数の数
+TOP_FUNCTIONS = 30
+
+# テナントごとに残すプロファイルの数（古いものから削除）
+KEEP_PROFILES = 20
+
+TOP_COLUMNS = ['関数', '場所', '自己時間(ms)', '累積時間(ms)', '自己時間の割合(%)']
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_STDLIB = sysconfig.get_paths()['stdlib']
+
+
+def _location(filename: str, line: int) -> str:
+    """表示用のファイルの場所（リポジトリ内は相対パス、ライブラリはパッケージ・標準ライブラリからのパス）"""
+    if filename.startswith(_ROOT + os.sep):
+        filename = os.path.relpath(filename, _ROOT)
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[-1]
+    elif filename.startswith(_STDLIB + os.sep):
+        filename = os.path.relpath(filename, _STDLIB)
+    return f"{filename}:{line}"
+
+
+class Sampler:
+    """スクリプトを実行しているスレッドのスタックを記録する
+
+    スクリプトのフレームがスタックからなくなったら（最後まで実行した・st.rerun・st.stop）自動で止まり、
+    止まった時点で結果を保存する
+    """
+
+    def __init__(self, script_path: str, directory: str, interval: float = SAMPLE_INTERVAL):
+        self.id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{token_hex(2)}"
+        self.script_path = os.path.abspath(script_path)
+        self.directory = directory
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        # {(フレーム, ...): 秒}（フレームは (関数名, 場所)、外側から順）
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'profiler-{self.id}', daemon=True)
+
+    def start(self) -> 'Sampler':
+        self.started = datetime.now()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """記録を止めて保存が終わるまで待つ"""
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _stack(self):
+        """スクリプトのフレームから内側のスタック（スクリプトを実行していなければNone）"""
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        outermost = None
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_name, _location(code.co_filename, code.co_firstlineno)))
+            # スクリプト内の関数からもスクリプトのフレームを通るため、一番外側のものまでたどる
+            if code.co_filename == self.script_path:
+                outermost = len(stack)
+            frame = frame.f_back
+        if outermost is None:
+            return None
+        return tuple(reversed(stack[:outermost]))
+
+    def _run(self):
+        begin = last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            stack = self._stack()
+            now = time.perf_counter()
+            if stack is None:
+                break
+            self.stacks[stack] += now - last
+            self.samples += 1
+            last = now
+        self.elapsed = time.perf_counter() - begin
+        save_profile(self)
+
+
+# ======================
+# 集計・保存
+# ======================
+
+def _label(frame: tuple) -> str:
+    name, location = frame
+    return f"{name} ({location})".replace(';', ',')
+
+
+def folded_stacks(stacks: dict) -> str:
+    """folded形式（1行に "外側;...;内側 マイクロ秒"）"""
+    lines = [
+        f"{';'.join(_label(frame) for frame in stack)} {round(seconds * 1_000_000)}"
+        for stack, seconds in sorted(stacks.items())
+    ]
+    return '\n'.join(line for line in lines if not line.endswith(' 0')) + '\n'
+
+
+def top_functions(stacks: dict, limit: int = TOP_FUNCTIONS) -> pd.DataFrame:
+    """関数ごとの自己時間（スタックの一番内側にいた時間）と累積時間（スタックのどこかにいた時間）"""
+    own, total = Counter(), Counter()
+    for stack, seconds in stacks.items():
+        own[stack[-1]] += seconds
+        for frame in set(stack):
+            total[frame] += seconds
+    whole = sum(stacks.values()) or 1.0
+    frames = sorted(total, key=lambda f: (-own[f], -total[f]))[:limit]
+    return pd.DataFrame({
+        '関数': [name for name, _ in frames],
+        '場所': [location for _, location in frames],
+        '自己時間(ms)': [round(own[f] * 1000, 1) for f in frames],
+        '累積時間(ms)': [round(total[f] * 1000, 1) for f in frames],
+        '自己時間の割合(%)': [round(own[f] / whole * 100, 1) for f in frames],
+    }, columns=TOP_COLUMNS)
+
+
+def save_profile(sampler: Sampler):
+    """folded形式と概要（JSON）を保存し、古いプロファイルを削除"""
+    os.makedirs(sampler.directory, exist_ok=True)
+    base = os.path.join(sampler.directory, sampler.id)
+    with open(base + '.folded', 'w', encoding='utf-8') as f:
+        f.write(folded_stacks(sampler.stacks))
+    meta = {
+        'id': sampler.id,
+        'script': _location(sampler.script_path, 0).rsplit(':', 1)[0],
+        'started': sampler.started.isoformat(),
+        'elapsed': sampler.elapsed,
+        'samples': sampler.samples,
+        'interval': sampler.interval,
+        'top': top_functions(sampler.stacks).to_dict(orient='records'),
+    }
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    ids = sorted(name[:-len('.json')] for name in os.listdir(sampler.directory) if name.endswith('.json'))
+    for old in ids[:-KEEP_PROFILES]:
+        for ext in ('.json', '.folded'):
+            path = os.path.join(sampler.directory, old + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def load_profile(profile_id: str, root: str = PROFILE_DIR):
+    """保存したプロファイルの (概要, folded形式)（まだ保存されていなければNone）"""
+    base = os.path.join(root, current_tenant(), profile_id)
+    if not os.path.exists(base + '.json'):
+        return None
+    with open(base + '.json', encoding='utf-8') as f:
+        meta = json.load(f)
+    with open(base + '.folded', encoding='utf-8') as f:
+        return meta, f.read()
+
+
+# ======================
+# 画面
+# ======================
+
+def start_profile(script_path: str, is_admin: bool, root: str = PROFILE_DIR):
+    """?profile=1 が付いていれば、この実行のプロファイルを開始（管理者以外は無視）
+
+    パラメータはすぐに外すため、プロファイルを取るのはこの1回の実行だけ
+    """
+    if PROFILE_PARAM not in st.query_params:
+        return None
+    del st.query_params[PROFILE_PARAM]
+    if not is_admin:
+        return None
+    sampler = Sampler(script_path, os.path.join(root, current_tenant()))
+    st.session_state.profile_id = sampler.id
+    return sampler.start()
+
+
+def finish_profile(sampler):
+    """プロファイルを止めて、結果（直前の実行で取ったものを含む）を表示"""
+    if sampler is not None:
+        sampler.stop()
+    profile_id = st.session_state.get('profile_id')
+    if profile_id:
+        render_profile(profile_id)
+
+
+def render_profile(profile_id: str):
+    loaded = load_profile(profile_id)
+    with st.expander(f"🔬 プロファイル {profile_id}", expanded=True):
+        if loaded is None:
+            st.info("結果を保存しています。再読み込みすると表示されます。")
+            return
+        meta, folded = loaded
+        st.caption(
+            f"{meta['script']} ・ {meta['elapsed'] * 1000:,.0f} ms ・ "
+            f"{meta['samples']} サンプル（約{meta['interval'] * 1000:g} ms間隔）"
+        )
+        st.dataframe(pd.DataFrame(meta['top'], columns=TOP_COLUMNS), use_container_width=True, hide_index=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                "📥 フレームグラフ用ファイル（folded）", folded, file_name=f"{profile_id}.folded",
+                mime="text/plain", use_container_width=True, key="profile_download",
+                help="speedscope や flamegraph.pl で開けます"
+            )
+        with col2:
+            st.button("閉じる", use_container_width=True, key="profile_close",
+                      on_click=lambda: st.session_state.pop('profile_id', None))
@@ -0,0 +1,219 @@
+"""
+通帳（銀行の明細）と取引履歴の照合
+決済方法が銀行口座の取引と明細を、金額・日付の順に並べた2つの列をたどるマージで1対1に対応付け、
+残りは日付の許容範囲内の複数行の合計で対応付ける（部費の集金をまとめて入金した場合など）
+"""
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from .importer import _find_column, _to_amount, build_rules, iter_file_chunks, map_columns
+
+BANK_METHOD = '銀行口座'
+
+# 明細と取引の日付のずれの許容日数（記帳日と引落日の違いなど）
+DEFAULT_TOLERANCE_DAYS = 3
+
+# 分割の対応付けで組み合わせを調べる候補の数（日付の近い順）
+SPLIT_CANDIDATES = 12
+
+# 明細の残高の列名の候補
+BALANCE_COLUMNS = ['残高', '差引残高', '取引後残高', 'Balance']
+
+MATCH_COLUMNS = ['照合ID', '種類', '通帳日付', '通帳金額', '摘要', '台帳日付', '台帳金額', '科目', '備考', '日数差']
+
+
+class ReconcileResult(NamedTuple):
+    """照合の結果"""
+    # 対応付けた明細と取引（分割は1つの照合IDに複数行）
+    matched: pd.DataFrame
+    # 取引履歴にない明細
+    statement_only: pd.DataFrame
+    # 明細にない取引（明細の期間内のもの）
+    ledger_only: pd.DataFrame
+    # 明細の日付ごとの残高の比較
+    balance: pd.DataFrame
+
+
+def read_statement(file, filename: str, rules: dict = None) -> pd.DataFrame:
+    """明細ファイルを 日付・金額（入金は正、出金は負）・摘要・残高 の表として読み込む"""
+    rules = build_rules(rules)
+    frames = []
+    for chunk in iter_file_chunks(file, filename):
+        mapped = map_columns(chunk, rules)
+        balance_col = _find_column(chunk, BALANCE_COLUMNS)
+        frames.append(pd.DataFrame({
+            '日付': mapped['日付'],
+            '金額': mapped['金額'].where(mapped['種別'] == '収入', -mapped['金額']),
+            '摘要': mapped['備考'],
+            '残高': _to_amount(chunk[balance_col]) if balance_col is not None else np.nan,
+        }))
+    if not frames:
+        return pd.DataFrame(columns=['日付', '金額', '摘要', '残高'])
+    statement = pd.concat(frames, ignore_index=True)
+    valid = statement['日付'].notna() & statement['金額'].notna() & (statement['金額'] != 0)
+    return statement[valid].reset_index(drop=True)
+
+
+def bank_rows(df: pd.DataFrame, method: str = BANK_METHOD) -> pd.DataFrame:
+    """取引履歴のうち口座の取引（金額は入金が正、出金が負）"""
+    rows = df[(df['決済方法'] == method) & df['日付'].notna()]
+    signed = rows['金額'].where(rows['種別'] == '収入', -rows['金額'])
+    return rows.assign(金額=signed)[['日付', '種別', '科目', '金額', '備考']]
+
+
+def _cents(amounts) -> np.ndarray:
+    return np.rint(np.asarray(amounts, dtype=float) * 100).astype(np.int64)
+
+
+def _days(dates) -> np.ndarray:
+    return pd.DatetimeIndex(dates).values.astype('datetime64[D]').astype(np.int64)
+
+
+def _merge_exact(s_amt, s_day, l_amt, l_day, tolerance: int) -> list:
+    """金額・日付順に並べた明細と取引をたどり、同じ金額で日付が許容範囲内のものを1対1で対応付ける"""
+    s_order = np.lexsort((s_day, s_amt))
+    l_order = np.lexsort((l_day, l_amt))
+    pairs = []
+    i = j = 0
+    while i < len(s_order) and j < len(l_order):
+        s, l = s_order[i], l_order[j]
+        if s_amt[s] < l_amt[l]:
+            i += 1
+        elif s_amt[s] > l_amt[l]:
+            j += 1
+        elif abs(s_day[s] - l_day[l]) <= tolerance:
+            pairs.append((s, l))
+            i += 1
+            j += 1
+        elif s_day[s] < l_day[l]:
+            i += 1
+        else:
+            j += 1
+    return pairs
+
+
+def _subset_sum(target: int, candidates: list, amounts) -> tuple:
+    """合計が target になる2件以上の組み合わせ（なければNone）"""
+    sums = {0: ()}
+    for c in candidates:
+        for total, chosen in list(sums.items()):
+            total += amounts[c]
+            if total == target and len(chosen) >= 1:
+                return chosen + (c,)
+            if abs(total) < abs(target) and total not in sums:
+                sums[total] = chosen + (c,)
+    return None
+
+
+def _merge_splits(one_amt, one_day, one_free, many_amt, many_day, many_free, tolerance: int) -> list:
+    """1件を、日付の許容範囲内にある同じ向きの複数件の合計と対応付ける"""
+    order = np.argsort(many_day, kind='stable')
+    sorted_days = many_day[order]
+    groups = []
+    for i in np.flatnonzero(one_free):
+        lo = np.searchsorted(sorted_days, one_day[i] - tolerance, side='left')
+        hi = np.searchsorted(sorted_days, one_day[i] + tolerance, side='right')
+        candidates = [
+            j for j in order[lo:hi]
+            if many_free[j] and np.sign(many_amt[j]) == np.sign(one_amt[i])
+            and abs(many_amt[j]) < abs(one_amt[i])
+        ]
+        if len(candidates) < 2:
+            continue
+        candidates.sort(key=lambda j: abs(many_day[j] - one_day[i]))
+        chosen = _subset_sum(one_amt[i], candidates[:SPLIT_CANDIDATES], many_amt)
+        if chosen is not None:
+            one_free[i] = False
+            many_free[list(chosen)] = False
+            groups.append((i, list(chosen)))
+    return groups
+
+
+def _running_balance(ledger: pd.DataFrame, statement: pd.DataFrame) -> pd.DataFrame:
+    """明細の日付ごとに、その日の終わりの明細と取引履歴の残高を比べる"""
+    dates = statement['日付'].drop_duplicates().sort_values()
+    ledger_daily = ledger.groupby('日付')['金額'].sum().sort_index().cumsum()
+    positions = ledger_daily.index.searchsorted(dates, side='right') - 1
+    cumulative = np.concatenate([[0], ledger_daily.to_numpy()])
+    ledger_balance = cumulative[positions + 1]
+
+    daily = statement.groupby('日付').agg(入出金=('金額', 'sum'), 残高=('残高', 'last')).reindex(dates)
+    if daily['残高'].notna().any():
+        # 明細に残高の列があればそれを使い、空欄の日は前日の残高 + 入出金
+        opening = daily['残高'].iloc[0] - daily['入出金'].iloc[0] if pd.notna(daily['残高'].iloc[0]) \
+            else ledger_balance[0] - daily['入出金'].iloc[0]
+        computed = opening + daily['入出金'].cumsum()
+        statement_balance = daily['残高'].fillna(computed).to_numpy()
+    else:
+        # 残高の列がなければ、明細の初日の前日までは取引履歴と一致しているものとする
+        opening = ledger_balance[0] - ledger[ledger['日付'] == dates.iloc[0]]['金額'].sum()
+        statement_balance = (opening + daily['入出金'].cumsum()).to_numpy()
+
+    return pd.DataFrame({
+        '日付': dates.to_numpy(),
+        '通帳残高': statement_balance,
+        '台帳残高': ledger_balance,
+        '差額': statement_balance - ledger_balance,
+    })
+
+
+def reconcile(df: pd.DataFrame, statement: pd.DataFrame, method: str = BANK_METHOD,
+              tolerance_days: int = DEFAULT_TOLERANCE_DAYS) -> ReconcileResult:
+    """取引履歴（型付き）と明細（read_statementの形式）を照合"""
+    ledger = bank_rows(df, method)
+    statement = statement.reset_index(drop=True)
+    if len(statement) == 0:
+        empty = pd.DataFrame(columns=MATCH_COLUMNS)
+        return ReconcileResult(empty, statement, ledger.iloc[0:0], pd.DataFrame(columns=['日付', '通帳残高', '台帳残高', '差額']))
+
+    start = statement['日付'].min() - pd.Timedelta(days=tolerance_days)
+    end = statement['日付'].max() + pd.Timedelta(days=tolerance_days)
+    in_period = ledger[(ledger['日付'] >= start) & (ledger['日付'] <= end)]
+
+    s_amt, s_day = _cents(statement['金額']), _days(statement['日付'])
+    l_amt, l_day = _cents(in_period['金額']), _days(in_period['日付'])
+    s_free = np.ones(len(statement), dtype=bool)
+    l_free = np.ones(len(in_period), dtype=bool)
+
+    # 1対1
+    groups = []
+    for s, l in _merge_exact(s_amt, s_day, l_amt, l_day, tolerance_days):
+        s_free[s] = l_free[l] = False
+        groups.append(('一致', [s], [l]))
+    # 明細1件 = 取引の複数行（まとめて入金）、取引1行 = 明細の複数件（分割して入金）
+    for s, ls in _merge_splits(s_amt, s_day, s_free, l_amt, l_day, l_free, tolerance_days):
+        groups.append(('分割', [s], ls))
+    for l, ss in _merge_splits(l_amt, l_day, l_free, s_amt, s_day, s_free, tolerance_days):
+        groups.append(('分割', ss, [l]))
+
+    # 照合IDごとに明細・取引の行番号を並べ、列はまとめて取り出す（分割は少ない側を繰り返す）
+    ids, kinds, s_rows, l_rows = [], [], [], []
+    for match_id, (kind, ss, ls) in enumerate(groups, start=1):
+        count = max(len(ss), len(ls))
+        ids += [match_id] * count
+        kinds += [kind] * count
+        s_rows += ss if len(ss) == count else ss * count
+        l_rows += ls if len(ls) == count else ls * count
+    s_part = statement.iloc[s_rows]
+    l_part = in_period.iloc[l_rows]
+    matched = pd.DataFrame({
+        '照合ID': ids,
+        '種類': kinds,
+        '通帳日付': s_part['日付'].to_numpy(),
+        '通帳金額': s_part['金額'].to_numpy(),
+        '摘要': s_part['摘要'].to_numpy(),
+        '台帳日付': l_part['日付'].to_numpy(),
+        '台帳金額': l_part['金額'].to_numpy(),
+        '科目': l_part['科目'].to_numpy(),
+        '備考': l_part['備考'].to_numpy(),
+        '日数差': l_day[l_rows] - s_day[s_rows],
+    }, columns=MATCH_COLUMNS)
+
+    return ReconcileResult(
+        matched=matched,
+        statement_only=statement[s_free].drop(columns='残高'),
+        ledger_only=in_period[l_free],
+        balance=_running_balance(ledger, statement),
+    )
@@ -0,0 +1,56 @@
+"""
+実行環境の切り替え
+Streamlitのスクリプト実行中はst.error等で画面に表示し、
+CLI・cronなどStreamlitの外ではloggingに出力してsecretsをファイルから読む
+"""
+import logging
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+logger = logging.getLogger('club_accounting')
+
+_LOG_LEVELS = {
+    'error': logging.ERROR,
+    'warning': logging.WARNING,
+    'info': logging.INFO,
+}
+
+# Streamlitの外で使うsecrets（use_secretsで設定）
+_secrets = None
+
+
+def in_streamlit() -> bool:
+    """Streamlitのスクリプト実行中か"""
+    return get_script_run_ctx(suppress_warning=True) is not None
+
+
+def notify(level: str, message: str):
+    """メッセージを表示（level: 'error' / 'warning' / 'info'）"""
+    if in_streamlit():
+        getattr(st, level)(message)
+    else:
+        logger.log(_LOG_LEVELS[level], message)
+
+
+def load_secrets_file(path: str) -> dict:
+    """secrets.toml を読み込み"""
+    try:
+        import tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    except ImportError:
+        import toml
+        with open(path, encoding='utf-8') as f:
+            return toml.load(f)
+
+
+def use_secrets(secrets: dict):
+    """Streamlitの外で使うsecretsを設定"""
+    global _secrets
+    _secrets = secrets
+
+
+def get_secrets():
+    """secrets（use_secretsで設定されていればそれ、なければst.secrets）"""
+    return _secrets if _secrets is not None else st.secrets
@@ -0,0 +1,179 @@
+"""
+取引履歴の検索インデックス
+日付のソート済みインデックス（範囲検索）、種別・科目・決済方法ごとの行ラベル集合、
+備考の文字bigramインデックスを保持し、追加・削除された行だけで差分更新する
+"""
+import bisect
+from datetime import date
+
+import pandas as pd
+
+# 値ごとの行ラベル集合を持つ列
+POSTING_COLUMNS = ['種別', '科目', '決済方法']
+
+# 日付が読めない行の並び順（範囲検索には含めない）
+NO_DATE = -1
+
+
+def _ordinal(value) -> int:
+    """日付を比較用の整数（日数）にする"""
+    if value is None or pd.isna(value):
+        return NO_DATE
+    if isinstance(value, pd.Timestamp):
+        value = value.date()
+    return value.toordinal() if isinstance(value, date) else pd.Timestamp(value).date().toordinal()
+
+
+def tokenize(text: str) -> set:
+    """備考をトークンに分割（空白区切りの単語 + 文字bigram、大文字小文字は区別しない）"""
+    text = str(text).lower()
+    tokens = set()
+    for word in text.split():
+        if len(word) == 1:
+            tokens.add(word)
+        tokens.update(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class LedgerIndex:
+    """取引履歴の検索インデックス"""
+
+    def __init__(self):
+        # [(日付の日数, 行ラベル)] を日付順に保持
+        self.dates = []
+        # {列名: {値: {行ラベル}}}
+        self.postings = {col: {} for col in POSTING_COLUMNS}
+        # {トークン: {行ラベル}}
+        self.tokens = {}
+        # {行ラベル: 備考}（候補を最終確認するため）
+        self.notes = {}
+        # {行ラベル: 日付の日数}
+        self.date_of = {}
+
+    @classmethod
+    def from_ledger(cls, df: pd.DataFrame) -> 'LedgerIndex':
+        index = cls()
+        index.add(df)
+        return index
+
+    def add(self, df: pd.DataFrame):
+        """行を追加"""
+        if len(df) == 0:
+            return
+        new_dates = [(_ordinal(d), label) for label, d in zip(df.index, df['日付'])]
+        self.date_of.update((label, ordinal) for ordinal, label in new_dates)
+        if len(new_dates) > len(self.dates) // 8:
+            self.dates = sorted(self.dates + new_dates)
+        else:
+            for item in new_dates:
+                bisect.insort(self.dates, item)
+
+        for col in POSTING_COLUMNS:
+            if col not in df.columns:
+                continue
+            postings = self.postings[col]
+            for label, value in zip(df.index, df[col]):
+                postings.setdefault(str(value), set()).add(label)
+
+        notes = df['備考'] if '備考' in df.columns else pd.Series('', index=df.index)
+        for label, note in zip(df.index, notes.fillna('')):
+            note = str(note)
+            self.notes[label] = note.lower()
+            for token in tokenize(note):
+                self.tokens.setdefault(token, set()).add(label)
+
+    def remove(self, df: pd.DataFrame):
+        """行を削除"""
+        for label in df.index:
+            item = (self.date_of.pop(label, NO_DATE), label)
+            pos = bisect.bisect_left(self.dates, item)
+            if pos < len(self.dates) and self.dates[pos] == item:
+                del self.dates[pos]
+
+        for col in POSTING_COLUMNS:
+            if col not in df.columns:
+                continue
+            postings = self.postings[col]
+            for label, value in zip(df.index, df[col]):
+                labels = postings.get(str(value))
+                if labels is not None:
+                    labels.discard(label)
+                    if not labels:
+                        del postings[str(value)]
+
+        for label in df.index:
+            note = self.notes.pop(label, '')
+            for token in tokenize(note):
+                labels = self.tokens.get(token)
+                if labels is not None:
+                    labels.discard(label)
+                    if not labels:
+                        del self.tokens[token]
+
+    def apply(self, removed: pd.DataFrame, added: pd.DataFrame):
+        """変更（削除された行・追加された行）を反映"""
+        if len(removed) > 0:
+            self.remove(removed)
+        if len(added) > 0:
+            self.add(added)
+
+    def values(self, column: str) -> list:
+        """列に含まれる値の一覧"""
+        return sorted(self.postings[column].keys())
+
+    def date_range(self, start=None, end=None) -> list:
+        """期間内（両端を含む）の行ラベルを日付の新しい順で取得"""
+        lo = bisect.bisect_left(self.dates, (_ordinal(start), -float('inf'))) if start is not None \
+            else bisect.bisect_right(self.dates, (NO_DATE, float('inf')))
+        hi = bisect.bisect_right(self.dates, (_ordinal(end), float('inf'))) if end is not None \
+            else len(self.dates)
+        return [label for _, label in reversed(self.dates[lo:hi])]
+
+    def keyword(self, text: str) -> set:
+        """備考にキーワードを含む行ラベル"""
+        needle = str(text).strip().lower()
+        if len(needle) == 1:
+            # 1文字はbigramで引けないため備考を順に確認する
+            return {label for label, note in self.notes.items() if needle in note}
+        candidates = None
+        for token in sorted(tokenize(needle), key=lambda t: len(self.tokens.get(t, ()))):
+            labels = self.tokens.get(token, set())
+            candidates = set(labels) if candidates is None else candidates & labels
+            if not candidates:
+                return set()
+        if candidates is None:
+            return set()
+        return {label for label in candidates if needle in self.notes.get(label, '')}
+
+    def search(self, start=None, end=None, keyword: str = '', **filters) -> list:
+        """条件に合う行ラベルを日付の新しい順で取得
+
+        filters: 種別 / 科目 / 決済方法 = 値のリスト（空なら絞り込まない）
+        """
+        conditions = []
+        for col, values in filters.items():
+            if not values:
+                continue
+            postings = self.postings.get(col, {})
+            sets = [postings.get(str(v), set()) for v in values]
+            # 値が1つなら転置リストをそのまま使う（コピーしない）
+            conditions.append(sets[0] if len(sets) == 1 else set().union(*sets))
+        if keyword and keyword.strip():
+            conditions.append(self.keyword(keyword))
+        if not conditions:
+            if start is None and end is None:
+                # 期間も指定しなければ日付のない行も含める（条件で絞り込んだ場合と同じく最後に並べる）
+                return [label for _, label in reversed(self.dates)]
+            return self.date_range(start, end)
+        if start is not None or end is not None:
+            conditions.append(set(self.date_range(start, end)))
+
+        # 件数の少ない条件から絞り込む
+        conditions.sort(key=len)
+        selected = set(conditions[0])
+        for labels in conditions[1:]:
+            if not selected:
+                return []
+            selected &= labels
+        hits = [(self.date_of.get(label, NO_DATE), label) for label in selected]
+        return [label for _, label in sorted(hits, reverse=True)]
@@ -2,11 +2,28 @@
 Google Sheets連携ユーティリティ
 gspreadを使用してGoogle Spreadsheetsに接続し、データを読み書きする
 """
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import NamedTuple
+
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import numpy as np
 import pandas as pd
 
+from .journal import (
+    JOURNAL_COLUMNS, SNAPSHOT_COLUMNS, COMPACT_EVERY, build_events, typed_journal, replay,
+    snapshot_rows, apply_changes, next_label, rebase_changes, renumber_inserts
+)
+from .merge import diff_frames
+from .runtime import get_secrets, in_streamlit, notify
+from .tenants import current_tenant, load_tenants, registry, tenant_scope
+
+# gspread / google-auth は読み込みが重いため、初回の接続時に関数内でimportする
+# （ログイン画面の表示までにこれらの読み込みコストを払わないようにする）
+
 # Google Sheets APIのスコープ
 SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets',
@@ -19,42 +36,95 @@ SHEET_MEMBERS = 'members'
 SHEET_DRIVERS = 'drivers'
 SHEET_COLLECTION = 'collection_status'
 SHEET_TRANSPORT_BALANCE = 'transportation_balance'
+SHEET_BUDGET = 'budget'
+
+# 取引履歴のジャーナル（databaseシートは圧縮済みのスナップショット）
+SHEET_JOURNAL = 'journal'
+SHEET_JOURNAL_ARCHIVE = 'journal_archive'
+
+# シートごとのリビジョン番号（楽観的排他制御用）
+SHEET_REVISIONS = '_revisions'
+REVISION_COLUMNS = ['シート', 'リビジョン', '更新日時']
+# スナップショットに含まれるジャーナルの最終リビジョン（リビジョンシートに記録）
+SNAPSHOT_REVISION_KEY = 'database_snapshot'
+# 次に追加する行に振る行IDの下限（削除された行の行IDを使い直さないため。リビジョンシートに記録し、0は未記録）
+NEXT_LABEL_KEY = 'database_next_label'
+# このセッションが書き込んだ時点のリビジョン {シート名: リビジョン}（session_state。変更の監視で自分の書き込みを区別する）
+WRITTEN_REVISIONS_KEY = 'written_revisions'
+
+DATABASE_COLUMNS = ['日付', '種別', '科目', '金額', '備考', '決済方法']
+
+# 同時に実行する読み込みの上限（Sheets APIの読み取りクォータ対策）
+# プロセス全体で共有するため、複数セッションが同時に開いても上限を超えない
+MAX_CONCURRENT_READS = 4
+_read_slots = threading.BoundedSemaphore(MAX_CONCURRENT_READS)
+
+
+# プロセス全体で共有するクライアント（Streamlitの外からも使えるようにst.cache_resourceは使わない）
+_client = None
+_client_lock = threading.Lock()
 
 
-@st.cache_resource
 def get_gspread_client():
     """Google Sheets APIクライアントを取得（キャッシュ）"""
-    try:
-        credentials = Credentials.from_service_account_info(
-            st.secrets["gcp_service_account"],
-            scopes=SCOPES
-        )
-        client = gspread.authorize(credentials)
-        return client
-    except Exception as e:
-        st.error(f"⚠️ Google Sheets接続エラー: {e}")
-        st.info("secrets.tomlの設定を確認してください")
-        return None
+    global _client
+    with _client_lock:
+        if _client is not None:
+            return _client
+        
+        import gspread
+        from google.oauth2.service_account import Credentials
+        from .http_session import build_authorized_session
+        
+        try:
+            credentials = Credentials.from_service_account_info(
+                get_secrets()["gcp_service_account"],
+                scopes=SCOPES
+            )
+            # 接続プール・Keep-Alive・gzip圧縮付きのセッションで接続を使い回す
+            session = build_authorized_session(credentials)
+            _client = gspread.Client(auth=credentials, session=session)
+            return _client
+        except Exception as e:
+            notify('error', f"⚠️ Google Sheets接続エラー: {e}")
+            notify('info', "secrets.tomlの設定を確認してください")
+            return None
+
+
+def get_connection_stats() -> dict:
+    """Sheets APIクライアントの接続再利用状況を取得"""
+    from .http_session import get_connection_stats as session_stats
+    
+    client = get_gspread_client()
+    if client is None:
+        return {}
+    return session_stats(client.http_client.session)
 
 
-@st.cache_resource
 def get_spreadsheet():
-    """スプレッドシートを取得（キャッシュ）"""
+    """現在のテナントのスプレッドシートを取得（テナントごとにキャッシュ）"""
+    return registry.spreadsheet(current_tenant(), _open_tenant_spreadsheet)
+
+
+def _open_tenant_spreadsheet():
     client = get_gspread_client()
     if client is None:
         return None
     
     try:
-        spreadsheet_id = st.secrets["spreadsheet"]["id"]
+        tenant = current_tenant()
+        spreadsheet_id = load_tenants()[tenant]['spreadsheet_id']
         spreadsheet = client.open_by_key(spreadsheet_id)
         return spreadsheet
     except Exception as e:
-        st.error(f"⚠️ スプレッドシート取得エラー: {e}")
+        notify('error', f"⚠️ スプレッドシート取得エラー: {e}")
         return None
 
 
 def get_or_create_worksheet(sheet_name: str, headers: list = None):
     """ワークシートを取得、なければ作成"""
+    import gspread
+    
     spreadsheet = get_spreadsheet()
     if spreadsheet is None:
         return None
@@ -70,6 +140,33 @@ def get_or_create_worksheet(sheet_name: str, headers: list = None):
     return worksheet
 
 
+def _get_columns(worksheet) -> list:
+    """シート全体を列ごとの値のリストで取得（数値は数値のまま、日付は表示形式の文字列）"""
+    from gspread.utils import DateTimeOption, Dimension, ValueRenderOption
+    
+    return worksheet.get(
+        major_dimension=Dimension.cols,
+        value_render_option=ValueRenderOption.unformatted,
+        date_time_render_option=DateTimeOption.formatted_string,
+    )
+
+
+def _columns_to_frame(columns: list) -> pd.DataFrame:
+    """列ごとの値のリスト（先頭はヘッダー）から行のdictを作らずにDataFrameを作成"""
+    columns = [col for col in columns if col and str(col[0]).strip() != '']
+    if not columns:
+        return pd.DataFrame()
+    # 末尾の空セルは返ってこないため、列の長さを最長の列にそろえる
+    length = max(len(col) for col in columns) - 1
+    data = {}
+    for col in columns:
+        values = col[1:]
+        if len(values) < length:
+            values = values + [''] * (length - len(values))
+        data[str(col[0])] = values
+    return pd.DataFrame(data)
+
+
 def load_sheet_as_dataframe(sheet_name: str, default_columns: list = None) -> pd.DataFrame:
     """シートをDataFrameとして読み込む"""
     worksheet = get_or_create_worksheet(sheet_name, default_columns)
@@ -80,25 +177,59 @@ def load_sheet_as_dataframe(sheet_name: str, default_columns: list = None) -> pd
         return pd.DataFrame()
     
     try:
-        data = worksheet.get_all_records()
-        if len(data) == 0:
+        df = _columns_to_frame(_get_columns(worksheet))
+        if len(df) == 0:
             if default_columns:
                 return pd.DataFrame(columns=default_columns)
             return pd.DataFrame()
-        return pd.DataFrame(data)
+        return df
     except Exception as e:
-        st.warning(f"シート '{sheet_name}' の読み込みエラー: {e}")
+        notify('warning', f"シート '{sheet_name}' の読み込みエラー: {e}")
         if default_columns:
             return pd.DataFrame(columns=default_columns)
         return pd.DataFrame()
 
 
+def _cell(value):
+    """セルに書き込む値（数値は数値のまま、日付は YYYY-MM-DD、欠損は空文字）"""
+    if value is None:
+        return ''
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return '' if pd.isna(value) else value.strftime('%Y-%m-%d')
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return ''
+        return int(value) if float(value).is_integer() else float(value)
+    return value if isinstance(value, str) else str(value)
+
+
+def _column_values(values: pd.Series) -> list:
+    """列をセルに書き込む値のリストにする（型ごとにまとめて変換）"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.strftime('%Y-%m-%d').fillna('').tolist()
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values):
+        return values.tolist()
+    if pd.api.types.is_float_dtype(values):
+        return ['' if v != v else int(v) if v.is_integer() else v for v in values.tolist()]
+    return [_cell(v) for v in values.tolist()]
+
+
+def _to_sheet_values(df: pd.DataFrame) -> list:
+    """DataFrameを列ごとにセルの値へ変換して行のリストにする（DataFrame全体のコピーは作らない）"""
+    columns = [_column_values(df[col]) for col in df.columns]
+    return [list(row) for row in zip(*columns)]
+
+
 def save_dataframe_to_sheet(df: pd.DataFrame, sheet_name: str):
     """DataFrameをシートに保存（全データ上書き）"""
     worksheet = get_or_create_worksheet(sheet_name, df.columns.tolist())
     
     if worksheet is None:
-        st.error("シートへの保存に失敗しました")
+        notify('error', "シートへの保存に失敗しました")
         return False
     
     try:
@@ -110,8 +241,8 @@ def save_dataframe_to_sheet(df: pd.DataFrame, sheet_name: str):
             # ヘッダーとデータを準備
             headers = df.columns.tolist()
             
-            # すべてのデータを文字列に変換（NaNを空文字に）
-            data = df.fillna('').astype(str).values.tolist()
+            # 数値は数値のまま、日付列は YYYY-MM-DD、NaNは空文字で書き込む
+            data = _to_sheet_values(df)
             
             # ヘッダー + データを書き込み
             all_data = [headers] + data
@@ -120,9 +251,11 @@ def save_dataframe_to_sheet(df: pd.DataFrame, sheet_name: str):
             # 空の場合はヘッダーのみ
             worksheet.update('A1', [df.columns.tolist()])
         
+        if sheet_name != SHEET_REVISIONS:
+            bump_sheet_revision(sheet_name)
         return True
     except Exception as e:
-        st.error(f"シート '{sheet_name}' への保存エラー: {e}")
+        notify('error', f"シート '{sheet_name}' への保存エラー: {e}")
         return False
 
 
@@ -145,20 +278,208 @@ def append_row_to_sheet(row_data: dict, sheet_name: str):
         worksheet.append_row(row)
         return True
     except Exception as e:
-        st.error(f"行の追加エラー: {e}")
+        notify('error', f"行の追加エラー: {e}")
         return False
 
 
+def append_rows_to_sheet(rows: list, columns: list, sheet_name: str, bump_revision: bool = True):
+    """シートに複数行をまとめて追加（1回のAPI呼び出し）
+
+    rows は columns の列順の値リスト。シートのヘッダー順に並べ替えて追記する
+    """
+    worksheet = get_or_create_worksheet(sheet_name, columns)
+    
+    if worksheet is None:
+        return False
+    
+    try:
+        headers = worksheet.row_values(1)
+        if not headers:
+            headers = list(columns)
+            worksheet.update('A1', [headers])
+        
+        positions = [columns.index(h) if h in columns else None for h in headers]
+        data = [
+            ['' if p is None else _cell(row[p]) for p in positions]
+            for row in rows
+        ]
+        worksheet.append_rows(data)
+        if bump_revision:
+            bump_sheet_revision(sheet_name)
+        return True
+    except Exception as e:
+        notify('error', f"行の追加エラー: {e}")
+        return False
+
+
+# ======================
+# リビジョン管理（楽観的排他制御）
+# ======================
+
+# テナント・シートごとの書き込みロック（同一プロセス内でリビジョン確認〜書き込みを直列化）
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+
+def get_write_lock(sheet_name: str) -> threading.Lock:
+    """現在のテナントのシートごとの書き込みロックを取得"""
+    key = (current_tenant(), sheet_name)
+    with _write_locks_guard:
+        if key not in _write_locks:
+            _write_locks[key] = threading.Lock()
+        return _write_locks[key]
+
+
+def _read_revisions(worksheet) -> dict:
+    """リビジョンシートを {シート名: (行番号, リビジョン)} として読み込み"""
+    revisions = {}
+    for row_number, row in enumerate(worksheet.get_all_values()[1:], start=2):
+        if not row or not row[0]:
+            continue
+        value = row[1] if len(row) > 1 else ''
+        revisions[row[0]] = (row_number, int(value) if str(value).isdigit() else 0)
+    return revisions
+
+
+def get_sheet_revision(sheet_name: str) -> int:
+    """シートの現在のリビジョン番号を取得（未記録なら0）"""
+    worksheet = get_or_create_worksheet(SHEET_REVISIONS, REVISION_COLUMNS)
+    if worksheet is None:
+        return 0
+    
+    try:
+        return _read_revisions(worksheet).get(sheet_name, (None, 0))[1]
+    except Exception as e:
+        notify('warning', f"リビジョンの読み込みエラー: {e}")
+        return 0
+
+
+def get_sheet_revisions(*sheet_names: str) -> dict:
+    """複数シートのリビジョン番号を1回の読み込みで取得（未記録なら0）"""
+    worksheet = get_or_create_worksheet(SHEET_REVISIONS, REVISION_COLUMNS)
+    if worksheet is None:
+        return {name: 0 for name in sheet_names}
+    
+    try:
+        revisions = _read_revisions(worksheet)
+        return {name: revisions.get(name, (None, 0))[1] for name in sheet_names}
+    except Exception as e:
+        notify('warning', f"リビジョンの読み込みエラー: {e}")
+        return {name: 0 for name in sheet_names}
+
+
+# リビジョンを読み直す間隔（秒）。閲覧用の読み込みはこの間Sheets APIを呼ばない
+REVISION_TTL = 10.0
+_revision_cache = {}
+_revision_cache_lock = threading.Lock()
+
+
+def get_cached_revisions(ttl: float = REVISION_TTL) -> dict:
+    """現在のテナントの全シートのリビジョン（ttl秒だけプロセス全体で使い回す）
+
+    閲覧専用の画面やAPIのように、数秒遅れて変更に気付けばよい読み込み用
+    """
+    tenant = current_tenant()
+    now = time.monotonic()
+    with _revision_cache_lock:
+        entry = _revision_cache.get(tenant)
+        if entry is not None and now - entry[0] < ttl:
+            return entry[1]
+    
+    worksheet = get_or_create_worksheet(SHEET_REVISIONS, REVISION_COLUMNS)
+    try:
+        revisions = {name: revision for name, (_, revision) in _read_revisions(worksheet).items()} \
+            if worksheet is not None else {}
+    except Exception as e:
+        notify('warning', f"リビジョンの読み込みエラー: {e}")
+        return entry[1] if entry is not None else {}
+    with _revision_cache_lock:
+        _revision_cache[tenant] = (now, revisions)
+    return revisions
+
+
+def bump_sheet_revision(sheet_name: str) -> int:
+    """シートのリビジョン番号を1つ進める"""
+    return set_sheet_revision(sheet_name)
+
+
+def set_sheet_revision(sheet_name: str, revision: int = None) -> int:
+    """シートのリビジョン番号を記録（revisionを省略すると1つ進める）"""
+    worksheet = get_or_create_worksheet(SHEET_REVISIONS, REVISION_COLUMNS)
+    if worksheet is None:
+        return 0
+    
+    try:
+        revisions = _read_revisions(worksheet)
+        row_number, current = revisions.get(sheet_name, (None, 0))
+        revision = current + 1 if revision is None else revision
+        updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if row_number is None:
+            worksheet.append_row([sheet_name, revision, updated_at])
+        else:
+            worksheet.update(f'B{row_number}:C{row_number}', [[revision, updated_at]])
+        # このプロセスでの書き込みは閲覧用のキャッシュを待たずに反映する
+        with _revision_cache_lock:
+            _revision_cache.pop(current_tenant(), None)
+        if in_streamlit():
+            st.session_state.setdefault(WRITTEN_REVISIONS_KEY, {})[sheet_name] = revision
+        return revision
+    except Exception as e:
+        notify('warning', f"リビジョンの更新エラー: {e}")
+        return 0
+
+
+class SaveResult(NamedTuple):
+    """リビジョン付き保存の結果"""
+    ok: bool
+    data: pd.DataFrame
+    revision: int
+    conflicts: pd.DataFrame
+    merged: bool
+    # この保存でジャーナルをスナップショットへ圧縮した（行IDはそのまま）
+    compacted: bool = False
+    # 書き込んだ変更（削除・変更前の行, 追加・変更後の行）。マージ・行IDの振り直しの後の行ID
+    removed: pd.DataFrame = None
+    added: pd.DataFrame = None
+
+
+def load_concurrently(loaders: dict, max_workers: int = MAX_CONCURRENT_READS) -> dict:
+    """独立したシートの読み込みを並列実行（最も遅い読み込みの完了後に結果を返す）
+
+    loaders: {キー: 引数なしの読み込み関数} の辞書
+    戻り値: {キー: 読み込み結果} の辞書
+    """
+    if not loaders:
+        return {}
+    
+    # クライアントとスプレッドシートを先に取得しておく（キャッシュ初期化の重複を防ぐ）
+    get_spreadsheet()
+    
+    # ワーカースレッドからもst.warning等を表示できるようにコンテキストを引き継ぐ
+    # （Streamlitの外から呼ばれた場合はコンテキストなし）
+    ctx = get_script_run_ctx(suppress_warning=True)
+    # ワーカースレッドでも呼び出し元と同じテナントのシートを読む
+    tenant = current_tenant()
+    
+    def run(loader):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        with _read_slots, tenant_scope(tenant):
+            return loader()
+    
+    workers = max(1, min(max_workers, MAX_CONCURRENT_READS, len(loaders)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sheets-loader") as executor:
+        futures = {key: executor.submit(run, loader) for key, loader in loaders.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+
 # ======================
 # 各シート用の読み込み・保存関数
 # ======================
 
 def load_database() -> pd.DataFrame:
-    """取引履歴を読み込み"""
-    df = load_sheet_as_dataframe(
-        SHEET_DATABASE,
-        ['日付', '種別', '科目', '金額', '備考', '決済方法']
-    )
+    """取引履歴のスナップショットを読み込み（行IDは列のまま。snapshot_rows で行ラベルにする）"""
+    df = load_sheet_as_dataframe(SHEET_DATABASE, SNAPSHOT_COLUMNS)
     if len(df) > 0:
         df['日付'] = pd.to_datetime(df['日付'], errors='coerce')
         df['金額'] = pd.to_numeric(df['金額'], errors='coerce').fillna(0)
@@ -168,19 +489,214 @@ def load_database() -> pd.DataFrame:
 
 
 def save_database(df: pd.DataFrame):
-    """取引履歴を保存"""
-    save_df = df.copy()
-    if '日付' in save_df.columns:
-        save_df['日付'] = pd.to_datetime(save_df['日付']).dt.strftime('%Y-%m-%d')
-    return save_dataframe_to_sheet(save_df, SHEET_DATABASE)
+    """取引履歴をスナップショットとして保存（行ラベルを行IDの列に書き込む）"""
+    if '日付' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['日付']):
+        df = df.assign(日付=pd.to_datetime(df['日付']))
+    return save_dataframe_to_sheet(df.assign(行ID=df.index.to_numpy()), SHEET_DATABASE)
+
+
+def load_journal(sheet_name: str = SHEET_JOURNAL) -> pd.DataFrame:
+    """取引履歴のジャーナル（またはアーカイブ）を読み込み"""
+    return typed_journal(load_sheet_as_dataframe(sheet_name, JOURNAL_COLUMNS))
+
+
+def _load_database_state(snapshot_revision: int) -> pd.DataFrame:
+    """スナップショットにジャーナルを再生した現在の取引履歴"""
+    sheets = load_concurrently({'snapshot': load_database, 'journal': load_journal})
+    snapshot = snapshot_rows(sheets['snapshot'], sheets['journal'])
+    return replay(snapshot, sheets['journal'], snapshot_revision)
+
+
+def load_database_with_revision():
+    """取引履歴（スナップショット + ジャーナル）とその時点のリビジョン番号を読み込み"""
+    # 先にリビジョンを読む（読み込み中に更新されても、保存時に付け直し側へ倒れる）
+    revisions = get_sheet_revisions(SHEET_DATABASE, SNAPSHOT_REVISION_KEY)
+    return _load_database_state(revisions[SNAPSHOT_REVISION_KEY]), revisions[SHEET_DATABASE]
+
+
+def _append_journal(events: list) -> bool:
+    return append_rows_to_sheet(events, JOURNAL_COLUMNS, SHEET_JOURNAL, bump_revision=False)
+
+
+def _seal_changes(removed: pd.DataFrame, added: pd.DataFrame) -> bool:
+    """ジャーナルに追記した変更の行のハッシュを記録（改ざん検知用。記録できなければ警告する）"""
+    from .integrity import seal_rows
+    ok = seal_rows(SHEET_DATABASE, added, deleted=removed.index.difference(added.index))
+    if not ok:
+        notify('warning', "⚠️ 変更した行のハッシュを記録できませんでした"
+                          "（python cli.py check で確認してから python cli.py seal で記録し直してください）")
+    return ok
+
+
+def _label_floor(recorded: int) -> int:
+    """新しい行に振る行IDの下限（未記録ならアーカイブとジャーナルで使われた行IDから求める）"""
+    if recorded:
+        return recorded
+    sheets = load_concurrently({
+        'archive': lambda: load_journal(SHEET_JOURNAL_ARCHIVE),
+        'journal': load_journal,
+    })
+    return next_label(pd.DataFrame(), sheets['archive'], sheets['journal'])
+
+
+def _write_snapshot(snapshot: pd.DataFrame, revision: int, reseal: bool = False) -> bool:
+    """内容をスナップショットとして書き込み、ジャーナルをアーカイブへ移す（呼び出し側で書き込みロックを取得）
+
+    行の内容はジャーナルへの追記時に記録済みのため、記録とは照合だけする（reseal=True なら内容全体を記録し直す）
+    """
+    from .integrity import seal_frame
+    journal = load_journal()
+    if len(journal) > 0:
+        archived = journal[JOURNAL_COLUMNS].values.tolist()
+        if not append_rows_to_sheet(archived, JOURNAL_COLUMNS, SHEET_JOURNAL_ARCHIVE, bump_revision=False):
+            return False
+
+    if not save_database(snapshot):
+        return False
+    seal_frame(SHEET_DATABASE, snapshot, changed=None if reseal else ())
+    # スナップショットの書き込み自体はイベントを持たないため、再生の起点はその直前のリビジョン
+    set_sheet_revision(SNAPSHOT_REVISION_KEY, revision)
+    save_dataframe_to_sheet(pd.DataFrame(columns=JOURNAL_COLUMNS), SHEET_JOURNAL)
+    return True
+
+
+def compact_database_journal() -> int:
+    """ジャーナルを今すぐスナップショットへ圧縮（圧縮後のリビジョンを返す）"""
+    with get_write_lock(SHEET_DATABASE):
+        revisions = get_sheet_revisions(SHEET_DATABASE, SNAPSHOT_REVISION_KEY)
+        df = _load_database_state(revisions[SNAPSHOT_REVISION_KEY])
+        _write_snapshot(df, revisions[SHEET_DATABASE])
+        return get_sheet_revision(SHEET_DATABASE)
+
+
+def replace_database(df: pd.DataFrame) -> bool:
+    """取引履歴全体を置き換える（バックアップからの復元用。それまでのジャーナルはアーカイブに残す）
+
+    行IDの列があればその行IDを行ラベルにする（列のない古いバックアップは0からの連番）
+    """
+    if '行ID' in df.columns:
+        df = snapshot_rows(df, pd.DataFrame(columns=JOURNAL_COLUMNS))
+    else:
+        df = df.reset_index(drop=True)
+    with get_write_lock(SHEET_DATABASE):
+        return _write_snapshot(df, get_sheet_revision(SHEET_DATABASE), reseal=True)
+
+
+def save_database_changes(df: pd.DataFrame, removed: pd.DataFrame, added: pd.DataFrame,
+                          base_revision: int, user: str = '') -> SaveResult:
+    """取引履歴の変更をジャーナルに追記（シート全体は書き換えない）
+
+    df は変更後の取引履歴全体、removed / added は削除・変更前の行と追加・変更後の行。
+    base_revision の後に他の人が保存していた場合は、最新の内容に合わせて行IDを付け直し、
+    他の人が既に変更・削除した行への変更だけを競合として除外する。
+    追加した行が削除済みの行の行IDを使っていれば、記録した下限からの行IDに振り直す。
+    保存が COMPACT_EVERY 回たまるとスナップショットへ圧縮する。
+    """
+    with get_write_lock(SHEET_DATABASE):
+        revisions = get_sheet_revisions(SHEET_DATABASE, SNAPSHOT_REVISION_KEY, NEXT_LABEL_KEY)
+        current_revision = revisions[SHEET_DATABASE]
+        conflicts = pd.DataFrame(columns=DATABASE_COLUMNS)
+        merged = current_revision != base_revision
+        if merged:
+            theirs = _load_database_state(revisions[SNAPSHOT_REVISION_KEY])
+            removed, added, conflicts = rebase_changes(removed, added, theirs)
+            df = apply_changes(theirs, removed, added)
+
+        inserted = added.index.difference(removed.index)
+        if len(inserted) > 0:
+            kept = df.drop(index=inserted, errors='ignore')
+            start = next_label(kept, floor=_label_floor(revisions[NEXT_LABEL_KEY]))
+            added = renumber_inserts(removed, added, start)
+            df = pd.concat([kept, added[~added.index.isin(removed.index)]])
+        
+        events = build_events(removed, added, current_revision + 1, user)
+        if not events:
+            return SaveResult(True, df, current_revision, conflicts, merged, removed=removed, added=added)
+        
+        ok = _append_journal(events)
+        if not ok:
+            return SaveResult(False, df, current_revision, conflicts, merged, removed=removed, added=added)
+        _seal_changes(removed, added)
+        if len(inserted) > 0:
+            set_sheet_revision(NEXT_LABEL_KEY, next_label(added, floor=start))
+        revision = bump_sheet_revision(SHEET_DATABASE) or current_revision + 1
+        
+        compacted = revision - revisions[SNAPSHOT_REVISION_KEY] >= COMPACT_EVERY
+        if compacted:
+            _write_snapshot(df, revision)
+            revision = get_sheet_revision(SHEET_DATABASE)
+    
+    return SaveResult(ok, df, revision, conflicts, merged, compacted, removed, added)
+
+
+def save_database_with_revision(df: pd.DataFrame, base_df: pd.DataFrame, base_revision: int,
+                                user: str = '') -> SaveResult:
+    """取引履歴をリビジョン確認付きで保存
+
+    base_df / base_revision は編集の元になったデータとそのリビジョン。
+    base_df からの行単位の変更をジャーナルに追記する（save_database_changes を参照）
+    """
+    removed, added = diff_frames(base_df, df, DATABASE_COLUMNS)
+    return save_database_changes(df, removed, added, base_revision, user)
+
+
+def load_audit_log() -> pd.DataFrame:
+    """変更履歴（アーカイブ + ジャーナル）を新しい順に読み込み"""
+    sheets = load_concurrently({
+        'archive': lambda: load_journal(SHEET_JOURNAL_ARCHIVE),
+        'journal': load_journal,
+    })
+    log = pd.concat([sheets['archive'], sheets['journal']], ignore_index=True)
+    return log.iloc[::-1].reset_index(drop=True)
+
+
+def import_database_file(file, filename: str, rules: dict = None, progress=None, user: str = ''):
+    """CSV / xlsx の取引データをチャンク単位で取り込み、重複を除いてジャーナルに追記
+
+    重複は書き込みロックを取得した後に読み込んだ最新の取引履歴と比べる。
+    取り込みは1回の保存として数え、保存が COMPACT_EVERY 回たまっていればスナップショットへ圧縮する
+    """
+    from .importer import import_ledger_file
+    
+    with get_write_lock(SHEET_DATABASE):
+        revisions = get_sheet_revisions(SHEET_DATABASE, SNAPSHOT_REVISION_KEY, NEXT_LABEL_KEY)
+        revision = revisions[SHEET_DATABASE] + 1
+        state = {'frame': _load_database_state(revisions[SNAPSHOT_REVISION_KEY])}
+        first = state['next'] = next_label(state['frame'], floor=_label_floor(revisions[NEXT_LABEL_KEY]))
+        empty = state['frame'].iloc[0:0]
+        
+        def append(rows):
+            start = state['next']
+            added = pd.DataFrame(rows, columns=DATABASE_COLUMNS, index=range(start, start + len(rows)))
+            if not _append_journal(build_events(empty, added, revision, user)):
+                return False
+            _seal_changes(empty, added)
+            state['frame'] = pd.concat([state['frame'], added])
+            state['next'] = start + len(rows)
+            return True
+        
+        completed = False
+        try:
+            result = import_ledger_file(file, filename, state['frame'], append, rules=rules, progress=progress)
+            completed = True
+            return result
+        finally:
+            # 一部だけ追記された場合も他のセッションが変更を検知できるようにする
+            if state['next'] > first:
+                set_sheet_revision(NEXT_LABEL_KEY, state['next'])
+            revision = bump_sheet_revision(SHEET_DATABASE)
+            if completed and revision - revisions[SNAPSHOT_REVISION_KEY] >= COMPACT_EVERY:
+                _write_snapshot(state['frame'], revision)
 
 
 def load_members() -> pd.DataFrame:
     """メンバーを読み込み"""
-    df = load_sheet_as_dataframe(SHEET_MEMBERS, ['名前', '属性'])
+    df = load_sheet_as_dataframe(SHEET_MEMBERS, ['名前', '属性', '乗車地'])
     if len(df) > 0:
         df['名前'] = df['名前'].fillna('').astype(str)
         df['属性'] = df['属性'].fillna('Player').astype(str)
+        # 乗車地は配車の自動作成で使う（列のない古いシートは空欄）
+        df['乗車地'] = df['乗車地'].fillna('').astype(str) if '乗車地' in df.columns else ''
         df = df[df['名前'].str.strip() != ''].reset_index(drop=True)
     return df
 
@@ -194,13 +710,17 @@ def load_drivers() -> pd.DataFrame:
     """ドライバーを読み込み"""
     df = load_sheet_as_dataframe(
         SHEET_DRIVERS,
-        ['名前', '車種', '燃料タイプ', '燃費']
+        ['名前', '車種', '燃料タイプ', '燃費', '定員', '乗車地']
     )
     if len(df) > 0:
         df['名前'] = df['名前'].fillna('').astype(str)
         df['車種'] = df['車種'].fillna('').astype(str)
         df['燃料タイプ'] = df['燃料タイプ'].fillna('レギュラー').astype(str)
         df['燃費'] = pd.to_numeric(df['燃費'], errors='coerce').fillna(15.0)
+        # 定員（ドライバーを含む）・乗車地は配車の自動作成で使う（列のない古いシートは既定値）
+        df['定員'] = pd.to_numeric(df['定員'], errors='coerce').fillna(5).astype(int) \
+            if '定員' in df.columns else 5
+        df['乗車地'] = df['乗車地'].fillna('').astype(str) if '乗車地' in df.columns else ''
         df = df[df['名前'].str.strip() != ''].reset_index(drop=True)
     return df
 
@@ -236,9 +756,28 @@ def load_transport_balance() -> pd.DataFrame:
     return df
 
 
-def save_transport_balance(df: pd.DataFrame):
-    """交通費会計を保存"""
-    return save_dataframe_to_sheet(df, SHEET_TRANSPORT_BALANCE)
+def save_transport_balance(df: pd.DataFrame, changed=()):
+    """交通費会計を保存（追加・変更した行 changed の位置のハッシュだけを記録し、他の行は記録と照合する）"""
+    from .integrity import seal_frame
+    
+    ok = save_dataframe_to_sheet(df, SHEET_TRANSPORT_BALANCE)
+    if ok:
+        seal_frame(SHEET_TRANSPORT_BALANCE, df.reset_index(drop=True), changed=changed)
+    return ok
+
+
+def load_budget() -> pd.DataFrame:
+    """予算（年度 × 科目）を読み込み"""
+    df = load_sheet_as_dataframe(SHEET_BUDGET, ['年度', '科目', '予算'])
+    if len(df) > 0:
+        df['年度'] = pd.to_numeric(df['年度'], errors='coerce').fillna(0).astype(int)
+        df['予算'] = pd.to_numeric(df['予算'], errors='coerce').fillna(0)
+    return df
+
+
+def save_budget(df: pd.DataFrame):
+    """予算を保存"""
+    return save_dataframe_to_sheet(df, SHEET_BUDGET)
 
 
 def add_transport_balance_entry(date: str, item: str, income: int, expense: int) -> int:
@@ -256,6 +795,6 @@ def add_transport_balance_entry(date: str, item: str, income: int, expense: int)
     })
     
     df = pd.concat([df, new_entry], ignore_index=True)
-    save_transport_balance(df)
+    save_transport_balance(df, changed=[len(df) - 1])
     
     return new_balance
@@ -0,0 +1,60 @@
+"""
+閲覧専用（ゲスト）画面のスナップショット
+台帳・予算・分析グラフ・最近の取引をデータのバージョンごとに1回だけ作成し、
+すべてのゲストのセッションで共有する（ゲストは書き込まないため、セッションごとに読み込まない）
+"""
+from typing import NamedTuple
+
+import pandas as pd
+
+from .changes import sheet_version
+from .ledger import Ledger
+from .sheets import (
+    SHEET_BUDGET, SHEET_DATABASE, get_cached_revisions,
+    load_budget, load_database_with_revision
+)
+from .tenants import tenant_cached
+
+# 最近の取引として表示する件数
+GUEST_RECENT_ROWS = 30
+
+DISPLAY_COLUMNS = ['日付', '種別', '科目', '金額', '決済方法', '備考']
+
+
+class GuestSnapshot(NamedTuple):
+    """ゲスト画面の描画に使う読み取り専用のデータ"""
+    # 台帳（集計キューブ・予算実績を含む。ゲストのセッションでは更新しない）
+    ledger: Ledger
+    budget_table: pd.DataFrame
+    # 分析グラフ（'expense' / 'monthly' / 'method' / 'balance'、データがなければNone）
+    figures: dict
+    # 新しい順の最近の取引
+    recent: pd.DataFrame
+
+
+def build_guest_snapshot() -> GuestSnapshot:
+    """シートを読み込んでスナップショットを作成"""
+    from .charts import build_figures
+
+    ledger = Ledger(*load_database_with_revision())
+    display = ledger.display_frame(DISPLAY_COLUMNS)
+    return GuestSnapshot(
+        ledger=ledger,
+        budget_table=load_budget(),
+        figures=build_figures(ledger.cube, ledger.timeline),
+        recent=display.head(GUEST_RECENT_ROWS),
+    )
+
+
+def get_guest_snapshot() -> GuestSnapshot:
+    """現在のテナントのスナップショット（取引履歴・予算のリビジョンが変わったときだけ作り直す）
+
+    リビジョンは get_cached_revisions で短時間使い回すため、
+    同時に開いた多数のゲストでもSheets APIの呼び出しと作成は1回で済む。
+    シートの直接編集（リビジョンが変わらない変更）は変更の監視の番号で作り直す。
+    新しいバージョンを作成したら古いバージョンは破棄する（使い終わるまでは各セッションが保持する）
+    """
+    revisions = get_cached_revisions()
+    version = (revisions.get(SHEET_DATABASE, 0), revisions.get(SHEET_BUDGET, 0),
+               sheet_version(SHEET_DATABASE), sheet_version(SHEET_BUDGET))
+    return tenant_cached(('guest_snapshot',) + version, build_guest_snapshot, supersedes=('guest_snapshot',))
@@ -0,0 +1,48 @@
+"""
+ダッシュボードのKPI・徴収状況のサマリ（JSONで返せるdict）
+"""
+import pandas as pd
+
+from .cube import LedgerCube, total_assets
+
+
+def _number(value) -> float:
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def kpi_summary(df: pd.DataFrame) -> dict:
+    """財布・銀行口座・総資産の残高と全期間の収入・支出"""
+    cube = LedgerCube.from_ledger(df)
+    wallet = cube.balance('現金 (財布)')
+    bank = cube.balance('銀行口座')
+    income = cube.total(種別='収入')
+    expense = cube.total(種別='支出')
+    return {
+        '財布': _number(wallet),
+        '銀行口座': _number(bank),
+        '総資産': _number(total_assets(cube.balance)),
+        '総収入': _number(income),
+        '総支出': _number(expense),
+        '収支差額': _number(income - expense),
+        '件数': len(df),
+    }
+
+
+def collection_summary(df: pd.DataFrame) -> dict:
+    """徴収状況の未回収総額・未払者数・回収完了率とイベントごとの未回収額"""
+    event_cols = [c for c in df.columns if c != '名前']
+    if len(df) == 0 or not event_cols:
+        return {'未回収総額': 0, '未払者数': 0, '人数': len(df), '回収完了率': 0, 'イベント': {}}
+
+    amounts = df[event_cols].apply(pd.to_numeric, errors='coerce').fillna(0).astype(int)
+    unpaid = amounts.sum(axis=1)
+    unpaid_count = int((unpaid > 0).sum())
+    total_count = len(df)
+    return {
+        '未回収総額': int(unpaid.sum()),
+        '未払者数': unpaid_count,
+        '人数': total_count,
+        '回収完了率': round((total_count - unpaid_count) / total_count, 4),
+        'イベント': {str(c): int(amounts[c].sum()) for c in event_cols},
+    }
@@ -0,0 +1,260 @@
+"""
+マルチテナント（複数クラブ）対応
+テナントごとのスプレッドシートとキャッシュしたデータを、プロセス全体で共有する
+上限付きのLRUに保持する（使われていないテナントから破棄し、メモリが増え続けないようにする）
+"""
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from .runtime import get_secrets, in_streamlit
+
+# secrets.tomlにテナントの設定がない場合のテナント（従来の単一クラブ構成）
+DEFAULT_TENANT = 'default'
+
+# 同時に保持するテナント数と、キャッシュしたデータの合計サイズの上限
+MAX_TENANTS = 8
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# session_stateを使えない実行環境（CLIなど）で使うテナント
+_fallback_tenant = DEFAULT_TENANT
+
+# スレッドごとに指定したテナント（APIのリクエスト・並列読み込みのワーカー）
+_local = threading.local()
+
+
+# 要素ごとにたどらずに大きさを数える値の型（インデックスの辞書・集合の要素の大半）
+_SCALAR_TYPES = {int, float, str, bool, np.int64, np.float64, pd.Timestamp}
+
+
+def _item_bytes(value, seen: set) -> int:
+    return sys.getsizeof(value) if type(value) in _SCALAR_TYPES else estimate_bytes(value, seen)
+
+
+def estimate_bytes(value, _seen: set = None) -> int:
+    """キャッシュする値のおおよそのメモリ使用量（同じオブジェクトは1回だけ数える）"""
+    seen = set() if _seen is None else _seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(value, pd.DataFrame) else int(usage)
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            _item_bytes(k, seen) + _item_bytes(v, seen) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(_item_bytes(v, seen) for v in value)
+    if hasattr(value, 'to_plotly_json'):
+        # plotlyの図は保持しているデータを含めたJSONの大きさで数える
+        return len(value.to_json())
+    attributes = getattr(value, '__dict__', None)
+    if isinstance(attributes, dict) and not isinstance(value, type):
+        # 台帳（Ledger）などは表だけでなく派生データ（集計キューブ・インデックス・表示用キャッシュ）も数える
+        return sys.getsizeof(value) + estimate_bytes(attributes, seen)
+    return sys.getsizeof(value)
+
+
+def load_tenants() -> dict:
+    """テナントの設定を {キー: {'name', 'spreadsheet_id', 'admin_password', 'guest_password'}} で取得
+
+    secrets.tomlの [tenants.<キー>] を使い、なければ [spreadsheet] の単一テナントとして扱う
+    （パスワードはテナントごとの設定がなければ共通の admin_password / guest_password）
+    """
+    secrets = get_secrets()
+    tenants = {}
+    if 'tenants' in secrets:
+        for key, config in secrets['tenants'].items():
+            tenants[key] = {
+                'name': config.get('name', key),
+                'spreadsheet_id': config['spreadsheet_id'],
+                'admin_password': config.get('admin_password', secrets.get('admin_password')),
+                'guest_password': config.get('guest_password', secrets.get('guest_password')),
+            }
+    else:
+        tenants[DEFAULT_TENANT] = {
+            'name': '部活動',
+            'spreadsheet_id': secrets['spreadsheet']['id'] if 'spreadsheet' in secrets else None,
+            'admin_password': secrets.get('admin_password'),
+            'guest_password': secrets.get('guest_password'),
+        }
+    return tenants
+
+
+def current_tenant() -> str:
+    """現在のテナント（Streamlitではログイン時に選んだテナント）"""
+    scoped = getattr(_local, 'tenant', None)
+    if scoped:
+        return scoped
+    if in_streamlit():
+        tenant = st.session_state.get('tenant')
+        if tenant:
+            return tenant
+    return _fallback_tenant
+
+
+def set_fallback_tenant(tenant: str):
+    """session_stateを使わない実行環境のテナントを設定"""
+    global _fallback_tenant
+    _fallback_tenant = tenant
+
+
+@contextmanager
+def tenant_scope(tenant: str):
+    """このスレッドの処理を指定したテナントで実行"""
+    previous = getattr(_local, 'tenant', None)
+    _local.tenant = tenant
+    try:
+        yield
+    finally:
+        _local.tenant = previous
+
+
+class TenantHandle:
+    """テナントのスプレッドシートとキャッシュしたデータ"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.spreadsheet = None
+        # {キャッシュキー: (値, バイト数)}（古い順）
+        self.cache = OrderedDict()
+        self.nbytes = 0
+
+    def drop_oldest(self):
+        _, (_, size) = self.cache.popitem(last=False)
+        self.nbytes -= size
+
+    def clear(self):
+        self.cache.clear()
+        self.nbytes = 0
+
+
+class TenantRegistry:
+    """テナントごとのハンドルを保持する上限付きLRU"""
+
+    def __init__(self, max_tenants: int = MAX_TENANTS, max_bytes: int = MAX_CACHE_BYTES):
+        self.max_tenants = max_tenants
+        self.max_bytes = max_bytes
+        self.handles = OrderedDict()
+        self.lock = threading.RLock()
+        # 作成中のキャッシュキーごとのロック（同じ値を複数のセッションが同時に作らない）
+        self.building = {}
+
+    def handle(self, key: str) -> TenantHandle:
+        """テナントのハンドルを取得（最近使ったものとして扱う）"""
+        with self.lock:
+            handle = self.handles.get(key)
+            if handle is None:
+                handle = self.handles[key] = TenantHandle(key)
+            self.handles.move_to_end(key)
+            self._evict(keep=key)
+            return handle
+
+    def spreadsheet(self, key: str, opener):
+        """テナントのスプレッドシートを取得（未取得なら opener で開く。失敗時はキャッシュしない）"""
+        handle = self.handle(key)
+        if handle.spreadsheet is None:
+            handle.spreadsheet = opener()
+        return handle.spreadsheet
+
+    def cached(self, key: str, cache_key, compute, supersedes: tuple = None):
+        """テナントのキャッシュから値を取得（なければ compute() で作成して保持）
+
+        同じキーを同時に要求された場合は、最初の1回だけ作成して残りはその結果を待つ。
+        supersedes を指定すると、作成したときにキーがそれで始まる他の値（古いバージョン）を破棄する
+        """
+        hit, value = self._lookup(key, cache_key)
+        if hit:
+            return value
+        with self.lock:
+            build_lock = self.building.setdefault((key, cache_key), threading.Lock())
+
+        with build_lock:
+            hit, value = self._lookup(key, cache_key)
+            if hit:
+                return value
+            try:
+                value = compute()
+                size = estimate_bytes(value)
+                with self.lock:
+                    handle = self.handle(key)
+                    if cache_key in handle.cache:
+                        handle.nbytes -= handle.cache.pop(cache_key)[1]
+                    handle.cache[cache_key] = (value, size)
+                    handle.nbytes += size
+                    if supersedes is not None:
+                        self._drop_superseded(handle, cache_key, supersedes)
+                    self._evict(keep=key)
+            finally:
+                with self.lock:
+                    self.building.pop((key, cache_key), None)
+        return value
+
+    def _lookup(self, key: str, cache_key):
+        with self.lock:
+            handle = self.handle(key)
+            if cache_key in handle.cache:
+                handle.cache.move_to_end(cache_key)
+                return True, handle.cache[cache_key][0]
+        return False, None
+
+    @staticmethod
+    def _drop_superseded(handle: TenantHandle, cache_key, prefix: tuple):
+        for old in [k for k in handle.cache if k != cache_key
+                    and isinstance(k, tuple) and k[:len(prefix)] == prefix]:
+            handle.nbytes -= handle.cache.pop(old)[1]
+
+    def total_bytes(self) -> int:
+        return sum(handle.nbytes for handle in self.handles.values())
+
+    def _evict(self, keep: str):
+        """上限を超えた分を、使われていないテナントから破棄"""
+        while len(self.handles) > self.max_tenants:
+            oldest = next(iter(self.handles))
+            if oldest == keep:
+                break
+            del self.handles[oldest]
+
+        total = self.total_bytes()
+        for key in list(self.handles):
+            if total <= self.max_bytes:
+                return
+            if key == keep:
+                continue
+            total -= self.handles[key].nbytes
+            self.handles[key].clear()
+        # 現在のテナントだけで上限を超える場合は古いキャッシュから破棄（最新の1件は残す）
+        handle = self.handles.get(keep)
+        while handle is not None and total > self.max_bytes and len(handle.cache) > 1:
+            before = handle.nbytes
+            handle.drop_oldest()
+            total -= before - handle.nbytes
+
+    def stats(self) -> list:
+        """テナントごとのキャッシュ件数とメモリ使用量（古い順）"""
+        with self.lock:
+            return [
+                {'テナント': key, '件数': len(handle.cache), 'バイト数': handle.nbytes,
+                 'スプレッドシート': handle.spreadsheet is not None}
+                for key, handle in self.handles.items()
+            ]
+
+
+# プロセス全体で共有するレジストリ
+registry = TenantRegistry()
+
+
+def tenant_cached(cache_key, compute, supersedes: tuple = None):
+    """現在のテナントのキャッシュから値を取得（なければ compute() で作成。supersedes は TenantRegistry.cached を参照）"""
+    return registry.cached(current_tenant(), cache_key, compute, supersedes)
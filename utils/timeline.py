@@ -0,0 +1,160 @@
+"""
+残高の推移
+決済方法ごとの日別の入出金と累計残高を配列で保持し、書き込みでは変更された日以降の累計だけを計算し直す。
+グラフにはLTTBで決まった点数に間引いた系列を渡す（何年分の日次データでもブラウザに送る点数は一定）
+"""
+import numpy as np
+import pandas as pd
+
+from .cube import total_assets
+
+TOTAL_LABEL = '総資産'
+
+# グラフに渡す1系列あたりの点数
+TIMELINE_POINTS = 800
+
+
+def _daily_changes(df: pd.DataFrame):
+    """行を (日, 決済方法) ごとの入出金（収入は正、支出は負）の合計にまとめる
+
+    戻り値: (日ごとの入出金, 日付が読めない行の決済方法ごとの入出金)
+    """
+    if len(df) == 0:
+        return pd.Series(dtype=float), pd.Series(dtype=float)
+    dates = pd.to_datetime(df['日付'], errors='coerce')
+    valid = dates.notna().to_numpy()
+    amount = pd.to_numeric(df['金額'], errors='coerce').fillna(0).to_numpy()
+    kind = df['種別'].to_numpy()
+    signed = np.select([kind == '収入', kind == '支出'], [amount, -amount], 0.0)
+    methods = df['決済方法'].fillna('').astype(str).to_numpy()
+    changes = pd.DataFrame({
+        '日': dates.to_numpy()[valid].astype('datetime64[D]').astype(np.int64),
+        '決済方法': methods[valid],
+        '金額': signed[valid],
+    })
+    undated = pd.Series(signed[~valid], index=methods[~valid]).groupby(level=0, sort=False).sum()
+    return changes.groupby(['日', '決済方法'], sort=False)['金額'].sum(), undated
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets で残す点の添字（先頭と末尾は必ず残す）
+
+    間の点を points-2 個のバケツに分け、各バケツから、1つ前に選んだ点と次のバケツの平均とで作る
+    三角形の面積が最大になる点を選ぶ（山・谷・急な変化が残る）
+    """
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    chosen = np.empty(points, dtype=np.int64)
+    chosen[0], chosen[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs(
+            (x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        chosen[i + 1] = a
+    return chosen
+
+
+class BalanceTimeline:
+    """決済方法ごとの日別の入出金と累計残高（追加・削除された行だけで差分更新する）"""
+
+    def __init__(self):
+        # 入出金のあった日（1970-01-01からの日数、昇順）
+        self.days = np.empty(0, dtype=np.int64)
+        self.methods = []
+        # 日 × 決済方法 の入出金と、その日の終わりの残高
+        self.net = np.zeros((0, 0))
+        self.balance = np.zeros((0, 0))
+        # 日付が読めない行の決済方法ごとの入出金（どの日にも置けないため、すべての日の残高に含める）
+        self.undated = np.zeros(0)
+        self._series = {}
+
+    @classmethod
+    def from_ledger(cls, df: pd.DataFrame) -> 'BalanceTimeline':
+        timeline = cls()
+        timeline.add(df)
+        return timeline
+
+    def add(self, df: pd.DataFrame, sign: int = 1):
+        """行を追加（sign=-1で削除）"""
+        changes, undated = _daily_changes(df)
+        days = changes.index.get_level_values('日').to_numpy()
+        methods = changes.index.get_level_values('決済方法')
+
+        new_methods = [m for m in dict.fromkeys([*methods, *undated.index]) if m not in self.methods]
+        if new_methods:
+            self.methods += new_methods
+            padding = np.zeros((len(self.days), len(new_methods)))
+            self.net = np.hstack([self.net, padding])
+            self.balance = np.hstack([self.balance, padding])
+            self.undated = np.concatenate([self.undated, np.zeros(len(new_methods))])
+        if len(undated) > 0:
+            np.add.at(self.undated, [self.methods.index(m) for m in undated.index], sign * undated.to_numpy())
+            self._series = {}
+        if len(changes) == 0:
+            return
+
+        new_days = np.setdiff1d(days, self.days)
+        if len(new_days) > 0:
+            positions = np.searchsorted(self.days, new_days)
+            self.days = np.insert(self.days, positions, new_days)
+            self.net = np.insert(self.net, positions, 0.0, axis=0)
+            self.balance = np.insert(self.balance, positions, 0.0, axis=0)
+
+        rows = np.searchsorted(self.days, days)
+        columns = np.array([self.methods.index(m) for m in methods])
+        np.add.at(self.net, (rows, columns), sign * changes.to_numpy())
+
+        # 変更された最初の日より前の残高はそのまま
+        start = int(rows.min())
+        opening = self.balance[start - 1] if start > 0 else 0.0
+        self.balance[start:] = opening + np.cumsum(self.net[start:], axis=0)
+        self._series = {}
+
+    def remove(self, df: pd.DataFrame):
+        """行を削除"""
+        self.add(df, sign=-1)
+
+    def apply(self, removed: pd.DataFrame, added: pd.DataFrame):
+        """変更（削除された行・追加された行）を反映"""
+        if len(removed) > 0:
+            self.remove(removed)
+        if len(added) > 0:
+            self.add(added)
+
+    def method_balance(self, method: str) -> np.ndarray:
+        """決済方法の日ごとの残高（日付が読めない行の入出金を含む）"""
+        if method not in self.methods:
+            return np.zeros(len(self.days))
+        i = self.methods.index(method)
+        return self.balance[:, i] + self.undated[i]
+
+    def to_frame(self, methods: list = None) -> pd.DataFrame:
+        """日ごとの残高の表（列は決済方法と総資産。総資産は最後の日がKPIの総資産と一致する）"""
+        methods = self.methods if methods is None else methods
+        columns = {m: self.method_balance(m) for m in methods}
+        columns[TOTAL_LABEL] = total_assets(self.method_balance)
+        return pd.DataFrame(columns, index=pd.to_datetime(self.days, unit='D'))
+
+    def series(self, methods: list, points: int = TIMELINE_POINTS) -> dict:
+        """グラフ用に間引いた系列 {名前: (日付, 残高)}（変更がなければ前回の結果を使う）"""
+        key = (tuple(methods), points)
+        if key not in self._series:
+            frame = self.to_frame(methods)
+            x = self.days.astype(float)
+            result = {}
+            for name in frame.columns:
+                y = frame[name].to_numpy()
+                keep = lttb(x, y, points)
+                result[name] = (frame.index[keep], y[keep])
+            self._series[key] = result
+        return self._series[key]
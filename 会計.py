@@ -1,11 +1,27 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-import plotly.express as px
-import plotly.graph_objects as go
 
 # Google Sheets連携ユーティリティ
-from utils.sheets import load_database, save_database
+# （gspread / google-auth は初回のシート読み込み時に遅延importされる）
+from utils.sheets import (
+    load_database_with_revision, save_database_changes, import_database_file, load_audit_log,
+    load_transport_balance, get_sheet_revision, SHEET_TRANSPORT_BALANCE,
+    load_budget, save_budget, SHEET_DATABASE, SHEET_BUDGET
+)
+from utils.changes import sheet_fragment, watch_changes
+from utils.cube import total_assets
+from utils.ledger import Ledger
+from utils.snapshot import get_guest_snapshot
+from utils.tenants import load_tenants, current_tenant, tenant_cached
+from utils.budget import BUDGET_COLUMNS, WARNING_RATIO
+from utils.reconcile import DEFAULT_TOLERANCE_DAYS, read_statement, reconcile
+from utils.duplicates import scan_duplicates
+from utils.profiler import start_profile, finish_profile
+from utils.export import (
+    fiscal_year_of, available_fiscal_years, build_annual_report, annual_report_xlsx,
+    ledger_export_xlsx, to_csv_bytes, select_columns, LEDGER_COLUMNS
+)
 
 # ページ設定
 st.set_page_config(
@@ -21,11 +37,15 @@ st.set_page_config(
 def check_password():
     """Admin/Guest権限を確認する"""
     
+    # クラブ（テナント）ごとのスプレッドシート・パスワード
+    tenants = load_tenants()
+    
     # secrets.tomlにパスワードが設定されているか確認
-    if "admin_password" not in st.secrets or "guest_password" not in st.secrets:
+    if all(not t['admin_password'] or not t['guest_password'] for t in tenants.values()):
         # パスワード未設定の場合はAdmin権限で通す（ローカル開発用）
         st.session_state.role = "admin"
         st.session_state.authenticated = True
+        st.session_state.setdefault("tenant", next(iter(tenants)))
         return True
     
     # セッション状態でログイン状態を管理
@@ -34,7 +54,9 @@ def check_password():
     if "role" not in st.session_state:
         st.session_state.role = None
     
-    if st.session_state.authenticated and st.session_state.role:
+    # 複数クラブの場合はクラブを選んでログインしたセッションのみ通す
+    tenant_selected = len(tenants) == 1 or st.session_state.get("tenant") in tenants
+    if st.session_state.authenticated and st.session_state.role and tenant_selected:
         return True
     
     # ログイン画面を表示
@@ -47,17 +69,29 @@ def check_password():
     
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
+        tenant_keys = list(tenants)
+        if len(tenant_keys) > 1:
+            tenant = st.selectbox(
+                "🏫 クラブ", tenant_keys,
+                format_func=lambda key: tenants[key]['name'], key="tenant_input"
+            )
+        else:
+            tenant = tenant_keys[0]
         password = st.text_input("🔑 パスワード", type="password", key="password_input")
+        user_name = st.text_input("👤 お名前（変更履歴に記録されます）", key="user_name_input")
         
         if st.button("ログイン", use_container_width=True, type="primary"):
-            if password == st.secrets["admin_password"]:
+            if password == tenants[tenant]['admin_password']:
                 st.session_state.authenticated = True
                 st.session_state.role = "admin"
+                st.session_state.tenant = tenant
+                st.session_state.user_name = user_name.strip()
                 st.success("✅ 管理者としてログインしました")
                 st.rerun()
-            elif password == st.secrets["guest_password"]:
+            elif password == tenants[tenant]['guest_password']:
                 st.session_state.authenticated = True
                 st.session_state.role = "guest"
+                st.session_state.tenant = tenant
                 st.success("✅ 閲覧者としてログインしました")
                 st.rerun()
             else:
@@ -80,6 +114,12 @@ check_password()
 CURRENT_ROLE = st.session_state.get("role", "guest")
 IS_ADMIN = CURRENT_ROLE == "admin"
 
+# ?profile=1 が付いていれば、この1回の実行のプロファイルを取る（管理者のみ）
+profiler = start_profile(__file__, IS_ADMIN)
+
+# 変更履歴に記録する担当者名（未入力なら権限名）
+CURRENT_USER = st.session_state.get("user_name") or CURRENT_ROLE
+
 # 科目リスト定義（種別ごと）
 EXPENSE_CATEGORIES = [
     "大会費", "OB通信費", "備品", "雑費", 
@@ -157,9 +197,99 @@ st.markdown(f"""
 </style>
 """, unsafe_allow_html=True)
 
-# session_stateにデータを保持（Google Sheetsから読み込み）
-if 'data' not in st.session_state:
-    st.session_state.data = load_database()
+# ゲストはデータのバージョンごとに1回だけ作る共有のスナップショットを表示する
+# （セッションごとにシートを読み込まない。管理者の書き込み後、最初のゲストが作り直す）
+guest_snapshot = None if IS_ADMIN else get_guest_snapshot()
+
+# 管理者はsession_stateに型付きの台帳を保持（Google Sheetsから読み込み）
+# ledger.revision は読み込み時点のリビジョン（保存時の競合検出に使う）
+# ledger.cube は年×月×種別×科目×決済方法の集計キューブ（書き込みごとに差分更新）
+if guest_snapshot is not None:
+    ledger = guest_snapshot.ledger
+else:
+    if 'ledger' not in st.session_state:
+        st.session_state.ledger = Ledger(*load_database_with_revision())
+    ledger = st.session_state.ledger
+
+# 予算（年度 × 科目）。実績は ledger.budget が書き込みごとに差分更新する
+if guest_snapshot is None and 'budget_table' not in st.session_state:
+    st.session_state.budget_table = load_budget()
+
+
+def reload_ledger():
+    st.session_state.ledger = Ledger(*load_database_with_revision())
+
+
+def reload_budget():
+    st.session_state.budget_table = load_budget()
+
+
+# 他の管理者・シートの直接編集による変更を数秒ごとに確認し、変更されたシートだけ読み込み直す
+# （ゲストは共有のスナップショットがリビジョンごとに作り直されるため、再実行するだけ）
+# 取引履歴はほぼすべてのセクションが使うため画面全体を、予算は予算の進捗のfragmentだけを再実行する
+if guest_snapshot is None:
+    watch_changes({SHEET_DATABASE: reload_ledger})
+    BUDGET_RELOADERS = {SHEET_BUDGET: reload_budget}
+else:
+    watch_changes({SHEET_DATABASE: lambda: None})
+    BUDGET_RELOADERS = {SHEET_BUDGET: lambda: None}
+
+
+def save_ledger(new_df, removed, added):
+    """取引履歴の変更をジャーナルに追記し、session_stateを最新の内容に更新
+
+    removed / added: 削除・変更前の行と追加・変更後の行（ジャーナルのイベントと集計キューブの差分更新に使う）
+    """
+    result = save_database_changes(new_df, removed, added, ledger.revision, CURRENT_USER)
+    if result.ok:
+        if result.merged:
+            # 他の管理者の変更を取り込んだ場合は作り直す
+            st.session_state.ledger = Ledger(result.data, result.revision)
+            st.session_state.save_notice = "🔄 他の管理者の変更とマージして保存しました"
+        else:
+            # 追加した行の行IDは保存時に振り直されることがあるため、書き込んだ変更で更新する
+            ledger.update(result.data, result.revision, result.removed, result.added)
+        if len(result.conflicts) > 0:
+            st.session_state.save_conflicts = result.conflicts
+    return result.ok
+
+
+def append_entry(rows):
+    """新規取引を末尾に追加して保存"""
+    new_data, new_rows = ledger.with_appended(rows)
+    return save_ledger(new_data, ledger.frame.iloc[0:0], new_rows)
+
+
+# ======================
+# 収支報告書・エクスポート（台帳のバージョンごとにキャッシュ）
+# ======================
+# （テナントごとのLRUに保持し、使われていないテナントのキャッシュから破棄される）
+def cached_annual_report(version, fiscal_year, _ledger):
+    """収支報告書の集計表と残高サマリ"""
+    return tenant_cached(
+        ('annual_report', version, fiscal_year),
+        lambda: build_annual_report(_ledger, fiscal_year, PAYMENT_METHODS)
+    )
+
+
+def cached_annual_report_xlsx(version, fiscal_year, _ledger):
+    """収支報告書のxlsx"""
+    return tenant_cached(
+        ('annual_report_xlsx', version, fiscal_year),
+        lambda: annual_report_xlsx(_ledger, fiscal_year, PAYMENT_METHODS)
+    )
+
+
+def cached_ledger_export(version, transport_version, _ledger):
+    """取引履歴・交通費会計の書き出しファイル"""
+    def build():
+        transport = load_transport_balance()
+        return {
+            'xlsx': ledger_export_xlsx(_ledger, transport),
+            'ledger_csv': to_csv_bytes(select_columns(_ledger, LEDGER_COLUMNS)),
+            'transport_csv': to_csv_bytes(transport),
+        }
+    return tenant_cached(('ledger_export', version, transport_version), build)
 
 # ======================
 # サイドバー: 権限に応じて表示切替
@@ -167,6 +297,11 @@ if 'data' not in st.session_state:
 with st.sidebar:
     st.markdown("## 💰 会計管理")
     
+    # 複数クラブで運用している場合は現在のクラブを表示
+    tenant_configs = load_tenants()
+    if len(tenant_configs) > 1:
+        st.caption(f"🏫 {tenant_configs[current_tenant()]['name']}")
+    
     # 現在のログイン状態を表示
     if IS_ADMIN:
         st.success("👤 管理者モード")
@@ -224,7 +359,7 @@ with st.sidebar:
                             '備考': [note if note else f'{transfer_from}から{transfer_to}へ移動'],
                             '決済方法': [transfer_to]
                         })
-                        st.session_state.data = pd.concat([st.session_state.data, entry_out, entry_in], ignore_index=True)
+                        new_rows = pd.concat([entry_out, entry_in], ignore_index=True)
                     else:
                         new_entry = pd.DataFrame({
                             '日付': [pd.Timestamp(date)],
@@ -234,14 +369,66 @@ with st.sidebar:
                             '備考': [note],
                             '決済方法': [payment_method]
                         })
-                        st.session_state.data = pd.concat([st.session_state.data, new_entry], ignore_index=True)
+                        new_rows = new_entry
                     
-                    # Google Sheetsに保存
-                    save_database(st.session_state.data)
-                    st.success("✨ 登録完了！")
-                    st.rerun()
+                    # 日付・種別・科目・金額・決済方法が同じ取引があれば、確認してから登録する
+                    # （ダブルクリック・二重入力の防止。インデックスを引くだけで取引履歴は走査しない）
+                    if len(ledger.find_duplicates(new_rows)) > 0:
+                        st.session_state.pending_entry = new_rows
+                    # Google Sheetsに保存（他の管理者の保存があればマージ）
+                    elif append_entry(new_rows):
+                        st.success("✨ 登録完了！")
+                        st.rerun()
                 else:
                     st.error("⚠️ 金額を入力してください")
+        
+        # 重複の可能性がある取引の確認
+        if 'pending_entry' in st.session_state:
+            pending_entry = st.session_state.pending_entry
+            existing = ledger.find_duplicates(pending_entry)
+            st.warning(f"⚠️ 同じ日付・種別・科目・金額・決済方法の取引が{len(existing)}件登録済みです")
+            st.dataframe(
+                existing.assign(日付=existing['日付'].dt.strftime('%Y-%m-%d'))[['日付', '科目', '金額', '備考']],
+                use_container_width=True, hide_index=True
+            )
+            dup_col1, dup_col2 = st.columns(2)
+            with dup_col1:
+                if st.button("✅ それでも登録", use_container_width=True, key="pending_confirm"):
+                    del st.session_state.pending_entry
+                    if append_entry(pending_entry):
+                        st.success("✨ 登録完了！")
+                        st.rerun()
+            with dup_col2:
+                if st.button("✖️ 取り消す", use_container_width=True, key="pending_cancel"):
+                    del st.session_state.pending_entry
+                    st.rerun()
+        
+        # 一括インポート（過去年度のデータ・通帳CSV）
+        with st.expander("📥 一括インポート (CSV / Excel)"):
+            uploaded = st.file_uploader("ファイルを選択", type=["csv", "xlsx"], key="import_file")
+            import_method = st.selectbox(
+                "💳 決済方法（ファイルにない場合）", PAYMENT_METHODS,
+                index=PAYMENT_METHODS.index("銀行口座"), key="import_method"
+            )
+            st.caption("日付・金額・備考が同じ取引が取引履歴にあれば、その件数までは重複として取り込みません")
+            
+            if uploaded is not None and st.button("📥 インポート実行", use_container_width=True, key="import_run"):
+                status = st.empty()
+                try:
+                    result = import_database_file(
+                        uploaded, uploaded.name,
+                        rules={'default_method': import_method},
+                        progress=lambda n: status.caption(f"⏳ {n:,}行を処理中..."),
+                        user=CURRENT_USER
+                    )
+                    st.session_state.ledger = Ledger(*load_database_with_revision())
+                    st.session_state.save_notice = (
+                        f"📥 {result.imported:,}件を取り込みました"
+                        f"（読込 {result.read:,}件 / 重複 {result.duplicates:,}件 / 無効 {result.invalid:,}件）"
+                    )
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"⚠️ インポート中にエラーが発生しました: {e}")
     else:
         # Guestの場合は閲覧専用メッセージ
         st.markdown("""
@@ -265,43 +452,34 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# 保存時のマージ・競合の通知
+if 'save_notice' in st.session_state:
+    st.info(st.session_state.pop('save_notice'))
+if 'save_conflicts' in st.session_state:
+    conflicts = st.session_state.pop('save_conflicts')
+    st.warning(f"⚠️ {len(conflicts)}件の変更は、他の管理者が先に同じ行を変更・削除していたため保存されませんでした")
+    st.dataframe(conflicts, use_container_width=True, hide_index=True)
+
 # 全期間のデータを使用
-df = st.session_state.data.copy()
-if len(df) > 0:
-    df['日付'] = pd.to_datetime(df['日付'])
-    if '決済方法' not in df.columns:
-        df['決済方法'] = '現金 (財布)'
+# （型変換済みの台帳をそのまま参照し、コピーは作らない）
+df = ledger.frame
 
 # ======================
 # KPIセクション（財布・口座・総資産の3分割表示）
 # ======================
 st.markdown('<p class="section-title">📊 資産状況（全期間累計）</p>', unsafe_allow_html=True)
 
-if len(df) > 0:
-    # 財布（現金）の計算
-    wallet_df = df[df['決済方法'] == '現金 (財布)']
-    wallet_income = wallet_df[wallet_df['種別'] == '収入']['金額'].sum()
-    wallet_expense = wallet_df[wallet_df['種別'] == '支出']['金額'].sum()
-    wallet_balance = wallet_income - wallet_expense
-    
-    # 銀行口座の計算
-    bank_df = df[df['決済方法'] == '銀行口座']
-    bank_income = bank_df[bank_df['種別'] == '収入']['金額'].sum()
-    bank_expense = bank_df[bank_df['種別'] == '支出']['金額'].sum()
-    bank_balance = bank_income - bank_expense
-    
-    # 総資産
-    total_balance = wallet_balance + bank_balance
-    
-    # 全期間の収入・支出
-    total_income = df[df['種別'] == '収入']['金額'].sum()
-    total_expense = df[df['種別'] == '支出']['金額'].sum()
-else:
-    wallet_balance = 0
-    bank_balance = 0
-    total_balance = 0
-    total_income = 0
-    total_expense = 0
+# 集計キューブから計算（取引履歴を走査しない）
+cube = ledger.cube
+wallet_balance = cube.balance('現金 (財布)')
+bank_balance = cube.balance('銀行口座')
+
+# 総資産（残高の推移の総資産と同じ計算）
+total_balance = total_assets(cube.balance)
+
+# 全期間の収入・支出
+total_income = cube.total(種別='収入')
+total_expense = cube.total(種別='支出')
 
 # KPIカード表示（3列）
 kpi1, kpi2, kpi3 = st.columns(3)
@@ -340,150 +518,112 @@ with col3:
 
 st.markdown("<br>", unsafe_allow_html=True)
 
+# ======================
+# 予算の進捗（年度 × 科目の実績カウンタから表示）
+# ======================
+st.markdown('<p class="section-title">🎯 予算の進捗</p>', unsafe_allow_html=True)
+
+
+@sheet_fragment(BUDGET_RELOADERS)
+def budget_section():
+    """予算の進捗と予算の設定（予算が変更されたときはこの部分だけを再実行）"""
+    # fragmentだけの再実行でも最新の予算・台帳を使う（ゲストは予算のリビジョンごとのスナップショット）
+    snapshot = get_guest_snapshot() if guest_snapshot is not None else None
+    budget_table = snapshot.budget_table if snapshot is not None else st.session_state.budget_table
+    budget_ledger = snapshot.ledger if snapshot is not None else st.session_state.ledger
+    current_fiscal_year = fiscal_year_of(datetime.now())
+    budget_years = sorted(set(budget_table['年度']) | {current_fiscal_year}, reverse=True) \
+        if len(budget_table) > 0 else [current_fiscal_year]
+    budget_year = st.selectbox(
+        "会計年度", budget_years,
+        format_func=lambda y: f"{y}年度（{y}年4月〜{y + 1}年3月）",
+        key="budget_fiscal_year"
+    )
+    budget_report = budget_ledger.budget.report(budget_table, budget_year, EXPENSE_CATEGORIES)
+    planned_report = budget_report[budget_report['予算'] > 0]
+
+    if len(planned_report) > 0:
+        overspent = planned_report[planned_report['実績'] > planned_report['予算']]
+        for _, row in overspent.iterrows():
+            st.error(f"🚨 {row['科目']}: 予算を ¥{-row['残り']:,.0f} 超過しています（実績 ¥{row['実績']:,.0f} / 予算 ¥{row['予算']:,.0f}）")
+        
+        budget_col1, budget_col2 = st.columns(2)
+        for i, (_, row) in enumerate(planned_report.iterrows()):
+            with (budget_col1 if i % 2 == 0 else budget_col2):
+                ratio = row['消化率']
+                icon = "🚨" if ratio > 1 else "⚠️" if ratio >= WARNING_RATIO else "✅"
+                st.progress(
+                    min(ratio, 1.0),
+                    text=f"{icon} {row['科目']}: ¥{row['実績']:,.0f} / ¥{row['予算']:,.0f}（{ratio:.0%}）"
+                )
+    else:
+        st.info(f"📭 {budget_year}年度の予算が設定されていません")
+
+    if IS_ADMIN:
+        with st.expander("✏️ 予算を設定", expanded=False):
+            year_budget = budget_report[['科目', '予算']]
+            edited_budget = st.data_editor(
+                year_budget,
+                column_config={
+                    "科目": st.column_config.TextColumn("科目", disabled=True),
+                    "予算": st.column_config.NumberColumn("予算", min_value=0, step=1000, format="¥%d"),
+                },
+                use_container_width=True,
+                hide_index=True,
+                key=f"budget_editor_{budget_year}"
+            )
+            if st.button("💾 予算を保存", type="primary", use_container_width=True, key="budget_save"):
+                others = budget_table[budget_table['年度'] != budget_year] if len(budget_table) > 0 \
+                    else pd.DataFrame(columns=BUDGET_COLUMNS)
+                updated = edited_budget[edited_budget['予算'].fillna(0) > 0].assign(年度=budget_year)
+                new_budget = pd.concat([others, updated[BUDGET_COLUMNS]], ignore_index=True)
+                if save_budget(new_budget):
+                    st.session_state.budget_table = new_budget
+                    st.success("✅ 予算を保存しました")
+                    st.rerun(scope="fragment")
+
+
+budget_section()
+
+st.markdown("<br>", unsafe_allow_html=True)
+
 # ======================
 # グラフセクション（全期間データ）
 # ======================
 st.markdown('<p class="section-title">📈 分析（全期間）</p>', unsafe_allow_html=True)
 
-tab1, tab2, tab3 = st.tabs(["🥧 支出の内訳", "📊 月別収支推移", "💳 決済方法別"])
+# plotlyは読み込みが重いため、分析セクションを描画する時点でimportする
+# （ログイン画面では読み込まない。2回目以降のrerunはモジュールキャッシュが使われる）
+# ゲストはスナップショットの作成済みの図を使う
+if guest_snapshot is not None:
+    figures = guest_snapshot.figures
+else:
+    from utils.charts import build_figures
+    figures = build_figures(cube, ledger.timeline)
+
+tab1, tab2, tab3, tab4 = st.tabs(["🥧 支出の内訳", "📊 月別収支推移", "💳 決済方法別", "📉 残高の推移"])
 
 with tab1:
-    expense_data = df[df['種別'] == '支出'] if len(df) > 0 else pd.DataFrame()
-    
-    if len(expense_data) > 0:
-        expense_by_category = expense_data.groupby('科目')['金額'].sum().reset_index()
-        
-        enji_palette = [
-            '#670317', '#8B1538', '#A52A4A', '#C04060', 
-            '#D85A7A', '#E87A9A', '#F5A0B8', '#FFD0DD',
-            '#4A0210', '#7D1A3D'
-        ]
-        
-        fig = px.pie(
-            expense_by_category,
-            values='金額',
-            names='科目',
-            color_discrete_sequence=enji_palette,
-            hole=0.45
-        )
-        fig.update_layout(
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            font=dict(color='#262730', size=14),
-            showlegend=True,
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=-0.15,
-                xanchor="center",
-                x=0.5,
-                font=dict(size=12)
-            ),
-            margin=dict(t=30, b=30, l=30, r=30),
-            height=400
-        )
-        fig.update_traces(
-            textinfo='percent+value',
-            texttemplate='%{percent}<br>¥%{value:,.0f}',
-            textfont_size=13,
-            hovertemplate='<b>%{label}</b><br>金額: ¥%{value:,.0f}<br>割合: %{percent}<extra></extra>'
-        )
-        st.plotly_chart(fig, use_container_width=True)
+    if figures['expense'] is not None:
+        st.plotly_chart(figures['expense'], use_container_width=True)
     else:
         st.info("📭 支出データがありません")
 
 with tab2:
-    if len(df) > 0:
-        df['年月'] = df['日付'].dt.to_period('M').astype(str)
-        monthly_data = df.groupby(['年月', '種別'])['金額'].sum().unstack(fill_value=0).reset_index()
-        
-        if '収入' not in monthly_data.columns:
-            monthly_data['収入'] = 0
-        if '支出' not in monthly_data.columns:
-            monthly_data['支出'] = 0
-        
-        fig = go.Figure()
-        
-        fig.add_trace(go.Bar(
-            name='収入',
-            x=monthly_data['年月'],
-            y=monthly_data['収入'],
-            marker_color='#2E7D32',
-            hovertemplate='<b>%{x}</b><br>収入: ¥%{y:,.0f}<extra></extra>'
-        ))
-        
-        fig.add_trace(go.Bar(
-            name='支出',
-            x=monthly_data['年月'],
-            y=monthly_data['支出'],
-            marker_color='#670317',
-            hovertemplate='<b>%{x}</b><br>支出: ¥%{y:,.0f}<extra></extra>'
-        ))
-        
-        fig.update_layout(
-            barmode='group',
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            font=dict(color='#262730', size=12),
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
-            ),
-            margin=dict(t=50, b=50, l=50, r=30),
-            height=400,
-            xaxis=dict(showgrid=False, title="月"),
-            yaxis=dict(showgrid=True, gridcolor='rgba(0,0,0,0.1)', title="金額 (円)")
-        )
-        st.plotly_chart(fig, use_container_width=True)
+    if figures['monthly'] is not None:
+        st.plotly_chart(figures['monthly'], use_container_width=True)
     else:
         st.info("📭 データがありません")
 
 with tab3:
-    if len(df) > 0:
-        method_data = df.groupby(['決済方法', '種別'])['金額'].sum().unstack(fill_value=0).reset_index()
-        
-        if '収入' not in method_data.columns:
-            method_data['収入'] = 0
-        if '支出' not in method_data.columns:
-            method_data['支出'] = 0
-        
-        fig = go.Figure()
-        
-        fig.add_trace(go.Bar(
-            name='収入',
-            x=method_data['決済方法'],
-            y=method_data['収入'],
-            marker_color='#2E7D32',
-            hovertemplate='<b>%{x}</b><br>収入: ¥%{y:,.0f}<extra></extra>'
-        ))
-        
-        fig.add_trace(go.Bar(
-            name='支出',
-            x=method_data['決済方法'],
-            y=method_data['支出'],
-            marker_color='#670317',
-            hovertemplate='<b>%{x}</b><br>支出: ¥%{y:,.0f}<extra></extra>'
-        ))
-        
-        fig.update_layout(
-            barmode='group',
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            font=dict(color='#262730', size=12),
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
-            ),
-            margin=dict(t=50, b=50, l=50, r=30),
-            height=350
-        )
-        st.plotly_chart(fig, use_container_width=True)
+    if figures['method'] is not None:
+        st.plotly_chart(figures['method'], use_container_width=True)
+    else:
+        st.info("📭 データがありません")
+
+with tab4:
+    if figures['balance'] is not None:
+        st.plotly_chart(figures['balance'], use_container_width=True)
     else:
         st.info("📭 データがありません")
 
@@ -497,24 +637,63 @@ if IS_ADMIN:
 else:
     st.markdown('<p class="section-title">📋 取引履歴（全期間・閲覧専用）</p>', unsafe_allow_html=True)
 
-if len(df) > 0:
-    display_df = df.copy()
-    display_df['日付'] = pd.to_datetime(display_df['日付']).dt.strftime('%Y-%m-%d')
-    display_df['備考'] = display_df['備考'].fillna("").astype(str)
-    if '決済方法' not in display_df.columns:
-        display_df['決済方法'] = '現金 (財布)'
-    display_df = display_df.sort_values('日付', ascending=False).reset_index(drop=True)
+# ======================
+# 検索（日付・種別・科目・決済方法・備考のインデックスで絞り込み）
+# ======================
+with st.expander("🔍 取引を検索", expanded=False):
+    search_col1, search_col2 = st.columns([1, 2])
+    with search_col1:
+        search_period = st.date_input("📅 期間", value=(), key="search_period")
+    with search_col2:
+        search_keyword = st.text_input("📝 備考のキーワード", placeholder="例: 春季大会", key="search_keyword")
+    
+    search_col3, search_col4, search_col5 = st.columns(3)
+    with search_col3:
+        search_types = st.multiselect("📊 種別", ["収入", "支出"], key="search_types")
+    with search_col4:
+        search_categories = st.multiselect(
+            "📁 科目", sorted(ledger.cube.to_frame()['科目'].unique()), key="search_categories"
+        )
+    with search_col5:
+        search_methods = st.multiselect("💳 決済方法", PAYMENT_METHODS, key="search_methods")
     
+    search_start = pd.Timestamp(search_period[0]) if len(search_period) > 0 else None
+    search_end = pd.Timestamp(search_period[1]) if len(search_period) > 1 else search_start
+    
+    if search_start is not None or search_keyword.strip() or search_types or search_categories or search_methods:
+        results = ledger.search(
+            start=search_start,
+            end=search_end,
+            keyword=search_keyword,
+            種別=search_types,
+            科目=search_categories,
+            決済方法=search_methods
+        )
+        result_income = results.loc[results['種別'] == '収入', '金額'].sum()
+        result_expense = results.loc[results['種別'] == '支出', '金額'].sum()
+        st.caption(f"🔎 {len(results):,}件　収入 ¥{result_income:,.0f} / 支出 ¥{result_expense:,.0f}")
+        st.dataframe(
+            results.assign(日付=results['日付'].dt.strftime('%Y-%m-%d'))[['日付', '種別', '科目', '金額', '決済方法', '備考']],
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "金額": st.column_config.NumberColumn("💴 金額", format="¥%d")
+            }
+        )
+    else:
+        st.caption("💡 条件を指定すると該当する取引を表示します")
+
+# 表示用の表は台帳のバージョンごとに1回だけ作成（日付の文字列化・並べ替えもキャッシュ）
+DISPLAY_COLUMNS = ['日付', '種別', '科目', '金額', '決済方法', '備考']
+
+if len(df) > 0:
     if IS_ADMIN:
-        # 管理者: 編集・削除可能
-        # 削除用カラムを一番左に追加
-        display_df.insert(0, "削除", False)
+        # 管理者: 編集・削除可能（削除用カラムを一番左に追加した表）
+        # キーに台帳のバージョンを含め、保存後は編集状態をリセットする
+        editor_key = f"data_editor_{ledger.revision}_{len(ledger)}"
+        display_df = ledger.editor_frame(DISPLAY_COLUMNS)
         
-        # カラム順序を調整
-        column_order = ['削除', '日付', '種別', '科目', '金額', '決済方法', '備考']
-        display_df = display_df[[c for c in column_order if c in display_df.columns]]
-        
-        edited_df = st.data_editor(
+        st.data_editor(
             display_df,
             use_container_width=True,
             hide_index=True,
@@ -550,31 +729,64 @@ if len(df) > 0:
                 ),
                 "備考": st.column_config.TextColumn("📝 備考", width="medium")
             },
-            key="data_editor"
+            key=editor_key
         )
         
-        # 削除チェックがついている行を除外して保存用データを作成
-        to_save_df = edited_df[edited_df["削除"] == False].drop(columns=["削除"]).copy()
-        
-        # 元データ（削除カラムなし）と比較
-        original_df = display_df.drop(columns=["削除"]).copy()
+        # 編集状態（変更・追加・削除された行だけ）から保存内容を作成し、表全体の比較やコピーはしない
+        removed_rows, added_rows = ledger.editor_changes(st.session_state.get(editor_key))
         
         # 変更検知して保存
-        if not original_df.equals(to_save_df):
+        if len(removed_rows) > 0 or len(added_rows) > 0:
             try:
-                save_df = to_save_df.copy()
-                save_df['日付'] = pd.to_datetime(save_df['日付'])
-                save_df = save_df.sort_values('日付', ascending=False).reset_index(drop=True)
-                st.session_state.data = save_df
-                save_database(save_df)
-                st.success("✅ 変更を保存しました")
-                st.rerun()
+                save_df = ledger.with_changes(removed_rows, added_rows)
+                if save_ledger(save_df, removed_rows, added_rows):
+                    st.success("✅ 変更を保存しました")
+                    st.rerun()
             except Exception as e:
                 st.error(f"⚠️ 保存中にエラーが発生しました: {e}")
+        
+        # 重複の可能性がある取引（日付・種別・科目・金額・決済方法が同じ行を1回の走査で探す）
+        with st.expander("🧹 重複の可能性がある取引", expanded=False):
+            if st.button("🔎 取引履歴を確認", use_container_width=True, key="duplicates_scan"):
+                st.session_state.duplicate_scan = tenant_cached(
+                    ('duplicates', ledger.version), lambda: scan_duplicates(ledger.frame)
+                )
+            
+            if 'duplicate_scan' in st.session_state:
+                duplicate_scan = st.session_state.duplicate_scan
+                if len(duplicate_scan) > 0:
+                    st.caption(f"{duplicate_scan['グループ'].nunique():,}組 / {len(duplicate_scan):,}件（不要な行は上の表で削除してください）")
+                    st.dataframe(
+                        duplicate_scan.assign(日付=duplicate_scan['日付'].dt.strftime('%Y-%m-%d'))[['グループ'] + DISPLAY_COLUMNS],
+                        use_container_width=True, hide_index=True
+                    )
+                else:
+                    st.success("✅ 重複の可能性がある取引はありません")
+        
+        # 変更履歴（ジャーナルのイベントを新しい順に表示）
+        with st.expander("🕒 変更履歴（誰がいつ何を変更したか）", expanded=False):
+            if st.button("📜 変更履歴を読み込む", use_container_width=True, key="audit_load"):
+                st.session_state.audit_log = load_audit_log()
+            
+            if 'audit_log' in st.session_state:
+                audit_log = st.session_state.audit_log
+                audit_col1, audit_col2 = st.columns(2)
+                with audit_col1:
+                    audit_users = st.multiselect("👤 担当", sorted(audit_log['担当'].astype(str).unique()), key="audit_users")
+                with audit_col2:
+                    audit_ops = st.multiselect("🔧 操作", ["追加", "変更", "削除"], key="audit_ops")
+                if audit_users:
+                    audit_log = audit_log[audit_log['担当'].astype(str).isin(audit_users)]
+                if audit_ops:
+                    audit_log = audit_log[audit_log['操作'].isin(audit_ops)]
+                st.dataframe(audit_log, use_container_width=True, hide_index=True)
+                st.caption(f"{len(audit_log):,}件")
     else:
         # Guest: 閲覧専用（dataframeで表示）
-        column_order = ['日付', '種別', '科目', '金額', '決済方法', '備考']
-        display_df = display_df[[c for c in column_order if c in display_df.columns]]
+        # 最近の取引はスナップショットの表をそのまま表示し、全件は必要なときだけ表示する
+        show_all = st.toggle(f"すべての取引を表示（{len(ledger):,}件）", key="guest_show_all") \
+            if len(ledger) > len(guest_snapshot.recent) else False
+        display_df = ledger.display_frame(DISPLAY_COLUMNS) if show_all else guest_snapshot.recent
         
         st.dataframe(
             display_df,
@@ -593,9 +805,116 @@ if len(df) > 0:
 else:
     st.info("📭 取引データがありません")
 
+st.markdown("<br>", unsafe_allow_html=True)
+
+# ======================
+# 収支報告書・エクスポート
+# ======================
+st.markdown('<p class="section-title">📤 収支報告書・エクスポート</p>', unsafe_allow_html=True)
+
+with st.expander("📑 年度別 収支報告書", expanded=False):
+    fiscal_years = available_fiscal_years(df)
+    if len(fiscal_years) > 0:
+        fiscal_year = st.selectbox(
+            "会計年度", fiscal_years,
+            format_func=lambda y: f"{y}年度（{y}年4月〜{y + 1}年3月）",
+            key="report_fiscal_year"
+        )
+        report_table, report_summary = cached_annual_report(ledger.version, fiscal_year, df)
+        
+        st.dataframe(report_summary, use_container_width=True, hide_index=True)
+        st.dataframe(report_table, use_container_width=True, hide_index=True)
+        st.download_button(
+            "⬇️ 収支報告書をダウンロード (xlsx)",
+            data=cached_annual_report_xlsx(ledger.version, fiscal_year, df),
+            file_name=f"収支報告書_{fiscal_year}年度.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            use_container_width=True
+        )
+    else:
+        st.info("📭 取引データがありません")
+
+# 交通費会計を含むため管理者のみ（交通費計算ページも管理者専用）
+if IS_ADMIN:
+    with st.expander("💾 データの書き出し（取引履歴・交通費会計）", expanded=False):
+        if st.button("📤 書き出しファイルを作成", use_container_width=True, key="export_build"):
+            transport_version = get_sheet_revision(SHEET_TRANSPORT_BALANCE)
+            st.session_state.export_files = cached_ledger_export(ledger.version, transport_version, df)
+        
+        if 'export_files' in st.session_state:
+            export_files = st.session_state.export_files
+            today = datetime.now().strftime('%Y%m%d')
+            st.download_button(
+                "⬇️ まとめてダウンロード (xlsx)", data=export_files['xlsx'],
+                file_name=f"会計データ_{today}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True
+            )
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button(
+                    "⬇️ 取引履歴 (CSV)", data=export_files['ledger_csv'],
+                    file_name=f"取引履歴_{today}.csv", mime="text/csv", use_container_width=True
+                )
+            with col2:
+                st.download_button(
+                    "⬇️ 交通費会計 (CSV)", data=export_files['transport_csv'],
+                    file_name=f"交通費会計_{today}.csv", mime="text/csv", use_container_width=True
+                )
+
+# ======================
+# 通帳との照合（管理者のみ）
+# ======================
+if IS_ADMIN:
+    with st.expander("🏦 通帳と照合（銀行口座の取引）", expanded=False):
+        statement_file = st.file_uploader("通帳・明細ファイル (CSV / Excel)", type=["csv", "xlsx"], key="reconcile_file")
+        tolerance_days = st.slider("📅 日付のずれの許容日数", 0, 14, DEFAULT_TOLERANCE_DAYS, key="reconcile_tolerance")
+        
+        if statement_file is not None and st.button("🔎 照合する", use_container_width=True, key="reconcile_run"):
+            try:
+                statement = read_statement(statement_file, statement_file.name)
+                st.session_state.reconcile_result = reconcile(df, statement, tolerance_days=tolerance_days)
+            except Exception as e:
+                st.error(f"⚠️ 照合中にエラーが発生しました: {e}")
+        
+        if 'reconcile_result' in st.session_state:
+            reconciled = st.session_state.reconcile_result
+            final_diff = reconciled.balance['差額'].iloc[-1] if len(reconciled.balance) > 0 else 0
+            
+            rec_col1, rec_col2, rec_col3, rec_col4 = st.columns(4)
+            with rec_col1:
+                st.metric("✅ 照合済み", f"{reconciled.matched['照合ID'].nunique():,}件")
+            with rec_col2:
+                st.metric("🏦 通帳のみ", f"{len(reconciled.statement_only):,}件")
+            with rec_col3:
+                st.metric("📒 台帳のみ", f"{len(reconciled.ledger_only):,}件")
+            with rec_col4:
+                st.metric("⚖️ 残高の差額", f"¥{final_diff:,.0f}")
+            
+            date_format = {"format": "YYYY-MM-DD"}
+            tab_statement, tab_ledger, tab_balance, tab_matched = st.tabs(
+                ["🏦 通帳のみ", "📒 台帳のみ", "⚖️ 残高の推移", "✅ 照合済み"]
+            )
+            with tab_statement:
+                st.dataframe(reconciled.statement_only, use_container_width=True, hide_index=True,
+                             column_config={"日付": st.column_config.DateColumn("📅 日付", **date_format)})
+            with tab_ledger:
+                st.dataframe(reconciled.ledger_only, use_container_width=True, hide_index=True,
+                             column_config={"日付": st.column_config.DateColumn("📅 日付", **date_format)})
+            with tab_balance:
+                # 差額が変わった日だけ表示（ずれ始めた日を探す）
+                balance = reconciled.balance
+                changed = balance[balance['差額'].diff().fillna(balance['差額']) != 0]
+                st.dataframe(changed, use_container_width=True, hide_index=True,
+                             column_config={"日付": st.column_config.DateColumn("📅 日付", **date_format)})
+            with tab_matched:
+                st.dataframe(reconciled.matched, use_container_width=True, hide_index=True)
+
 # フッター
 st.markdown("""
 <div style="text-align: center; padding: 40px 0 20px 0; color: #666; font-size: 0.9rem;">
     <p>部活動 会計管理システム v5.0 | ☁️ Google Sheets連携版</p>
 </div>
 """, unsafe_allow_html=True)
+
+finish_profile(profiler)